@@ -3,89 +3,229 @@
 #AI Usage Notice: I primarily used UMGPT, Google's AI Overview, and the help of me teammates, as well as some of Google Colab's debugging features for helping explain errors I was getting.
 #I used these tools primarily for debugging hints, tips, and for explanations on formatting for coding concepts I needed refreshers on.
 from pathlib import Path
+import argparse
+import json
 import sqlite3
-import matplotlib.pyplot as plt
+import sys
 import os
 import shutil
 import re
 import requests
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def loadTable(conn, curr):
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.changes import UNCHANGED, UPDATED, ChangeTracker
+from pipeline.db import connect
+from pipeline.dims import DimResolver
+from pipeline.http_cache import cached_get, shared_cache
+from pipeline.metrics import recorded, span
+from pipeline.progress import Progress
+from pipeline.query_cache import cached_rows
+from pipeline.render import Chart, render_all, report
 
-    curr.execute("CREATE TABLE IF NOT EXISTS Beans (id INTEGER PRIMARY KEY, name TEXT, groupName TEXT, sugarFree BOOLEAN)")
+BASE_URL = "https://jellybellywikiapi.onrender.com/api/Beans"
+BATCH = 25
+PAGE_SIZE = 25
+WORKERS = 8
+FIRST_ID = 1
+LAST_ID = 114
+TIMEOUT = 30
 
-    base_url = "https://jellybellywikiapi.onrender.com/api/Beans"
-    list1 = []
-    breaker = 0
-    for i in range(0, 115):
-        if breaker >= 25:
+def getMeta(conn, key, default):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+def makeSession(workers=WORKERS):
+    # keep-alive pool big enough for the id fallback, retrying throttles/5xx
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_maxsize=max(workers, 1), max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetchPaged(session, offset, count, baseUrl=BASE_URL):
+    # list endpoint: ?pageIndex (1-based) & pageSize -> {"items": [...], "totalPages": n}
+    beans = []
+    page = offset // PAGE_SIZE + 1
+    skip = offset % PAGE_SIZE
+    while len(beans) < count:
+        r = cached_get(f"{baseUrl}?pageIndex={page}&pageSize={PAGE_SIZE}", session=session, timeout=TIMEOUT)
+        r.raise_for_status()
+        with span("parse.json"):
+            data = r.json()
+        items = data["items"] if isinstance(data, dict) else data
+        beans.extend(items[skip:])
+        skip = 0
+        if not isinstance(data, dict) or not items or page >= data.get("totalPages", page):
             break
-        bean = requests.get(f"{base_url}/{i}")
-        working = bean.json()
-        #    print(working)
-        #    print(f"BEAN ITEM: {working.get('beanId')}")
-        #    print(working.get('beanId'))
-        #    print(working.get('flavorName'))
-        #    print(working.get('groupName'))
-        #    print(working.get('sugarFree'))
-        items = working.get('groupName') or []
-        name = ", ".join(items)
-        name = name.rstrip()
-        #print(name)
-
-        curr.execute("INSERT OR REPLACE INTO Beans (id, name, groupName, sugarFree) VALUES (?, ?, ?, ?)", (working.get('beanId'), working.get('flavorName'), name, working.get('sugarFree')))
-        breaker += 1
-    conn.commit()
+        page += 1
+    beans = beans[:count]
+    return beans, len(beans)
+
+def fetchBean(session, beanId, baseUrl=BASE_URL):
+    r = cached_get(f"{baseUrl}/{beanId}", session=session, timeout=TIMEOUT)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    with span("parse.json"):
+        return r.json()
+
+def fetchById(session, offset, count, workers=WORKERS, baseUrl=BASE_URL):
+    # fallback when there is no paged list: probe ids on a thread pool
+    ids = range(FIRST_ID + offset, min(FIRST_ID + offset + count, LAST_ID + 1))
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        beans = list(pool.map(lambda i: fetchBean(session, i, baseUrl), ids))
+    return [b for b in beans if b], len(ids)
+
+def fetchBatch(session, offset, batch, workers=WORKERS, baseUrl=BASE_URL):
+    try:
+        return fetchPaged(session, offset, batch, baseUrl)
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return fetchById(session, offset, batch, workers, baseUrl)
+
+def beanPayload(working):
+    # what a Beans row (and its bean_group rows) stores; content_hash covers this
+    return {"name": working.get('flavorName'), "groups": working.get('groupName') or [], "sugarFree": working.get('sugarFree')}
+
+def writeBeans(conn, beans, tracker, meta=None):
+    # only new and changed beans are written, as UPSERTs; a changed bean drops
+    # the bean_group rows for groups it is no longer in
+    groupIds = DimResolver(conn, "bean_group_dim", "group_name", "group_id")
+    with BulkWriter(conn, max(len(beans), 1)) as writer:
+        for working in beans:
+            beanId = working.get('beanId')
+            status, digest = tracker.classify(beanId, beanPayload(working))
+            if status == UNCHANGED:
+                continue
+            items = working.get('groupName') or []
+            name = ", ".join(items)
+            name = name.rstrip()
+            writer.add("INSERT INTO Beans (id, name, groupName, sugarFree, content_hash) VALUES (?, ?, ?, ?, ?) "
+                       "ON CONFLICT(id) DO UPDATE SET name = excluded.name, groupName = excluded.groupName, "
+                       "sugarFree = excluded.sugarFree, content_hash = excluded.content_hash",
+                       (beanId, working.get('flavorName'), name, working.get('sugarFree'), digest))
+            groups = [groupIds(group.strip()) for group in items if group.strip()]
+            if status == UPDATED:
+                writer.add("DELETE FROM bean_group WHERE bean_id = ? AND group_id NOT IN (SELECT value FROM json_each(?))", (beanId, json.dumps(groups)))
+            for groupId in groups:
+                writer.add("INSERT OR IGNORE INTO bean_group (bean_id, group_id) VALUES (?, ?)", (beanId, groupId))
+        if meta:
+            writer.set_meta(*meta)
+
+def loadTable(conn, curr, baseUrl=BASE_URL, batch=BATCH, workers=WORKERS):
+
+    # the Beans table is created by the shared migrations (pipeline/migrations.py)
+    offset = int(getMeta(conn, "bean_offset", "0"))
+
+    with makeSession(workers) as session:
+        beans, used = fetchBatch(session, offset, batch, workers, baseUrl)
+
+    # one executemany per statement plus the cursor, in a single transaction
+    tracker = ChangeTracker(conn, "Beans", "id")
+    writeBeans(conn, beans, tracker, ("bean_offset", offset + used))
+
+    print(f"Loaded {len(beans)} beans ({tracker.summary()}). Next offset = {offset + used}.")
+    return len(beans)
+
+def loadAll(conn, curr, baseUrl=BASE_URL, batch=BATCH, workers=WORKERS):
+    # --full: batch after batch until the bean_offset cursor stops moving; a
+    # batch of 404s (gaps in the id range) still moves it, the end does not
+    progress = Progress("beans")
+    total = 0
+    while True:
+        before = getMeta(conn, "bean_offset", "0")
+        total += loadTable(conn, curr, baseUrl, batch, workers)
+        after = getMeta(conn, "bean_offset", "0")
+        if after == before:
+            break
+        progress.update(int(after) - int(before))
+    progress.finish()
+    return total
+
+def refreshTable(conn, curr, baseUrl=BASE_URL, batch=BATCH, workers=WORKERS):
+    # --refresh: re-read every bean from offset 0 and rewrite only the new and
+    # changed ones; bean_offset is left where it was
+    tracker = ChangeTracker(conn, "Beans", "id")
+    progress = Progress("beans refresh")
+    offset = 0
+    with makeSession(workers) as session:
+        while True:
+            beans, used = fetchBatch(session, offset, batch, workers, baseUrl)
+            if not used:
+                break
+            writeBeans(conn, beans, tracker)
+            progress.update(used)
+            offset += used
+    progress.finish()
+    print(f"Refreshed beans: {tracker.summary()}.")
+    return tracker.counts
+
+def groupSugarCounts(conn, limit=5):
+    # (group, sugar-free count, non-sugar-free count) for the `limit` groups
+    # that appear last in the catalog, oldest first -- the chart's selection
+    rows = cached_rows(conn, """
+        SELECT g.group_name,
+               SUM(b.sugarFree = 1) AS sugar_free,
+               SUM(b.sugarFree = 0) AS not_sugar_free
+        FROM bean_group bg
+        JOIN Beans b ON b.id = bg.bean_id
+        JOIN bean_group_dim g ON g.group_id = bg.group_id
+        GROUP BY bg.group_id
+        ORDER BY MIN(bg.bean_id) DESC, bg.group_id DESC
+        LIMIT ?
+    """, (limit,))
+    return rows[::-1]
+
+def drawBeans(fig, counts):
+    shortCat = [name for name, _, _ in counts]
+    shortSugar = [sugar for _, sugar, _ in counts]
+    shortNonSugar = [nonSugar for _, _, nonSugar in counts]
+
+    ax = fig.add_subplot()
+    ax.set_title("Sugarfree/Non-SugarFree Beans by Group Name")
+    ax.bar(shortCat, shortSugar, color="pink")
+    ax.bar(shortCat, shortNonSugar, bottom=shortSugar, color="green")
+    ax.set_xlabel("Group Names")
+    ax.set_ylabel("Counts")
+    ax.tick_params(axis="x", labelrotation=75)
+    fig.tight_layout()
+
+def charts(conn):
+    counts = [list(row) for row in groupSugarCounts(conn, 5)]
+    return [Chart(GRAPH_PATH, drawBeans, counts, figsize=(15, 6))]
 
 def beansGraph(conn, curr):
-    beans = list(curr.execute("SELECT * FROM Beans"))
-    labels = {}
-    for bean in beans:
-        #print(bean)
-        groups = bean[2].split(",")
-        for name in groups:
-            labels[name] = {"True": 0, "False": 0}
-
-    for bean1 in beans:
-        for key, values in labels.items():
-            names = bean1[2].split(",")
-            for name in names:
-                if key in name or name in key:
-                    if bean1[3] == 0:
-                        labels[key]["False"] += 1
-                    elif bean1[3] == 1:
-                        labels[key]["True"] += 1
-
-    #print(f"labels: {labels}")
-
-    sugar = []
-    nonSugar = []
-    for key, values in labels.items():
-        sugar.append(values["True"])
-        nonSugar.append(values["False"])
-
-    #print(sugar)
-    #print(nonSugar)
-    shortCat = list(labels.keys())
-    shortCat = shortCat[-5:]
-    shortSugar = sugar[-5:]
-    shortNonSugar = nonSugar[-5:]
-
-    plt.figure(figsize=(15, 6))
-
-    plt.title("Sugarfree/Non-SugarFree Beans by Group Name")
-    plt.bar(shortCat, shortSugar, color="pink")
-    plt.bar(shortCat, shortNonSugar, bottom=shortSugar, color="green")
-    plt.xlabel("Group Names")
-    plt.ylabel("Counts")
-    plt.xticks(shortCat, rotation=75) 
-    plt.show()
+    # saved headlessly instead of plt.show(), which blocks without a display
+    report(render_all(charts(conn)))
 
 #
-DB_PATH = Path(__file__).resolve().parents[1] / "GamerSoups_final_project.sqlite"
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 #filename = "GamerSoups_final_project.sqlite"
-conn = sqlite3.connect(DB_PATH)
-curr = conn.cursor()
-loadTable(conn, curr)
-beansGraph(conn, curr)
\ No newline at end of file
+GRAPH_PATH = Path(__file__).resolve().parent / "beans_sugar_free_by_group.png"
+@recorded("beans")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the next batch of Jelly Belly beans and chart them.")
+    parser.add_argument("--full", action="store_true", help="load every remaining bean, not just one batch")
+    parser.add_argument("--commit-every", type=int, default=BATCH, help="beans per request batch and transaction")
+    parser.add_argument("--refresh", action="store_true", help="re-read every bean and rewrite only the ones that changed")
+    args = parser.parse_args(argv)
+
+    conn = connect(DB_PATH)
+    curr = conn.cursor()
+    if args.refresh:
+        shared_cache().revalidate = True
+        refreshTable(conn, curr, batch=args.commit_every)
+    elif args.full:
+        loadAll(conn, curr, batch=args.commit_every)
+    else:
+        loadTable(conn, curr, batch=args.commit_every)
+    beansGraph(conn, curr)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""Sugar-free counts per bean group: the old nested Python loops over every
+Beans row vs groupSugarCounts' single GROUP BY over the bean_group bridge.
+
+Synthetic catalogs grow the number of groups with the number of beans (one
+group per 100 beans), which is what makes the old loops blow up.
+
+    python bench/bench_bean_groups.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# time the queries themselves, not pipeline/query_cache.py
+os.environ["QUERY_CACHE"] = "0"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "LooLu Wiltse SI 201 Final Project Submission"))
+
+import SI201FinalProjectAttempt as beans
+from pipeline.db import connect
+
+
+def fill(conn: sqlite3.Connection, n_beans: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    n_groups = max(7, n_beans // 100)
+    groups = [f"Group {g} Flavors" for g in range(n_groups)]
+    bean_rows, bridge = [], []
+    for bean_id in range(1, n_beans + 1):
+        mine = sorted({rng.randrange(n_groups) for _ in range(rng.choice((1, 1, 2)))})
+        bean_rows.append((bean_id, f"Flavor {bean_id}", ", ".join(groups[g] for g in mine), rng.random() < 0.2))
+        bridge.extend((bean_id, g + 1) for g in mine)
+    with conn:
+        conn.executemany("INSERT INTO bean_group_dim(group_id, group_name) VALUES (?, ?)",
+                         [(i + 1, name) for i, name in enumerate(groups)])
+        conn.executemany("INSERT INTO Beans(id, name, groupName, sugarFree) VALUES (?, ?, ?, ?)", bean_rows)
+        conn.executemany("INSERT INTO bean_group(bean_id, group_id) VALUES (?, ?)", bridge)
+    conn.execute("ANALYZE")
+
+
+def old_counts(conn: sqlite3.Connection) -> dict:
+    # the previous beansGraph counting, without the plot
+    rows = list(conn.execute("SELECT * FROM Beans"))
+    labels = {}
+    for bean in rows:
+        for name in bean[2].split(","):
+            labels[name] = {"True": 0, "False": 0}
+    for bean1 in rows:
+        for key in labels:
+            for name in bean1[2].split(","):
+                if key in name or name in key:
+                    if bean1[3] == 0:
+                        labels[key]["False"] += 1
+                    elif bean1[3] == 1:
+                        labels[key]["True"] += 1
+    return labels
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--old-max", type=int, default=10000, help="skip the old loops above this many beans")
+    args = parser.parse_args(argv)
+
+    print(f"{'beans':>9} {'groups':>7} {'old loops':>10} {'GROUP BY':>10}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = connect(Path(tmp) / "beans.sqlite")
+            fill(conn, n)
+            n_groups = conn.execute("SELECT COUNT(*) FROM bean_group_dim").fetchone()[0]
+            old = f"{timed(old_counts, conn):>9.2f}s" if n <= args.old_max else f"{'-':>10}"
+            new = timed(beans.groupSugarCounts, conn, n_groups)
+            conn.close()
+        print(f"{n:>9} {n_groups:>7} {old} {new:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Jelly Belly loading: the old one-request-per-id loop vs the paged list
+and the pooled per-id fallback, against a local stub with fake latency.
+
+Each mode loads every bean (repeated --batch sized runs resuming from the
+bean_offset cursor) into a fresh database.
+
+    python bench/bench_beans.py --beans 114 --latency 0.05
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "LooLu Wiltse SI 201 Final Project Submission"))
+
+import SI201FinalProjectAttempt as beans
+from pipeline.db import connect
+from stubs import StubServer, fresh_http_cache, jellybelly_route
+
+
+def old_loop(conn: sqlite3.Connection, base_url: str, n_beans: int) -> int:
+    # the original loadTable, minus its 25-per-run cap: no session, no timeout
+    curr = conn.cursor()
+    for i in range(1, n_beans + 1):
+        working = requests.get(f"{base_url}/{i}").json()
+        name = ", ".join(working.get('groupName') or []).rstrip()
+        curr.execute("INSERT OR REPLACE INTO Beans (id, name, groupName, sugarFree) VALUES (?, ?, ?, ?)",
+                     (working.get('beanId'), working.get('flavorName'), name, working.get('sugarFree')))
+    conn.commit()
+    return n_beans
+
+
+def new_loader(conn: sqlite3.Connection, base_url: str, n_beans: int, batch: int, workers: int) -> int:
+    total = 0
+    while True:
+        inserted = beans.loadTable(conn, conn.cursor(), base_url, batch, workers)
+        total += inserted
+        if inserted == 0:
+            return total
+
+
+def run(mode: str, args) -> tuple:
+    paged = mode != "per-id pool"
+    with StubServer(jellybelly_route(args.beans, paged=paged), latency=args.latency) as stub, \
+            tempfile.TemporaryDirectory() as tmp, fresh_http_cache(tmp):
+        base_url = f"{stub.url}/api/Beans"
+        conn = connect(Path(tmp) / "bench.sqlite")
+        start = time.perf_counter()
+        if mode == "old loop":
+            old_loop(conn, base_url, args.beans)
+        else:
+            new_loader(conn, base_url, args.beans, args.batch, args.workers)
+        elapsed = time.perf_counter() - start
+        stored = conn.execute("SELECT COUNT(*) FROM Beans").fetchone()[0]
+        conn.close()
+        return stored, stub.requests, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--beans", type=int, default=114)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch", type=int, default=beans.BATCH)
+    parser.add_argument("--workers", type=int, default=beans.WORKERS)
+    args = parser.parse_args(argv)
+    beans.LAST_ID = args.beans
+
+    print(f"{'mode':<12} {'beans':>6} {'requests':>9} {'seconds':>8}")
+    for mode in ("old loop", "paged", "per-id pool"):
+        stored, n_requests, elapsed = run(mode, args)
+        print(f"{mode:<12} {stored:>6} {n_requests:>9} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
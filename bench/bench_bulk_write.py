@@ -0,0 +1,84 @@
+"""Per-entity commits (the old loader pattern) vs BulkWriter executemany batches.
+
+Inserts synthetic pokemon plus their six pokemon_stat rows into a fresh
+on-disk database, so commit/fsync cost is included.
+
+    python bench/bench_bulk_write.py --rows 100000 --flush-rows 500
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "jason" / "scripts"))
+
+from pipeline.bulk import BulkWriter
+from pipeline.db import connect
+from stubs import STAT_NAMES
+
+POKEMON_SQL = "INSERT OR IGNORE INTO pokemon(pokemon_id, name, height, weight, base_experience) VALUES (?, ?, ?, ?, ?)"
+STAT_SQL = "INSERT OR IGNORE INTO pokemon_stat(pokemon_id, stat_id, base_stat, effort) VALUES (?, ?, ?, ?)"
+
+
+def synthetic(n_pokemon: int):
+    for pid in range(1, n_pokemon + 1):
+        pokemon = (pid, f"pokemon-{pid}", pid % 20, pid % 900, pid % 200)
+        stats = [(pid, sid, 30 + (pid * sid) % 100, sid % 3) for sid in range(1, len(STAT_NAMES) + 1)]
+        yield pokemon, stats
+
+
+def fresh_db(path: Path) -> sqlite3.Connection:
+    conn = connect(path)
+    conn.executemany("INSERT INTO stat_dim(stat_name) VALUES (?)", [(n,) for n in STAT_NAMES])
+    conn.commit()
+    return conn
+
+
+def per_entity_commit(conn: sqlite3.Connection, n_pokemon: int) -> None:
+    for pokemon, stats in synthetic(n_pokemon):
+        conn.execute(POKEMON_SQL, pokemon)
+        for row in stats:
+            conn.execute(STAT_SQL, row)
+        conn.commit()
+    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('poke_next_id', ?)", (str(n_pokemon + 1),))
+    conn.commit()
+
+
+def bulk(conn: sqlite3.Connection, n_pokemon: int, flush_rows: int) -> None:
+    with BulkWriter(conn, flush_rows) as writer:
+        for pokemon, stats in synthetic(n_pokemon):
+            writer.add(POKEMON_SQL, pokemon)
+            for row in stats:
+                writer.add(STAT_SQL, row)
+            writer.checkpoint("poke_next_id", pokemon[0] + 1)
+
+
+def timed(label: str, fn) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = fresh_db(Path(tmp) / "bench.sqlite")
+        start = time.perf_counter()
+        fn(conn)
+        elapsed = time.perf_counter() - start
+        written = conn.execute("SELECT (SELECT COUNT(*) FROM pokemon) + (SELECT COUNT(*) FROM pokemon_stat)").fetchone()[0]
+        cursor = conn.execute("SELECT value FROM meta WHERE key = 'poke_next_id'").fetchone()[0]
+        conn.close()
+    print(f"{label:<22} {written:>8} rows  {elapsed:>8.2f}s  {written / elapsed:>10.0f} rows/s  cursor={cursor}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="total pokemon + pokemon_stat rows")
+    parser.add_argument("--flush-rows", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    n_pokemon = max(args.rows // (1 + len(STAT_NAMES)), 1)
+    timed("per-entity commit", lambda c: per_entity_commit(c, n_pokemon))
+    timed(f"bulk (flush={args.flush_rows})", lambda c: bulk(c, n_pokemon, args.flush_rows))
+
+
+if __name__ == "__main__":
+    main()
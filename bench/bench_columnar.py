@@ -0,0 +1,110 @@
+"""Time each report on the SQL path against pipeline/columnar.py on synthetic DBs.
+
+Sizes are pokemon_stat rows (the largest fact table). The other tables grow in
+proportion (see synth.py). SQL times are the full recompute
+(materialized=False), which is the same work the columnar backend does.
+Materialized aggregates are a separate trade-off.
+
+    python bench/bench_columnar.py                          # 10k and 1M rows
+    python bench/bench_columnar.py --rows 10000,1000000,10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# time the queries themselves, not pipeline/query_cache.py
+os.environ["QUERY_CACHE"] = "0"
+sys.path.insert(0, str(ROOT))
+
+import synth
+from pipeline.paths import add_script_paths
+
+add_script_paths()
+import analyze_and_visualize_dnd as dnd
+import calc_outputs
+from pipeline.columnar import ColumnarStore
+from pipeline.db import connect_readonly
+
+ROWS_PER_SCALE = synth.BASE_POKEMON * len(synth.STAT_NAMES)
+
+
+def reports(store: ColumnarStore):
+    """(name, sql fn, columnar fn) for every report both backends implement."""
+    return [
+        ("pokemon_avg_total_stats_by_type",
+         lambda c: calc_outputs.pokemon_avg_total_stats_by_type(c, materialized=False),
+         store.pokemon_avg_total_stats_by_type),
+        ("pokemon_weight_vs_total_stats",
+         lambda c: calc_outputs.pokemon_weight_vs_total_stats(c, materialized=False),
+         store.pokemon_weight_vs_total_stats),
+        ("fruit_avg_nutrients_by_family",
+         lambda c: calc_outputs.fruit_avg_nutrients_by_family(c, materialized=False),
+         store.fruit_avg_nutrients_by_family),
+        ("fruit_top_sugar", lambda c: calc_outputs.fruit_top_sugar(c, 10), lambda: store.fruit_top_sugar(10)),
+        ("website_type_counts", calc_outputs.website_type_counts, store.website_type_counts),
+        ("spells_by_school_counts", dnd.spells_by_school_counts, store.spells_by_school_counts),
+        ("grouped_counts_by_school_level_bucket", dnd.grouped_counts_by_school_level_bucket,
+         store.grouped_counts_by_school_level_bucket),
+    ]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "synth.sqlite"
+        start = time.perf_counter()
+        synth.build(path, rows / ROWS_PER_SCALE)
+        print(f"\n== {rows:,} pokemon_stat rows (built in {time.perf_counter() - start:.1f}s)")
+        conn = connect_readonly(path)
+
+        start = time.perf_counter()
+        store = ColumnarStore.load(conn)
+        load = time.perf_counter() - start
+        print(f"columnar load: {load * 1000:.0f}ms for {store.loaded_rows:,} rows")
+
+        problems = calc_outputs.check_columnar(conn, store)
+        for name in ("spells_by_school_counts", "grouped_counts_by_school_level_bucket"):
+            if getattr(dnd, name)(conn) != getattr(store, name)():
+                problems.append(f"{name}: results differ")
+        for p in problems:
+            print("MISMATCH", p)
+
+        print(f"{'report':<40} {'sql':>9} {'columnar':>9} {'speedup':>8}")
+        total_sql = total_np = 0.0
+        for name, sql_fn, columnar_fn in reports(store):
+            t_sql = best_of(lambda: list(sql_fn(conn)), repeat)
+            t_np = best_of(columnar_fn, repeat)
+            total_sql += t_sql
+            total_np += t_np
+            print(f"{name:<40} {t_sql * 1000:>7.1f}ms {t_np * 1000:>7.1f}ms {t_sql / t_np:>7.1f}x")
+        print(f"{'all reports':<40} {total_sql * 1000:>7.1f}ms {total_np * 1000:>7.1f}ms "
+              f"(+{load * 1000:.0f}ms load)")
+        conn.close()
+        if problems:
+            sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", default="10000,1000000",
+                        help="comma-separated pokemon_stat row counts (default: 10000,1000000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    for rows in (int(r) for r in args.rows.split(",")):
+        run(rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
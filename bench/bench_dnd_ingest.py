@@ -0,0 +1,86 @@
+"""Serial vs thread-pool D&D spell ingest against a faulty local dnd5eapi mock.
+
+A fraction of detail requests fail with 429 (+ Retry-After) or 503. Reports
+throughput and p50/p95/max per-spell latency, retries included.
+
+    python bench/bench_dnd_ingest.py --spells 200 --faults 0.05 --workers 1 8
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+sys.path.insert(0, str(ROOT / "corey" / "code"))
+
+import dnd5e_api
+import ingest_to_db_dnd
+from stubs import StubServer, dnd5e_route, fresh_http_cache
+
+
+def run_once(args, workers: int) -> None:
+    route = dnd5e_route(args.spells, args.faults, args.retry_after)
+    with StubServer(route, latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp, \
+            fresh_http_cache(tmp):
+        dnd5e_api.API_HOST = stub.url
+        dnd5e_api.API_ROOT_2014 = f"{stub.url}/api/2014"
+        conn = ingest_to_db_dnd.connect_db(Path(tmp) / "bench.sqlite")
+        ingest_to_db_dnd.init_schema(conn)
+
+        latencies = []
+        start = time.perf_counter()
+        with requests.Session() as session:
+            session.mount("http://", HTTPAdapter(pool_maxsize=max(workers, 1)))
+            if workers > 1:
+                limiter = dnd5e_api.TokenBucket(args.rate)
+                inserted = ingest_to_db_dnd.ingest_spells_concurrent(
+                    conn, session, args.spells, workers, limiter, latencies)
+            else:
+                real_fetch = ingest_to_db_dnd.fetch_spell_detail_trimmed
+
+                def timed_fetch(session, url, limiter=None):
+                    t = time.perf_counter()
+                    detail = real_fetch(session, url, limiter)
+                    latencies.append(time.perf_counter() - t)
+                    return detail
+
+                ingest_to_db_dnd.fetch_spell_detail_trimmed = timed_fetch
+                try:
+                    inserted = ingest_to_db_dnd.ingest_spells_capped(conn, session, args.spells)
+                finally:
+                    ingest_to_db_dnd.fetch_spell_detail_trimmed = real_fetch
+        elapsed = time.perf_counter() - start
+        conn.close()
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+        print(f"{workers:>7}  {inserted:>8}  {stub.requests:>8}  {elapsed:>7.2f}s  {inserted / elapsed:>8.1f}/s  "
+              f"p50={statistics.median(latencies):.3f}s  p95={p95:.3f}s  max={latencies[-1]:.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--spells", type=int, default=200)
+    parser.add_argument("--faults", type=float, default=0.05, help="fraction of detail requests that fail")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rate", type=float, default=200.0, help="token bucket requests/sec")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args(argv)
+
+    print(f"{'workers':>7}  {'inserted':>8}  {'requests':>8}  {'elapsed':>8}  {'rate':>10}")
+    for workers in args.workers:
+        run_once(args, workers)
+
+
+if __name__ == "__main__":
+    main()
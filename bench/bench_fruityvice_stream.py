@@ -0,0 +1,118 @@
+"""Fruityvice /api/fruit/all: r.json() on the whole array vs pipeline.json_stream.
+
+A local stub serves a synthetic fruit array of --mb megabytes. Streaming reads
+one 25-fruit batch at the start, middle and end of the array, checking each
+against the fruits the stub generated. The old r.json() path is timed on the
+smaller --baseline-mb array, since it holds every fruit as a dict at once.
+Last, load_fruityvice.main runs twice against the stub, to check the
+fruit_offset cursor moves on by one batch per run.
+
+    python bench/bench_fruityvice_stream.py --mb 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+
+from pipeline.http_cache import HttpCache
+from pipeline.json_stream import iter_array
+from pipeline.paths import add_script_paths
+from stubs import StubServer, fake_fruit, fruityvice_body, fruityvice_route
+
+add_script_paths()
+import load_fruityvice
+
+BYTES_PER_FRUIT = len(fruityvice_body(1000)) / 1000
+BATCH = load_fruityvice.BATCH
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def old_batch(url: str, offset: int) -> list:
+    return requests.get(url, timeout=600).json()[offset:offset + BATCH]
+
+
+def streamed_batch(cache: HttpCache, url: str, offset: int) -> tuple:
+    body = cache.stream(url)
+    batch = []
+    for fruit in iter_array(body, skip=offset):
+        batch.append(fruit)
+        if len(batch) == BATCH:
+            break
+    body.close()
+    return batch, cache.bytes_downloaded
+
+
+def report(label: str, n_fruits: int, offset: int, batch: list, elapsed: float, peak: int, read=None) -> bool:
+    ok = batch == [fake_fruit(i) for i in range(offset + 1, min(offset + BATCH, n_fruits) + 1)]
+    read = "" if read is None else f"  read {read / 2**20:7.1f} MiB"
+    print(f"{label:<10} offset {offset:>9,}  {elapsed:>6.2f}s  peak {peak / 2**20:>7.1f} MiB{read}"
+          f"  {'ok' if ok else 'WRONG BATCH'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=300, help="size of the streamed array")
+    parser.add_argument("--baseline-mb", type=float, default=20, help="size of the array given to r.json()")
+    args = parser.parse_args(argv)
+
+    ok = True
+    for mb, modes in ((args.baseline_mb, ("r.json()", "stream")), (args.mb, ("stream",))):
+        n_fruits = int(mb * 2**20 / BYTES_PER_FRUIT)
+        body = fruityvice_body(n_fruits)
+        print(f"\n{n_fruits:,} fruits, {len(body) / 2**20:.0f} MiB")
+        with StubServer(fruityvice_route(body)) as stub:
+            url = f"{stub.url}/api/fruit/all"
+            for offset in (0, n_fruits // 2, n_fruits - BATCH):
+                for mode in modes:
+                    if mode == "r.json()":
+                        batch, elapsed, peak = measure(lambda: old_batch(url, offset))
+                        ok &= report(mode, n_fruits, offset, batch, elapsed, peak)
+                    else:
+                        cache = HttpCache(Path(CACHE_DIR.name) / f"stream-{offset}.sqlite")
+                        (batch, read), elapsed, peak = measure(lambda: streamed_batch(cache, url, offset))
+                        cache.close()
+                        ok &= report(mode, n_fruits, offset, batch, elapsed, peak, read)
+        del body
+
+    # the loader itself, resuming from its cursor
+    with StubServer(fruityvice_route(fruityvice_body(BATCH * 3))) as stub, \
+            tempfile.TemporaryDirectory() as tmp:
+        load_fruityvice.URL = f"{stub.url}/api/fruit/all"
+        load_fruityvice.DB_PATH = Path(tmp) / "bench.sqlite"
+        print()
+        load_fruityvice.main([])
+        load_fruityvice.main([])
+        conn = load_fruityvice.connect(load_fruityvice.DB_PATH)
+        ids = [r[0] for r in conn.execute("SELECT fruit_id FROM fruits ORDER BY fruit_id")]
+        offset = load_fruityvice.get_meta(conn, "fruit_offset", "0")
+        conn.close()
+        loader_ok = ids == list(range(1, 2 * BATCH + 1)) and offset == str(2 * BATCH)
+        print(f"loader: {len(ids)} fruits after two runs, fruit_offset = {offset}  {'ok' if loader_ok else 'WRONG'}")
+        ok &= loader_ok
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Every loader's --full mode against local stubs: one invocation each drains
+its whole source into a single fresh database.
+
+The PokeAPI stub has a hole in its id range (1..N, then 10001..10050, like
+the real API), plus one listed id that 404s and one that fails with a 500
+the first time. The first run has to skip the 404 as a gap and stop at the
+500 with the cursor on it. A second run resumes there and finishes.
+
+    python bench/bench_full_sync.py --pokemon 2000 --fruits 5000 --web 3000 --spells 1000 --beans 2000
+"""
+import argparse
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+
+from pipeline.paths import add_script_paths
+from stubs import (StubServer, dnd5e_route, fruityvice_body, fruityvice_route, jellybelly_route,
+                   pokeapi_route, pokedex_html)
+
+add_script_paths()
+import SI201FinalProjectAttempt as beans
+import dnd5e_api
+import ingest_to_db_dnd
+import load_fruityvice
+import load_pokeapi
+import load_pokemondb_website
+
+EXTRA_IDS = range(10001, 10051)
+
+
+def fail_once(route, path_suffix: str):
+    failed = []
+
+    def wrapped(path, headers):
+        if path.endswith(path_suffix) and not failed:
+            failed.append(path)
+            return 500, {}, b""
+        return route(path, headers)
+    return wrapped
+
+
+def count(conn: sqlite3.Connection, table: str) -> int:
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pokemon", type=int, default=2000)
+    parser.add_argument("--fruits", type=int, default=5000)
+    parser.add_argument("--web", type=int, default=3000, help="pokedex rows (two forms per dex number)")
+    parser.add_argument("--spells", type=int, default=1000)
+    parser.add_argument("--beans", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    broken, flaky = 7, args.pokemon // 2
+    html = pokedex_html(args.web).encode()
+    with ExitStack() as stack, tempfile.TemporaryDirectory() as tmp:
+        poke = stack.enter_context(StubServer(fail_once(
+            pokeapi_route(args.pokemon, EXTRA_IDS, broken_ids=[broken]), f"/pokemon/{flaky}/")))
+        fruit = stack.enter_context(StubServer(fruityvice_route(fruityvice_body(args.fruits))))
+        web = stack.enter_context(StubServer(lambda path, headers: (200, {"Content-Type": "text/html"}, html)))
+        dnd = stack.enter_context(StubServer(dnd5e_route(args.spells)))
+        jelly = stack.enter_context(StubServer(jellybelly_route(args.beans)))
+
+        db = Path(tmp) / "full.sqlite"
+        load_fruityvice.DB_PATH = load_pokemondb_website.DB_PATH = ingest_to_db_dnd.DB_PATH = db
+        load_fruityvice.URL = f"{fruit.url}/api/fruit/all"
+        load_pokemondb_website.URL = f"{web.url}/pokedex/all"
+        dnd5e_api.API_HOST = dnd.url
+        dnd5e_api.API_ROOT_2014 = f"{dnd.url}/api/2014"
+        base = f"{poke.url}/api/v2/pokemon/"
+
+        results, ok = [], True
+
+        def timed(label, fn, table, expected):
+            nonlocal ok
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            conn = sqlite3.connect(db)
+            n = count(conn, table)
+            conn.close()
+            ok &= n == expected
+            results.append((label, n, expected, elapsed))
+
+        conn = load_pokeapi.connect(db)
+        first = load_pokeapi.load_full(conn, workers=args.workers, base=base)
+        stopped_at = load_pokeapi.get_meta(conn, "poke_next_id", "1")
+        conn.close()
+        ok &= first["error"] is not None and stopped_at == str(flaky) and first["gaps"] == [broken]
+        print(f"pokeapi run 1: stopped at {first['error']!r}, cursor = {stopped_at}, gaps = {first['gaps']}")
+
+        def pokeapi_resume():
+            conn = load_pokeapi.connect(db)
+            second = load_pokeapi.load_full(conn, workers=args.workers, base=base)
+            conn.close()
+            assert second["error"] is None and second["next_id"] == EXTRA_IDS[-1] + 1, second
+
+        timed("pokeapi (resumed)", pokeapi_resume, "pokemon", args.pokemon - 1 + len(EXTRA_IDS))
+        timed("fruityvice", lambda: load_fruityvice.main(["--full"]), "fruits", args.fruits)
+        timed("pokemondb", lambda: load_pokemondb_website.main(["--full"]), "web_pokemon", (args.web + 1) // 2)
+        timed("dnd5e", lambda: ingest_to_db_dnd.main(["--full", "--workers", str(args.workers), "--rate", "1000"]),
+              "spells", args.spells)
+
+        def beans_full():
+            conn = beans.connect(db)
+            beans.loadAll(conn, conn.cursor(), f"{jelly.url}/api/Beans", batch=100, workers=args.workers)
+            conn.close()
+
+        timed("beans", beans_full, "Beans", args.beans)
+
+    print(f"\n{'source':<20} {'rows':>8} {'expected':>9} {'seconds':>8} {'rows/s':>8}")
+    for label, n, expected, elapsed in results:
+        print(f"{label:<20} {n:>8,} {expected:>9,} {elapsed:>8.2f} {n / elapsed:>8.0f}")
+    print(f"\npeak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB (stubs included)")
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Network requests and bytes per run with and without the shared HTTP cache.
+
+Simulates repeated incremental runs of a loader that pulls one large JSON
+payload (like Fruityvice's /api/fruit/all) from a local stub that counts
+requests and answers conditional GETs with 304.
+
+The same runs are repeated through HttpCache.stream(), which the Fruityvice
+and pokemondb loaders use: a body read to the end must be stored and then
+revalidated with a 304, and a reader that stops after the first chunk must
+store nothing.
+
+Last, an uncached URL is fetched offline through dnd5e_api's retry loop:
+it must raise OfflineMiss at once, without retrying or touching the stub.
+
+    python bench/bench_http_cache.py --items 5000 --runs 5
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import pipeline.http_cache as http_cache
+from pipeline.http_cache import HttpCache, OfflineMiss
+from pipeline.paths import add_script_paths
+from stubs import StubServer, json_response, with_etag
+
+add_script_paths()
+import dnd5e_api
+
+OFFLINE_MISS_LIMIT_S = 1.0  # the retry loop's first backoff alone is 1s+
+
+
+def fruit_route(n_items: int):
+    payload = [{"id": i, "name": f"fruit-{i}", "family": f"family-{i % 30}",
+                "nutritions": {"sugar": i % 17, "calories": i % 90}} for i in range(n_items)]
+
+    def route(path, headers):
+        return json_response(payload)
+    return route
+
+
+def run(label: str, stub: StubServer, url: str, runs: int, cache: HttpCache | None = None,
+        stream: bool = False) -> tuple:
+    """Returns (requests, body bytes downloaded)."""
+    before = stub.requests
+    nbytes = 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        if cache is None:
+            nbytes += len(requests.get(url, timeout=30).content)
+        else:
+            downloaded = cache.bytes_downloaded
+            if stream:
+                body = b"".join(cache.stream(url, 4096))
+                assert json.loads(body), "streamed body does not parse"
+            else:
+                cache.get(url)
+            nbytes += cache.bytes_downloaded - downloaded
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} requests={stub.requests - before:<4} bytes={nbytes:<10} {elapsed:.3f}s")
+    return stub.requests - before, nbytes
+
+
+def check_stream(stub: StubServer, url: str, runs: int, tmp: Path) -> bool:
+    cache = HttpCache(tmp / "stream.sqlite", ttl=3600)
+    partial = cache.stream(url, 4096)
+    next(partial)
+    partial.close()
+    stored_partial = cache._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    cold = run("stream, cold", stub, url, 1, cache, stream=True)
+    fresh = run("stream, within TTL", stub, url, runs, cache, stream=True)
+    cache.ttl = 0
+    stale = run("stream, revalidate (304)", stub, url, runs, cache, stream=True)
+    ok = stored_partial == 0 and cold[0] == 1 and fresh == (0, 0) and stale == (runs, 0)
+    print(f"{'stream, stopped early':<28} stored={stored_partial}{'' if ok else '  WRONG'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with StubServer(with_etag(fruit_route(args.items))) as stub, tempfile.TemporaryDirectory() as tmp:
+        url = f"{stub.url}/api/fruit/all"
+
+        run("uncached", stub, url, args.runs)
+
+        fresh = HttpCache(Path(tmp) / "fresh.sqlite", ttl=3600)
+        run("cache, cold", stub, url, 1, fresh)
+        run("cache, within TTL", stub, url, args.runs, fresh)
+
+        stale = HttpCache(Path(tmp) / "stale.sqlite", ttl=0)
+        stale.get(url)
+        run("cache, revalidate (304)", stub, url, args.runs, stale)
+
+        offline = HttpCache(Path(tmp) / "stale.sqlite", ttl=0, offline=True)
+        run("cache, offline", stub, url, args.runs, offline)
+
+        ok = check_stream(stub, url, args.runs, Path(tmp))
+        ok &= offline_miss(stub, offline)
+        if not ok:
+            print("FAILED")
+            sys.exit(1)
+
+
+def offline_miss(stub: StubServer, offline: HttpCache) -> bool:
+    http_cache._shared = offline
+    before = stub.requests
+    start = time.perf_counter()
+    try:
+        dnd5e_api.get_json_with_retries(requests.Session(), f"{stub.url}/api/2014/spells/uncached")
+        raised = None
+    except Exception as e:
+        raised = e
+    elapsed = time.perf_counter() - start
+    ok = isinstance(raised, OfflineMiss) and stub.requests == before and elapsed < OFFLINE_MISS_LIMIT_S
+    print(f"{'offline miss (dnd5e retry)':<28} requests={stub.requests - before:<4} "
+          f"raised={type(raised).__name__:<10} {elapsed:.3f}s{'' if ok else '  WRONG'}")
+    return ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Report query timings before and after the report-index migration on a synthetic DB.
+
+    python bench/bench_indexes.py --scale 200     # ~1.2M pokemon_stat rows
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import synth
+from pipeline import index_advisor
+from pipeline.migrations import migrate, register_functions
+
+AGGREGATES_VERSION = 7
+
+
+def time_queries(conn: sqlite3.Connection, repeat: int) -> dict:
+    out = {}
+    for label, fn in index_advisor.query_set():
+        try:
+            list(fn(conn))
+        except sqlite3.OperationalError:
+            continue
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(fn(conn))
+        out[label] = (time.perf_counter() - start) / repeat
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "synth.sqlite"
+        counts = synth.build(path, args.scale, version=AGGREGATES_VERSION)
+        print("rows:", counts)
+        conn = sqlite3.connect(path)
+        register_functions(conn)
+
+        before = time_queries(conn, args.repeat)
+        scans_before = len(index_advisor.run(conn, verbose=False))
+        migrate(conn)
+        after = time_queries(conn, args.repeat)
+        scans_after = len(index_advisor.run(conn, verbose=False))
+        conn.close()
+
+    print(f"\n{'query':<72} {'before':>9} {'after':>9}")
+    for label in before:
+        print(f"{label:<72} {before[label] * 1000:>7.1f}ms {after[label] * 1000:>7.1f}ms")
+    print(f"\nflagged full scans: {scans_before} -> {scans_after}")
+
+
+if __name__ == "__main__":
+    main()
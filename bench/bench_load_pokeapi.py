@@ -0,0 +1,48 @@
+"""Serial vs concurrent PokeAPI loading against a local stub with fake latency.
+
+    python bench/bench_load_pokeapi.py --latency 0.05 --batch 100 --workers 1 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "jason" / "scripts"))
+
+import load_pokeapi
+from pipeline.db import connect
+from stubs import StubServer, fresh_http_cache, pokeapi_route
+
+
+def run_once(base: str, batch: int, workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp, fresh_http_cache(tmp):
+        conn = connect(Path(tmp) / "bench.sqlite")
+        stats = load_pokeapi.load_batch(conn, batch=batch, workers=workers, base=base)
+        stored = conn.execute("SELECT COUNT(*) FROM pokemon").fetchone()[0]
+        conn.close()
+    assert stored == stats["inserted"], (stored, stats)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every stub response")
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args(argv)
+
+    with StubServer(pokeapi_route(args.batch * 2), latency=args.latency) as stub:
+        base = f"{stub.url}/api/v2/pokemon/"
+        print(f"{'workers':>7}  {'inserted':>8}  {'seconds':>8}  {'req/s':>8}")
+        for workers in args.workers:
+            stats = run_once(base, args.batch, workers)
+            print(f"{workers:>7}  {stats['inserted']:>8}  {stats['elapsed']:>8.2f}  {stats['req_per_sec']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Cold-start cost of bringing the schema up to date.
+
+"legacy" replays what the old schema.py + schema_patch*.py scripts did on
+every run: a fresh connection per script, each executescript()-ing its DDL
+and committing (the aggregates rebuild only ran on first install, so it is
+left out). "migrate" is pipeline.db.connect() on a database that is
+already at the latest version (one PRAGMA user_version read).
+
+Before timing, `migrate --to N` is run on an empty database for every N
+and must leave it at exactly version N (the run_metrics record of the
+migrate run itself must not migrate further).
+
+    python bench/bench_migrations.py --scale 20 --repeat 20
+"""
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import synth
+from pipeline.db import connect
+from pipeline.migrations import MIGRATIONS, REBUILD_AGGREGATES
+from pipeline.paths import add_script_paths
+
+add_script_paths()
+import schema
+
+# the last migration that used to be a schema_patch*.py script
+LEGACY_VERSION = 8
+
+
+def legacy(path: Path) -> None:
+    for version, _, script in MIGRATIONS:
+        if version > LEGACY_VERSION:
+            break
+        script = script.replace(REBUILD_AGGREGATES, "")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.executescript(script)
+        conn.commit()
+        conn.close()
+
+
+def migrated(path: Path) -> None:
+    connect(path).close()
+
+
+def check_targets(tmp: Path) -> bool:
+    ok = True
+    for version, _, _ in MIGRATIONS:
+        path = tmp / f"empty-{version}.sqlite"
+        schema.DB_PATH = path
+        schema.main(["--to", str(version)])
+        schema.main(["--list"])
+        conn = sqlite3.connect(path)
+        got = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        if got != version:
+            print(f"migrate --to {version} left the database at version {got}")
+            ok = False
+    return ok
+
+
+def timed(fn, path: Path, repeat: int) -> list:
+    out = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not check_targets(Path(tmp)):
+            print("FAILED")
+            sys.exit(1)
+        path = Path(tmp) / "synth.sqlite"
+        counts = synth.build(path, args.scale)
+        print("rows:", counts)
+        runs = {
+            "legacy": timed(legacy, path, args.repeat),
+            "migrate": timed(migrated, path, args.repeat),
+        }
+
+    print(f"\n{'mode':<8} {'median':>10} {'max':>10}")
+    for mode, samples in runs.items():
+        print(f"{mode:<8} {statistics.median(samples) * 1000:>8.2f}ms {max(samples) * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
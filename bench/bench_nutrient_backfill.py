@@ -0,0 +1,108 @@
+"""Row-at-a-time Python nutrient pivot (the old backfill loop) vs the
+set-based INSERT ... SELECT in backfill_fruityvice_long.py.
+
+Both run against the same synthetic fruityvice_nutrition table. The schema
+stops before the aggregate triggers unless --with-aggregates is given, so the
+numbers measure the pivot itself. The incremental run re-backfills after
+appending 1% more fruits.
+
+    python bench/bench_nutrient_backfill.py --rows 1000000
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "jason" / "scripts"))
+
+import backfill_fruityvice_long as backfill
+from pipeline.migrations import LATEST, migrate
+from synth import FACT_TABLES_VERSION
+
+
+def fresh_db(path: Path, n_fruits: int, version: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    migrate(conn, version)
+    add_fruits(conn, 1, n_fruits)
+    return conn
+
+
+def add_fruits(conn: sqlite3.Connection, first: int, n: int) -> None:
+    rng = random.Random(first)
+    with conn:
+        conn.executemany(
+            "INSERT INTO fruityvice_nutrition(fruit_id, family_id, genus, fruit_order, "
+            "carbohydrates, protein, fat, calories, sugar) VALUES (?, NULL, 'g', 'o', ?, ?, ?, ?, ?)",
+            ((fid, rng.uniform(0, 30), rng.uniform(0, 5), rng.uniform(0, 2), rng.uniform(10, 200),
+              rng.choice([None, rng.uniform(0, 25)]))
+             for fid in range(first, first + n))
+        )
+
+
+def python_loop(conn: sqlite3.Connection) -> int:
+    # the pre-existing implementation: five single-row statements per fruit
+    for n in backfill.NAMES:
+        conn.execute("INSERT OR IGNORE INTO nutrient_dim(nutrient_name) VALUES (?)", (n,))
+    conn.commit()
+    nutrient_ids = {
+        name: conn.execute("SELECT nutrient_id FROM nutrient_dim WHERE nutrient_name = ?", (name,)).fetchone()[0]
+        for name in backfill.NAMES
+    }
+    rows = conn.execute(
+        "SELECT fruit_id, carbohydrates, protein, fat, calories, sugar FROM fruityvice_nutrition"
+    ).fetchall()
+    inserted = 0
+    for fruit_id, *values in rows:
+        for name, val in zip(backfill.NAMES, values):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO fruit_nutrient_long(fruit_id, nutrient_id, nutrient_value) VALUES (?, ?, ?)",
+                (fruit_id, nutrient_ids[name], val)
+            )
+            inserted += cur.rowcount
+    conn.commit()
+    return inserted
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="fruityvice_nutrition rows")
+    parser.add_argument("--with-aggregates", action="store_true",
+                        help="include the family_nutrient_totals triggers")
+    args = parser.parse_args(argv)
+    version = LATEST if args.with_aggregates else FACT_TABLES_VERSION
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = fresh_db(Path(tmp) / "loop.sqlite", args.rows, version)
+        loop_rows, loop_s = timed(python_loop, conn)
+        conn.close()
+
+        conn = fresh_db(Path(tmp) / "set.sqlite", args.rows, version)
+        (set_rows, _), set_s = timed(backfill.backfill, conn, True)
+        extra = max(args.rows // 100, 1)
+        add_fruits(conn, args.rows + 1, extra)
+        (inc_rows, _), inc_s = timed(backfill.backfill, conn, True)
+        conn.close()
+
+    assert loop_rows == set_rows, (loop_rows, set_rows)
+    print(f"{'mode':<22} {'rows':>10} {'seconds':>9} {'rows/s':>12}")
+    for mode, rows, secs in (("python loop", loop_rows, loop_s),
+                             ("set-based", set_rows, set_s),
+                             (f"incremental (+{extra})", inc_rows, inc_s)):
+        print(f"{mode:<22} {rows:>10} {secs:>9.2f} {rows / secs:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""BeautifulSoup parse_rows() vs the streaming iter_rows() on a large pokedex page.
+
+Uses a saved copy of pokemondb.net/pokedex/all when --html is given,
+otherwise a synthetic lookalike with --rows forms. Reports wall time and
+tracemalloc peak (separate runs) for a full parse and for one loader batch,
+first from an in-memory page and then through fetch_rows() from a local
+stub, where only the streaming path should stay flat in memory.
+
+    python bench/bench_pokedex_parse.py --rows 5000 --offset 1000
+"""
+import argparse
+import itertools
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "jason" / "scripts"))
+
+import load_pokemondb_website as web
+import pipeline.http_cache as http_cache
+from pipeline.http_cache import HttpCache
+from stubs import StubServer, pokedex_html, pokedex_route
+
+
+def chunks(html: str, size: int = web.CHUNK_SIZE):
+    for start in range(0, len(html), size):
+        yield html[start:start + size]
+
+
+def measure(label: str, fn) -> list:
+    # time and memory are taken on separate runs; tracemalloc slows parsing a lot
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<30} rows={len(rows):<7} {elapsed:>7.3f}s  peak={peak / 2**20:>8.1f} MiB")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--html", type=Path, help="saved copy of pokedex/all")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--offset", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=web.BATCH)
+    args = parser.parse_args(argv)
+
+    html = args.html.read_text(encoding="utf-8") if args.html else pokedex_html(args.rows)
+    print(f"page size {len(html) / 2**20:.1f} MiB")
+
+    soup = measure("soup, full page", lambda: web.parse_rows(html))
+    stream = measure("stream, full page", lambda: list(web.iter_rows(chunks(html))))
+    assert soup == stream, "streaming parser disagrees with BeautifulSoup"
+
+    end = args.offset + args.batch
+    measure("soup, one batch", lambda: web.parse_rows(html)[args.offset:end])
+    batch = measure("stream, one batch", lambda: list(itertools.islice(web.iter_rows(chunks(html)), args.offset, end)))
+    assert batch == soup[args.offset:end]
+
+    with StubServer(pokedex_route(html.encode("utf-8"))) as stub, tempfile.TemporaryDirectory() as tmp:
+        web.URL = f"{stub.url}/pokedex/all"
+        http_cache._shared = HttpCache(Path(tmp) / "http_cache.sqlite", ttl=0)
+        fetched = measure("fetch soup, one batch",
+                          lambda: list(itertools.islice(web.fetch_rows("soup"), args.offset, end)))
+        assert fetched == batch
+        fetched = measure("fetch stream, one batch",
+                          lambda: list(itertools.islice(web.fetch_rows("stream"), args.offset, end)))
+        assert fetched == batch
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Multi-threaded read/write stress test for pipeline.pool.ConnectionPool.
+
+--writers threads each commit --txns transactions. Every transaction inserts
+--rows ledger rows and bumps a running total in the same commit. Meanwhile
+--readers threads keep reading the ledger and the total in one statement,
+like a report running next to a loader. A read sees a consistent snapshot
+only if the row count and sum match the total.
+
+The same workload runs twice:
+
+  per-call  every operation opens its own sqlite3.connect(), as the scripts
+            used to. Writers contend through SQLite's busy handler, which
+            sleeps and polls, and give up with "database is locked" after
+            --busy-timeout.
+  pool      one ConnectionPool: writers queue on its writer lock, readers
+            borrow `mode=ro` connections.
+
+The pool run must finish with no lock errors, no inconsistent reads, and
+every row present. The per-call run is only reported.
+
+    python bench/bench_pool.py --writers 8 --readers 8 --txns 200 --rows 20
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from pipeline.pool import ConnectionPool
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ledger (id INTEGER PRIMARY KEY, writer INTEGER NOT NULL, amount INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS ledger_total (id INTEGER PRIMARY KEY CHECK (id = 1), n INTEGER NOT NULL, total INTEGER NOT NULL);
+    INSERT OR IGNORE INTO ledger_total(id, n, total) VALUES (1, 0, 0);
+"""
+READ_SQL = """
+    SELECT (SELECT COUNT(*) FROM ledger), (SELECT COALESCE(SUM(amount), 0) FROM ledger), n, total
+    FROM ledger_total
+"""
+
+
+class PerCall:
+    """A fresh connection per operation, like the scripts before the pool."""
+
+    def __init__(self, path: Path, busy_timeout: float):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    @contextmanager
+    def writer(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @contextmanager
+    def reader(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+def pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def stress(source, writers: int, readers: int, txns: int, rows: int) -> dict:
+    done = threading.Event()
+    lock = threading.Lock()
+    out = {"write_lat": [], "read_lat": [], "lock_errors": 0, "inconsistent": 0, "reads": 0}
+
+    def write(w):
+        lat, errors = [], 0
+        for t in range(txns):
+            start = time.perf_counter()
+            try:
+                with source.writer() as conn:
+                    amounts = [(w, (w * 31 + t * 7 + i) % 100) for i in range(rows)]
+                    conn.executemany("INSERT INTO ledger(writer, amount) VALUES (?, ?)", amounts)
+                    conn.execute("UPDATE ledger_total SET n = n + ?, total = total + ? WHERE id = 1",
+                                 (rows, sum(a for _, a in amounts)))
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                errors += 1
+                continue
+            lat.append(time.perf_counter() - start)
+        with lock:
+            out["write_lat"] += lat
+            out["lock_errors"] += errors
+
+    def read():
+        lat, bad, errors, n = [], 0, 0, 0
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                with source.reader() as conn:
+                    count, total_sum, n_rows, total = conn.execute(READ_SQL).fetchone()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                errors += 1
+                continue
+            lat.append(time.perf_counter() - start)
+            bad += (count, total_sum) != (n_rows, total)
+            n += 1
+        with lock:
+            out["read_lat"] += lat
+            out["inconsistent"] += bad
+            out["lock_errors"] += errors
+            out["reads"] += n
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for th in reader_threads + writer_threads:
+        th.start()
+    for th in writer_threads:
+        th.join()
+    out["seconds"] = time.perf_counter() - start
+    done.set()
+    for th in reader_threads:
+        th.join()
+    return out
+
+
+def run(mode: str, tmp: Path, args) -> bool:
+    path = tmp / f"pool-{mode}.sqlite"
+    pool = ConnectionPool(path, readers=max(args.readers, 1))
+    with pool.writer() as conn:
+        conn.executescript(SCHEMA)
+    source = pool if mode == "pool" else PerCall(path, args.busy_timeout)
+
+    out = stress(source, args.writers, args.readers, args.txns, args.rows)
+    with pool.reader() as conn:
+        count, total_sum, n_rows, total = conn.execute(READ_SQL).fetchone()
+    pool.close()
+
+    committed = len(out["write_lat"])
+    ok = (count, total_sum) == (n_rows, total) and count == committed * args.rows
+    if mode == "pool":
+        ok &= out["lock_errors"] == 0 and out["inconsistent"] == 0 and committed == args.writers * args.txns
+    print(f"{mode:<9} {committed / out['seconds']:>9,.0f} {pct(out['write_lat'], .5):>8.2f} "
+          f"{pct(out['write_lat'], .99):>8.2f} {out['reads'] / out['seconds']:>9,.0f} "
+          f"{pct(out['read_lat'], .5):>8.2f} {pct(out['read_lat'], .99):>8.2f} {out['lock_errors']:>6} "
+          f"{out['inconsistent']:>6} {count:>9,} {out['seconds']:>7.2f}  {'ok' if ok else 'WRONG'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--txns", type=int, default=200, help="transactions per writer")
+    parser.add_argument("--rows", type=int, default=20, help="rows per transaction")
+    parser.add_argument("--busy-timeout", type=float, default=1.0,
+                        help="seconds a per-call writer waits on the lock before erroring")
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<9} {'txn/s':>9} {'w p50ms':>8} {'w p99ms':>8} {'reads/s':>9} {'r p50ms':>8} "
+          f"{'r p99ms':>8} {'locked':>6} {'torn':>6} {'rows':>9} {'secs':>7}")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("per-call", "pool"):
+            ok &= run(mode, Path(tmp), args)
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
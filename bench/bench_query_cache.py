@@ -0,0 +1,167 @@
+"""pipeline/query_cache.py on synthetic databases: cold vs cached report queries.
+
+For each size every cached report query runs four times:
+
+  cold     first run: executes and stores the result (make_viz's chart query
+           is calc_outputs' web type counts, so it is already a hit)
+  warm     same process again: served from the cache
+  process  a fresh Python process: must be all hits, from the persisted file
+  written  after one spell is inserted: the two spell queries must miss and
+           see the new spell, everything else must still hit
+
+Last, the database is copied and each copy gets a different spell, so both
+end up with the same data_generation and table counters: each must still
+be answered with its own rows.
+
+Every result is compared with the query run with the cache switched off.
+
+    python bench/bench_query_cache.py --rows 10000 1000000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+if "--child" not in sys.argv:
+    # the --child process inherits this, so it reads the same cache file
+    os.environ["QUERY_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "query_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+
+import synth
+from pipeline.db import connect
+from pipeline.paths import add_script_paths
+from pipeline.query_cache import shared_query_cache
+
+add_script_paths()
+import analyze_and_visualize_dnd as dnd
+import calc_outputs
+import make_viz
+
+ROWS_PER_SCALE = synth.BASE_POKEMON * len(synth.STAT_NAMES)
+SPELL_QUERIES = {"spells_by_school_counts", "grouped_counts_by_school_level_bucket"}
+SHARED_QUERIES = {"web_primary_type_counts"}
+
+QUERIES = [
+    ("pokemon_avg_total_stats_by_type", lambda c: calc_outputs.pokemon_avg_total_stats_by_type(c, materialized=False)),
+    ("fruit_avg_nutrients_by_family", lambda c: calc_outputs.fruit_avg_nutrients_by_family(c, materialized=False)),
+    ("fruit_top_sugar", lambda c: calc_outputs.fruit_top_sugar(c, 10)),
+    ("website_type_counts", calc_outputs.website_type_counts),
+    ("web_primary_type_counts", make_viz.web_primary_type_counts),
+    ("spells_by_school_counts", dnd.spells_by_school_counts),
+    ("grouped_counts_by_school_level_bucket", dnd.grouped_counts_by_school_level_bucket),
+]
+
+
+def run_all(conn):
+    """{name: (rows, seconds, hit)} for every query."""
+    cache = shared_query_cache()
+    out = {}
+    for name, fn in QUERIES:
+        hits = cache.hits
+        start = time.perf_counter()
+        rows = [tuple(r.values()) if isinstance(r, dict) else tuple(r) for r in fn(conn)]
+        out[name] = (rows, time.perf_counter() - start, cache.hits > hits)
+    return out
+
+
+def direct(conn):
+    cache = shared_query_cache()
+    cache.enabled = False
+    try:
+        return {name: rows for name, (rows, _, _) in run_all(conn).items()}
+    finally:
+        cache.enabled = True
+
+
+def child(db: str) -> None:
+    conn = connect(Path(db))
+    print(json.dumps({name: hit for name, (_, _, hit) in run_all(conn).items()}))
+    conn.close()
+
+
+def run(rows: int, tmp: Path) -> bool:
+    db = tmp / f"synth-{rows}.sqlite"
+    synth.build(db, rows / ROWS_PER_SCALE)
+    conn = connect(db)
+    ok = True
+
+    want = direct(conn)
+    cold = run_all(conn)
+    warm = run_all(conn)
+    proc = subprocess.run([sys.executable, __file__, "--child", str(db)], capture_output=True, text=True,
+                          env=os.environ, check=True)
+    in_process = json.loads(proc.stdout)
+
+    conn.execute("INSERT INTO spells(api_index, name, level_id, school_id) "
+                 "SELECT 'bench-spell', 'Bench Spell', MIN(level_id), MAX(school_id) FROM spells")
+    conn.commit()
+    want_after = direct(conn)
+    after = run_all(conn)
+    conn.close()
+    copies_ok = diverged_copies(db, tmp / f"synth-{rows}-copy.sqlite")
+    ok &= copies_ok
+
+    print(f"\n== {rows:,} pokemon_stat rows")
+    print(f"{'query':<40} {'cold':>9} {'warm':>9} {'speedup':>8} {'process':>8} {'written':>8}")
+    for name, _ in QUERIES:
+        expect_hit = name not in SPELL_QUERIES
+        good = (cold[name][0] == warm[name][0] == want[name] and cold[name][2] == (name in SHARED_QUERIES)
+                and warm[name][2]
+                and in_process[name] and after[name][0] == want_after[name] and after[name][2] == expect_hit)
+        ok &= good
+        t_cold, t_warm = cold[name][1], warm[name][1]
+        print(f"{name:<40} {t_cold * 1000:>7.2f}ms {t_warm * 1000:>7.2f}ms {t_cold / t_warm:>7.1f}x "
+              f"{'hit' if in_process[name] else 'MISS':>8} {'hit' if after[name][2] else 'miss':>8}"
+              f"{'' if good else '  WRONG'}")
+    ok &= want_after["spells_by_school_counts"] != want["spells_by_school_counts"]
+    total_cold = sum(t for _, t, _ in cold.values())
+    total_warm = sum(t for _, t, _ in warm.values())
+    print(f"{'all':<40} {total_cold * 1000:>7.2f}ms {total_warm * 1000:>7.2f}ms {total_cold / total_warm:>7.1f}x")
+    print(f"diverged copies with equal counters: {'own rows each' if copies_ok else 'WRONG'}")
+    return ok
+
+
+def diverged_copies(db: Path, copy: Path) -> bool:
+    shutil.copy(db, copy)
+    ok = True
+    for path, school in ((db, "MIN"), (copy, "MAX")):
+        conn = connect(path)
+        conn.execute("INSERT INTO spells(api_index, name, level_id, school_id) "
+                     f"SELECT 'bench-copy', 'Bench Copy', MIN(level_id), {school}(school_id) FROM spells")
+        conn.commit()
+        conn.close()
+    for path in (db, copy, db):
+        conn = connect(path)
+        want = direct(conn)
+        ok &= all(rows == want[name] for name, (rows, _, _) in run_all(conn).items())
+        conn.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000],
+                        help="pokemon_stat rows per synthetic database")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child(args.child)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            ok &= run(rows, Path(tmp))
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""reconcile_pokemon.py on synthetic multi-form dexes of growing size.
+
+Every species and form is generated with the pokemondb row it should map to
+and how, so the whole pokemon_xref table is checked, not just the counts.
+Names cover the awkward cases of the real data:
+
+  "Mr. Mon7" / mr-mon7, "Mon13♀" / mon13-f, "Flabébé17" / flabebe17,
+  "Farfetch'd19" / farfetchd19, and "Mon11Normal Forme" / mon11-normal
+  (pokemondb's name cell run into its form label; found by dex number)
+
+Every 5th species has a form (id 10001 on, or the next power of ten past
+the species ids) that matches by name prefix.
+Every 23rd species has no pokemondb row, and pokemondb has some dex numbers
+PokeAPI lacks. Every 29th species and every other form disagree on types.
+
+After the full run, an incremental run with nothing new must probe only
+the unmatched pokemon. Then new pokemon are loaded for the pokemondb-only
+dex numbers and some existing pokemon change types, and the next incremental
+run must probe exactly those and end with the same table as a full run.
+
+    python bench/bench_reconcile.py --species 1000 10000 100000
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from pipeline.changes import content_hash
+from pipeline.db import connect
+from pipeline.paths import add_script_paths
+from synth import TYPES
+
+add_script_paths()
+import reconcile_pokemon
+
+FORM_EVERY = 5
+MISSING_EVERY = 23
+TYPE_CLASH_EVERY = 29
+
+
+def species(i: int):
+    """(PokeAPI slug, pokemondb name, match method) for species i."""
+    if i % 7 == 0:
+        return f"mr-mon{i}", f"Mr. Mon{i}", "name"
+    if i % 11 == 0:
+        return f"mon{i}-normal", f"Mon{i}Normal Forme", "dex"
+    if i % 13 == 0:
+        return f"mon{i}-f", f"Mon{i}♀", "name"
+    if i % 17 == 0:
+        return f"flabebe{i}", f"Flabébé{i}", "name"
+    if i % 19 == 0:
+        return f"farfetchd{i}", f"Farfetch'd{i}", "name"
+    return f"mon{i}", f"Mon{i}", "name"
+
+
+def species_types(i: int):
+    first, second = TYPES[i % len(TYPES)], TYPES[(i * 5) % len(TYPES)]
+    return [first, second] if i % 3 == 0 and second != first else [first]
+
+
+class Dex:
+    """The synthetic catalog and the mapping each pokemon should get."""
+
+    def __init__(self, n_species: int, web_only: int, form_base: int):
+        self.n_species = n_species
+        self.pokemon = []     # (pokemon_id, name, types)
+        self.web = []         # (dex_num, name, types)
+        self.expected = {}    # pokemon_id -> (dex_num, method, types_agree)
+        form_id = form_base - 1
+        for i in range(1, n_species + 1):
+            self.add_species(i)
+            if i % FORM_EVERY == 0:
+                form_id += 1
+                slug = species(i)[0]
+                slug = slug[:-len("-normal")] + "-attack" if slug.endswith("-normal") else slug + "-mega"
+                types = [TYPES[(i + 7) % len(TYPES)]] if form_id % 2 == 0 else species_types(i)
+                self.pokemon.append((form_id, slug, types))
+                if i % MISSING_EVERY:
+                    self.expected[form_id] = (i, "form", int(types == self.web_types(i)))
+                else:
+                    self.expected[form_id] = (None, "none", None)
+        for j in range(n_species + 1, n_species + web_only + 1):
+            self.web.append((j, species(j)[1], species_types(j)))
+
+    def web_types(self, i: int):
+        types = species_types(i)
+        return [TYPES[(i + 1) % len(TYPES)]] + types[1:] if i % TYPE_CLASH_EVERY == 0 else types
+
+    def add_species(self, i: int):
+        slug, web_name, method = species(i)
+        self.pokemon.append((i, slug, species_types(i)))
+        if i % MISSING_EVERY:
+            self.web.append((i, web_name, self.web_types(i)))
+            self.expected[i] = (i, method, int(species_types(i) == self.web_types(i)))
+        else:
+            self.expected[i] = (None, "none", None)
+
+
+def insert_pokemon(conn: sqlite3.Connection, rows) -> None:
+    conn.executemany("INSERT INTO pokemon(pokemon_id, name, content_hash) VALUES (?, ?, ?)",
+                     ((pid, name, content_hash([name, types])) for pid, name, types in rows))
+    conn.executemany("INSERT INTO pokemon_type(pokemon_id, slot, type_name) VALUES (?, ?, ?)",
+                     ((pid, slot, t) for pid, _, types in rows for slot, t in enumerate(types, start=1)))
+
+
+def build(path: Path, dex: Dex) -> None:
+    conn = connect(path)
+    conn.execute("PRAGMA synchronous = OFF;")
+    insert_pokemon(conn, dex.pokemon)
+    conn.executemany("INSERT INTO web_type_dim(type_id, type_name) VALUES (?, ?)", enumerate(TYPES, start=1))
+    conn.executemany("INSERT INTO web_pokemon(dex_num, name, content_hash) VALUES (?, ?, ?)",
+                     ((d, name, content_hash([name, types])) for d, name, types in dex.web))
+    conn.executemany("INSERT INTO web_pokemon_type(dex_num, slot, type_id) VALUES (?, ?, ?)",
+                     ((d, slot, TYPES.index(t) + 1) for d, _, types in dex.web for slot, t in enumerate(types, start=1)))
+    conn.commit()
+    conn.close()
+
+
+def xref(conn: sqlite3.Connection) -> dict:
+    return {pid: (d, m, a) for pid, d, m, a in
+            conn.execute("SELECT pokemon_id, dex_num, method, types_agree FROM pokemon_xref")}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run(n_species: int, tmp: Path) -> bool:
+    web_only = max(n_species // 100, 1)
+    # PokeAPI numbers forms from 10001; past that many species they start
+    # at the next power of ten instead
+    form_base = 10001
+    while form_base <= n_species + web_only:
+        form_base = (form_base - 1) * 10 + 1
+    reconcile_pokemon.FORM_ID_START = form_base
+    dex = Dex(n_species, web_only, form_base)
+    db = tmp / f"reconcile-{n_species}.sqlite"
+    build(db, dex)
+    conn = connect(db)
+    ok = True
+
+    counts, full_s = timed(lambda: reconcile_pokemon.reconcile(conn, incremental=False))
+    got = xref(conn)
+    wrong = [pid for pid, want in dex.expected.items() if got.get(pid) != want]
+    ok &= not wrong and len(got) == len(dex.expected)
+    diff, diff_s = timed(lambda: sum(1 for _ in reconcile_pokemon.diff_rows(conn)))
+    expected_diff = (sum(1 for _, _, a in dex.expected.values() if a == 0)
+                     + sum(1 for d, _, _ in dex.expected.values() if d is None) + web_only)
+    ok &= diff == expected_diff
+
+    idle, idle_s = timed(lambda: reconcile_pokemon.reconcile(conn))
+    ok &= idle["probed"] == counts["none"]
+
+    # new pokemon for the pokemondb-only dex numbers, and some types changed
+    new = [(j, species(j)[0], species_types(j)) for j in range(n_species + 1, n_species + web_only + 1)]
+    insert_pokemon(conn, new)
+    changed = [pid for pid in range(1, n_species + 1, 97) if pid % MISSING_EVERY]
+    for pid in changed:
+        types = [TYPES[(pid + 11) % len(TYPES)]]
+        conn.execute("DELETE FROM pokemon_type WHERE pokemon_id = ? AND slot > 1", (pid,))
+        conn.execute("UPDATE pokemon_type SET type_name = ? WHERE pokemon_id = ? AND slot = 1", (types[0], pid))
+        conn.execute("UPDATE pokemon SET content_hash = ? WHERE pokemon_id = ?", (content_hash([pid, types]), pid))
+    conn.commit()
+    step, step_s = timed(lambda: reconcile_pokemon.reconcile(conn))
+    ok &= step["probed"] == counts["none"] + len(new) + len(changed)
+    after_step = xref(conn)
+    reconcile_pokemon.reconcile(conn, incremental=False)
+    ok &= after_step == xref(conn)
+    conn.close()
+
+    n = len(dex.pokemon)
+    print(f"{n_species:>9,} {n:>9,} {len(dex.web):>9,} {full_s:>8.2f} {n / full_s:>9,.0f} {diff:>7,} {diff_s:>7.3f}"
+          f" {idle['probed']:>7,} {idle_s:>7.3f} {step['probed']:>7,} {step_s:>7.3f}"
+          f"  {'ok' if ok else 'WRONG' + (f' ({len(wrong)} bad pairs, e.g. {wrong[:3]})' if wrong else '')}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--species", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args(argv)
+
+    print(f"{'species':>9} {'pokemon':>9} {'web rows':>9} {'full s':>8} {'rows/s':>9} {'diff':>7} {'diff s':>7}"
+          f" {'idle':>7} {'idle s':>7} {'incr':>7} {'incr s':>7}")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.species:
+            ok &= run(n, Path(tmp))
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
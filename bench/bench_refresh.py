@@ -0,0 +1,264 @@
+"""--refresh (change detection by content hash) for every loader, against local stubs.
+
+Each source is fully loaded, then refreshed three times:
+
+  1. nothing changed upstream: every entity must come back unchanged, with
+     no rows written
+  2. --new entities added and --edit existing ones changed (a stat, a second
+     type, a fruit's nutrients or family, a name, a spell level, a bean's
+     groups): the inserted / updated / unchanged counts must match exactly
+  3. unchanged again, now against the new data
+
+After that the refreshed database must hold exactly what a fresh full load of
+the changed data holds, materialized aggregates included.
+
+    python bench/bench_refresh.py --pokemon 1000 --fruits 2000 --web 1000 --spells 300 --beans 500
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+os.environ["QUERY_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "query_cache.sqlite")
+sys.path.insert(0, str(ROOT))
+
+import requests
+
+from pipeline.db import connect_readonly
+from pipeline.http_cache import shared_cache
+from pipeline.paths import add_script_paths
+from stubs import (GROUP_NAMES, FRUIT_FAMILIES, StubServer, TYPE_NAMES, dnd5e_route, fake_bean, fake_fruit,
+                   fake_pokemon, fake_spell, fruityvice_body, fruityvice_route, jellybelly_route,
+                   pokeapi_route, pokedex_html, with_etag)
+
+add_script_paths()
+import SI201FinalProjectAttempt as beans
+import calc_outputs
+import dnd5e_api
+import ingest_to_db_dnd
+import load_fruityvice
+import load_pokeapi
+import load_pokemondb_website
+
+# (label, SQL) for every table a loader writes, with dimension ids resolved
+# to names so two databases filled in a different order still compare equal
+SNAPSHOT = [
+    ("pokemon", "SELECT pokemon_id, name, height, weight, base_experience, content_hash FROM pokemon"),
+    ("pokemon_type", "SELECT pokemon_id, slot, type_name FROM pokemon_type"),
+    ("pokemon_stat", "SELECT pokemon_id, stat_name, base_stat, effort FROM pokemon_stat JOIN stat_dim USING (stat_id)"),
+    ("pokemon_total_stats", "SELECT pokemon_id, total_stats, n_stats FROM pokemon_total_stats"),
+    ("type_stat_totals", "SELECT type_name, sum_total_stats, pokemon_count FROM type_stat_totals"),
+    ("fruits", "SELECT fruit_id, name, content_hash FROM fruits"),
+    ("fruityvice_nutrition", "SELECT fruit_id, family_name, genus, fruit_order, carbohydrates, protein, fat, "
+                             "calories, sugar FROM fruityvice_nutrition LEFT JOIN fruit_family USING (family_id)"),
+    ("fruit_nutrient_long", "SELECT fruit_id, nutrient_name, nutrient_value FROM fruit_nutrient_long "
+                            "JOIN nutrient_dim USING (nutrient_id)"),
+    ("family_nutrient_totals", "SELECT family_name, nutrient_name, sum_value, n_values, n_rows "
+                               "FROM family_nutrient_totals JOIN fruit_family USING (family_id) "
+                               "JOIN nutrient_dim USING (nutrient_id)"),
+    ("web_pokemon", "SELECT dex_num, name, content_hash FROM web_pokemon"),
+    ("web_pokemon_type", "SELECT dex_num, slot, type_name FROM web_pokemon_type JOIN web_type_dim USING (type_id)"),
+    ("spells", "SELECT api_index, s.name, c.name, l.level_num, content_hash FROM spells s "
+               "JOIN schools c ON c.id = s.school_id JOIN levels l ON l.id = s.level_id"),
+    ("Beans", "SELECT id, name, groupName, sugarFree, content_hash FROM Beans"),
+    ("bean_group", "SELECT bean_id, group_name FROM bean_group JOIN bean_group_dim USING (group_id)"),
+]
+
+
+class Upstream:
+    """What the stubs serve: n entities per source, some of them edited."""
+
+    def __init__(self, n):
+        self.n = dict(n)
+        self.edited = {source: set() for source in n}
+
+    def pokemon(self, pid):
+        p = fake_pokemon(pid)
+        if pid in self.edited["pokemon"]:
+            p["stats"][pid % len(p["stats"])]["base_stat"] += 11
+            if pid % 2:
+                p["types"].append({"slot": 2, "type": {"name": TYPE_NAMES[(pid + 3) % len(TYPE_NAMES)]}})
+        return p
+
+    def fruit(self, fid):
+        f = fake_fruit(fid)
+        if fid in self.edited["fruits"]:
+            if fid % 2:
+                f["family"] = FRUIT_FAMILIES[(fid + 1) % len(FRUIT_FAMILIES)]
+            else:
+                f["nutritions"]["sugar"] += 1.5
+        return f
+
+    def spell(self, i):
+        s = fake_spell(i)
+        if i in self.edited["spells"]:
+            s["level"] = (s["level"] + 1) % 10
+        return s
+
+    def bean(self, bean_id):
+        b = fake_bean(bean_id)
+        if bean_id in self.edited["beans"]:
+            b["groupName"] = [GROUP_NAMES[(bean_id + 2) % len(GROUP_NAMES)]]
+        return b
+
+    def pokedex(self):
+        html = pokedex_html(self.n["web"] * 2)
+        for dex in self.edited["web"]:
+            html = html.replace(f'">Mon {dex}</a>', f'">Mon {dex} Renamed</a>')
+        return html.encode()
+
+    def routes(self):
+        fruit_body = fruityvice_body(self.n["fruits"], self.fruit)
+        pokedex = self.pokedex()
+        return {
+            "pokemon": pokeapi_route(self.n["pokemon"], make=self.pokemon),
+            "fruits": fruityvice_route(fruit_body),
+            "web": lambda path, headers: (200, {"Content-Type": "text/html"}, pokedex),
+            "spells": dnd5e_route(self.n["spells"], make=self.spell),
+            "beans": jellybelly_route(self.n["beans"], make=self.bean),
+        }
+
+    def change(self, new, edit):
+        for source in self.n:
+            # every edit-th existing entity, then `new` more on the end
+            self.edited[source] |= set(range(1, self.n[source] + 1, edit))
+            self.n[source] += new
+        self.edited["spells"] = {i - 1 for i in self.edited["spells"]}
+
+
+class Switch:
+    """A route whose target can be swapped while the stub keeps running."""
+
+    def __init__(self):
+        self.route = None
+
+    def __call__(self, path, headers):
+        return self.route(path, headers)
+
+
+def point_loaders(urls, db):
+    load_fruityvice.DB_PATH = load_pokemondb_website.DB_PATH = ingest_to_db_dnd.DB_PATH = db
+    load_fruityvice.URL = f"{urls['fruits']}/api/fruit/all"
+    load_pokemondb_website.URL = f"{urls['web']}/pokedex/all"
+    dnd5e_api.API_HOST = urls["spells"]
+    dnd5e_api.API_ROOT_2014 = f"{urls['spells']}/api/2014"
+
+
+def full_load(urls, db, workers):
+    shared_cache().revalidate = True
+    point_loaders(urls, db)
+    conn = load_pokeapi.connect(db)
+    stats = load_pokeapi.load_full(conn, workers=workers, base=f"{urls['pokemon']}/api/v2/pokemon/")
+    assert stats["error"] is None, stats
+    beans.loadAll(conn, conn.cursor(), f"{urls['beans']}/api/Beans", batch=100, workers=workers)
+    conn.close()
+    load_fruityvice.main(["--full"])
+    load_pokemondb_website.main(["--full"])
+    ingest_to_db_dnd.main(["--full", "--workers", str(workers), "--rate", "1000"])
+
+
+def refresh_all(urls, db, workers):
+    """Refresh every source; returns {source: (counts, rows written, seconds)}."""
+    shared_cache().revalidate = True
+    point_loaders(urls, db)
+    conn = load_pokeapi.connect(db)
+    out = {}
+
+    def timed(source, fn):
+        before = conn.total_changes
+        start = time.perf_counter()
+        counts = fn()
+        out[source] = ({k: counts[k] for k in ("inserted", "updated", "unchanged")},
+                       conn.total_changes - before, time.perf_counter() - start)
+
+    timed("pokemon", lambda: load_pokeapi.refresh(conn, workers, f"{urls['pokemon']}/api/v2/pokemon/"))
+    timed("fruits", lambda: load_fruityvice.refresh(conn, load_fruityvice.URL))
+    timed("web", lambda: load_pokemondb_website.refresh(conn, load_pokemondb_website.fetch_rows()))
+    with requests.Session() as session:
+        timed("spells", lambda: ingest_to_db_dnd.refresh_spells(conn, session, workers))
+    timed("beans", lambda: beans.refreshTable(conn, conn.cursor(), f"{urls['beans']}/api/Beans", 100, workers))
+    conn.close()
+    return out
+
+
+def snapshot(db):
+    conn = sqlite3.connect(db)
+    snap = {label: sorted(conn.execute(sql).fetchall()) for label, sql in SNAPSHOT}
+    conn.close()
+    return snap
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pokemon", type=int, default=1000)
+    parser.add_argument("--fruits", type=int, default=2000)
+    parser.add_argument("--web", type=int, default=1000, help="dex numbers (two forms each)")
+    parser.add_argument("--spells", type=int, default=300)
+    parser.add_argument("--beans", type=int, default=500)
+    parser.add_argument("--new", type=int, default=5, help="entities added per source")
+    parser.add_argument("--edit", type=int, default=20, help="edit every Nth existing entity")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    upstream = Upstream({"pokemon": args.pokemon, "fruits": args.fruits, "web": args.web,
+                         "spells": args.spells, "beans": args.beans})
+    ok = True
+    with ExitStack() as stack, tempfile.TemporaryDirectory() as tmp:
+        switches = {source: Switch() for source in upstream.n}
+        urls = {source: stack.enter_context(StubServer(with_etag(switch))).url for source, switch in switches.items()}
+
+        def serve():
+            for source, route in upstream.routes().items():
+                switches[source].route = route
+
+        db = Path(tmp) / "refresh.sqlite"
+        serve()
+        full_load(urls, db, args.workers)
+
+        before = dict(upstream.n)
+        edited = {source: len(range(1, n + 1, args.edit)) for source, n in before.items()}
+        changed = {source: {"inserted": args.new, "updated": edited[source],
+                            "unchanged": n - edited[source]} for source, n in before.items()}
+        steady = {source: {"inserted": 0, "updated": 0, "unchanged": n} for source, n in before.items()}
+        after = {source: {"inserted": 0, "updated": 0, "unchanged": n + args.new} for source, n in before.items()}
+
+        print(f"{'run':<10} {'source':<8} {'inserted':>8} {'updated':>8} {'unchanged':>9} {'written':>8} {'seconds':>8}")
+        for label, expected, change in (("no change", steady, False), ("changed", changed, True),
+                                        ("no change", after, False)):
+            if change:
+                upstream.change(args.new, args.edit)
+                serve()
+            for source, (counts, written, elapsed) in refresh_all(urls, db, args.workers).items():
+                good = counts == expected[source] and (written == 0) == (counts["inserted"] + counts["updated"] == 0)
+                ok &= good
+                print(f"{label:<10} {source:<8} {counts['inserted']:>8} {counts['updated']:>8} "
+                      f"{counts['unchanged']:>9} {written:>8} {elapsed:>8.2f}"
+                      f"{'' if good else f'  WRONG, expected {expected[source]}'}")
+
+        conn = connect_readonly(db)
+        problems = calc_outputs.check_aggregates(conn)
+        conn.close()
+        print(f"\nmaterialized aggregates after refresh: {'consistent' if not problems else problems[:3]}")
+        ok &= not problems
+
+        fresh = Path(tmp) / "fresh.sqlite"
+        full_load(urls, fresh, args.workers)
+        a, b = snapshot(db), snapshot(fresh)
+        differ = [label for label, _ in SNAPSHOT if a[label] != b[label]]
+        print(f"refreshed database vs fresh full load: {'identical' if not differ else f'differ in {differ}'}")
+        ok &= not differ
+
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Startup regression check for `python -m pipeline <command>`.
+
+Runs each command with --help under `python -X importtime` (so it imports
+everything a real run would, then exits before touching the network or the
+database), sums the top-level cumulative import times, and fails if a loader
+or the migrate command pulls in a plotting/parsing stack or goes over budget.
+
+Then each chart command runs for real, twice, on a small synthetic database
+in a temporary directory: the second run finds every chart up to date and
+must finish without matplotlib or seaborn in sys.modules. Finally all of them
+run at once on an empty render manifest, and each must then find its charts
+up to date again.
+
+    python bench/bench_startup.py [--budget-ms 250] [--repeat 3]
+
+Exits 1 on any violation, so it can run in CI or a cron preflight.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# commands that run on a schedule and must stay light
+LIGHT_COMMANDS = ["migrate", "load-pokeapi", "load-fruit", "load-web", "load-spells",
+                  "backfill-nutrients", "reports"]
+# everything else is only timed
+OTHER_COMMANDS = ["beans", "viz", "spells-report", "render", "advise"]
+HEAVY_MODULES = {"matplotlib", "seaborn", "bs4", "numpy", "pandas"}
+# chart commands: script module, and its path constants pointed into the temp dir
+NOOP_COMMANDS = {
+    "viz": ("make_viz", {"OUT_DIR": "outputs", "VIZ_DIR": "viz"}),
+    "spells-report": ("analyze_and_visualize_dnd", {"OUT_DIR": "output"}),
+}
+PLOTTING_MODULES = {"matplotlib", "seaborn"}
+SYNTH_SCALE = 0.2
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def import_profile(command: str):
+    """Return (total import microseconds, top-level package names, wall seconds)."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "pipeline", command, "--help"],
+                          cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{command} --help failed:\n{proc.stderr[-2000:]}")
+    total, packages = 0, set()
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if not m:
+            continue
+        packages.add(m.group(4).split(".")[0])
+        if len(m.group(3)) == 1:  # top level: cumulative already includes children
+            total += int(m.group(2))
+    return total, packages, wall
+
+
+def noop_child(command: str, tmp: Path) -> None:
+    """Run `command` against the temp dir and print what it loaded as JSON."""
+    sys.path.insert(0, str(ROOT))
+    from pipeline.paths import add_script_paths
+
+    add_script_paths()
+    module_name, dirs = NOOP_COMMANDS[command]
+    module = __import__(module_name)
+    module.DB_PATH = tmp / "synth.sqlite"
+    for name, sub in dirs.items():
+        (tmp / sub).mkdir(exist_ok=True)
+        setattr(module, name, tmp / sub)
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        module.main([])
+    wall = time.perf_counter() - start
+    loaded = sorted({m.split(".")[0] for m in sys.modules} & HEAVY_MODULES)
+    print(json.dumps({"wall": wall, "loaded": loaded, "output": out.getvalue()}))
+
+
+def noop_run(command: str, tmp: Path) -> dict:
+    env = {**os.environ, "RENDER_MANIFEST": str(tmp / "render_cache.json"),
+           "QUERY_CACHE_PATH": str(tmp / "query_cache.sqlite")}
+    proc = subprocess.run([sys.executable, __file__, "--noop-child", command, str(tmp)],
+                          cwd=ROOT, capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{command} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def check_noop_runs(failures: list) -> None:
+    import synth
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        synth.build(tmp / "synth.sqlite", SYNTH_SCALE)
+        # make_viz charts two of the report files next to its query
+        shutil.copytree(ROOT / "jason" / "outputs", tmp / "outputs")
+        print(f"\n{'no-op run':<20} {'wall':>9}  loaded")
+        for command in NOOP_COMMANDS:
+            noop_run(command, tmp)  # renders everything once
+            run = noop_run(command, tmp)
+            print(f"{command:<20} {run['wall'] * 1000:>7.1f}ms  {', '.join(run['loaded']) or '-'}")
+            if not re.search(r"^0 rendered", run["output"], re.M):
+                failures.append(f"{command} re-rendered on the second run")
+            plotting = sorted(set(run["loaded"]) & PLOTTING_MODULES)
+            if plotting:
+                failures.append(f"{command} imports {', '.join(plotting)} with every chart up to date")
+
+        # every chart command at once from an empty manifest: none may drop
+        # the hashes another one saved in the meantime
+        (tmp / "render_cache.json").unlink()
+        with ThreadPoolExecutor(len(NOOP_COMMANDS)) as pool:
+            list(pool.map(lambda command: noop_run(command, tmp), NOOP_COMMANDS))
+        for command in NOOP_COMMANDS:
+            if not re.search(r"^0 rendered", noop_run(command, tmp)["output"], re.M):
+                failures.append(f"{command} re-rendered after running alongside the other chart commands")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=250.0,
+                        help="max cumulative import time for the light commands")
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of N runs")
+    parser.add_argument("--noop-child", nargs=2, metavar=("COMMAND", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.noop_child:
+        return noop_child(args.noop_child[0], Path(args.noop_child[1]))
+
+    failures = []
+    print(f"{'command':<20} {'imports':>9} {'wall':>9}  heavy modules")
+    for command in LIGHT_COMMANDS + OTHER_COMMANDS:
+        runs = [import_profile(command) for _ in range(args.repeat)]
+        total = min(r[0] for r in runs)
+        wall = min(r[2] for r in runs)
+        heavy = sorted(runs[0][1] & HEAVY_MODULES)
+        print(f"{command:<20} {total / 1000:>7.1f}ms {wall * 1000:>7.1f}ms  {', '.join(heavy) or '-'}")
+        if command in LIGHT_COMMANDS:
+            if heavy:
+                failures.append(f"{command} imports {', '.join(heavy)}")
+            if total / 1000 > args.budget_ms:
+                failures.append(f"{command} imports take {total / 1000:.1f}ms > {args.budget_ms:.0f}ms budget")
+    check_noop_runs(failures)
+
+    for f in failures:
+        print("FAIL:", f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
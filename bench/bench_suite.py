@@ -0,0 +1,410 @@
+"""The whole pipeline at several scales, with results kept per git commit.
+
+Scale factors are multiples of the shipped project database (synth.SHIPPED:
+100 pokemon, 49 fruits, 100 pokemondb rows, 319 spells, 25 beans). Two
+phases run per factor:
+
+  load   every loader's full mode fills a fresh database from local stubs
+         (stubs.py) sized to the factor, then the nutrient backfill and
+         the reconcile run over it. Each stub request waits --latency
+         seconds plus up to --jitter more, and --error-rate of them fail
+         (429 + Retry-After or 503). A loader that stops on an error is run
+         again, as the next scheduled run would, up to --attempts times.
+         Every table must end up with the whole upstream in it.
+  query  synth.build fills every table at the factor, and each report
+         function of calc_outputs.py, analyze_and_visualize_dnd.py and the
+         beans chart runs --repeat times with the query cache off. The best
+         time is kept.
+
+Each run is stored in --results (a SQLite file, bench/results.sqlite by
+default) under the current commit, with the stage spans from
+pipeline.metrics for the loaders. The run is then compared with the
+latest results of --compare (by default the most recent other commit in
+the file). Anything more than SLOWER times slower, and by more than
+NOISE_FLOOR, is flagged.
+
+    python bench/bench_suite.py                                   # load 1x 10x, query 1x 100x
+    python bench/bench_suite.py --phase query --scale 1 100 10000
+    python bench/bench_suite.py --load-scale 10 --latency 0.02 --jitter 0.03 --error-rate 0.01
+    python bench/bench_suite.py --compare HEAD~3
+    python bench/bench_suite.py --list
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = tempfile.TemporaryDirectory()
+os.environ["HTTP_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "http_cache.sqlite")
+os.environ["QUERY_CACHE_PATH"] = str(Path(CACHE_DIR.name) / "query_cache.sqlite")
+os.environ["QUERY_CACHE"] = "0"  # time the queries, not the cache
+sys.path.insert(0, str(ROOT))
+
+import requests
+
+import synth
+from pipeline.db import connect, connect_readonly
+from pipeline.metrics import METRICS
+from pipeline.paths import add_script_paths
+from stubs import (StubServer, dnd5e_route, fresh_http_cache, fruityvice_body, fruityvice_route,
+                   jellybelly_route, pokeapi_route, pokedex_html, pokedex_route)
+
+add_script_paths()
+import SI201FinalProjectAttempt as beans
+import analyze_and_visualize_dnd as dnd
+import backfill_fruityvice_long
+import calc_outputs
+import dnd5e_api
+import ingest_to_db_dnd
+import load_fruityvice
+import load_pokeapi
+import load_pokemondb_website
+import reconcile_pokemon
+
+RESULTS_PATH = ROOT / "bench" / "results.sqlite"
+SLOWER = 1.25
+NOISE_FLOOR = 0.001  # seconds; smaller differences are never flagged
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    commit_sha TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    dirty INTEGER NOT NULL,
+    started_at TEXT NOT NULL,
+    args TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    scale REAL NOT NULL,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    rows INTEGER,
+    detail TEXT NOT NULL,
+    PRIMARY KEY (run_id, phase, scale, name),
+    FOREIGN KEY (run_id) REFERENCES runs(run_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_runs_commit ON runs(commit_sha, run_id);
+"""
+
+
+class Incomplete(Exception):
+    """A loader stopped before the end of its source; the next run resumes it."""
+
+
+def git(*args) -> str:
+    proc = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.strip() if proc.returncode == 0 else ""
+
+
+# -- load phase ---------------------------------------------------------------
+
+def point_loaders(urls, db):
+    load_fruityvice.DB_PATH = load_pokemondb_website.DB_PATH = ingest_to_db_dnd.DB_PATH = db
+    load_fruityvice.URL = f"{urls['fruits']}/api/fruit/all"
+    load_pokemondb_website.URL = f"{urls['web']}/pokedex/all"
+    dnd5e_api.API_HOST = urls["spells"]
+    dnd5e_api.API_ROOT_2014 = f"{urls['spells']}/api/2014"
+
+
+def load_pokemon(urls, db, workers):
+    conn = connect(db)
+    try:
+        stats = load_pokeapi.load_full(conn, workers=workers, base=f"{urls['pokemon']}/api/v2/pokemon/")
+    finally:
+        conn.close()
+    if stats["error"] is not None:
+        raise Incomplete(stats["error"])
+
+
+def load_beans(urls, db, workers):
+    conn = connect(db)
+    try:
+        beans.loadAll(conn, conn.cursor(), f"{urls['beans']}/api/Beans", batch=100, workers=workers)
+    finally:
+        conn.close()
+
+
+def backfill(urls, db, workers):
+    conn = connect(db)
+    try:
+        backfill_fruityvice_long.backfill(conn, incremental=False)
+    finally:
+        conn.close()
+
+
+def reconcile(urls, db, workers):
+    conn = connect(db)
+    try:
+        reconcile_pokemon.reconcile(conn, incremental=False)
+    finally:
+        conn.close()
+
+
+# (name, run one attempt, table it fills, source whose size that table must reach)
+LOADERS = [
+    ("load_pokeapi", load_pokemon, "pokemon", "pokemon"),
+    ("load_fruityvice", lambda urls, db, workers: load_fruityvice.main(["--full"]), "fruits", "fruits"),
+    ("load_pokemondb_website", lambda urls, db, workers: load_pokemondb_website.main(["--full"]),
+     "web_pokemon", "web"),
+    ("ingest_to_db_dnd", lambda urls, db, workers: ingest_to_db_dnd.main(
+        ["--full", "--workers", str(workers), "--rate", "100000"]), "spells", "spells"),
+    ("beans", load_beans, "Beans", "beans"),
+    ("backfill_fruityvice_long", backfill, "fruit_nutrient_long", None),
+    ("reconcile_pokemon", reconcile, "pokemon_xref", "pokemon"),
+]
+
+
+def stub_routes(sizes):
+    return {
+        "pokemon": pokeapi_route(sizes["pokemon"]),
+        "fruits": fruityvice_route(fruityvice_body(sizes["fruits"])),
+        "web": pokedex_route(pokedex_html(sizes["web"] * 2).encode()),  # two forms per dex number
+        "spells": dnd5e_route(sizes["spells"]),
+        "beans": jellybelly_route(sizes["beans"]),
+    }
+
+
+def merge_spans(into: dict, snapshot: dict) -> None:
+    for name, s in snapshot["spans"].items():
+        into[name] = into.get(name, 0.0) + s["total_s"]
+
+
+def run_loads(factor: float, tmp: Path, args) -> list:
+    sizes = synth.shipped_sizes(factor)
+    db = tmp / f"load-{factor:g}.sqlite"
+    out = []
+    with ExitStack() as stack:
+        stack.enter_context(fresh_http_cache(stack.enter_context(tempfile.TemporaryDirectory())))
+        stubs = {source: stack.enter_context(StubServer(route, args.latency, args.jitter, args.error_rate,
+                                                        args.retry_after, seed=i))
+                 for i, (source, route) in enumerate(stub_routes(sizes).items())}
+        urls = {source: stub.url for source, stub in stubs.items()}
+        point_loaders(urls, db)
+        connect(db).close()
+
+        for name, attempt, table, source in LOADERS:
+            requests_before = sum(s.requests for s in stubs.values())
+            errors_before = sum(s.errors for s in stubs.values())
+            spans = {}
+            attempts = 0
+            failure = None
+            start = time.perf_counter()
+            while attempts < args.attempts:
+                attempts += 1
+                METRICS.reset()
+                try:
+                    with redirect_stdout(io.StringIO()):
+                        attempt(urls, db, args.workers)
+                    failure = None
+                    break
+                except (Incomplete, requests.RequestException) as e:
+                    failure = f"{type(e).__name__}: {e}"
+                finally:
+                    merge_spans(spans, METRICS.snapshot())
+            elapsed = time.perf_counter() - start
+
+            conn = connect_readonly(db)
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            conn.close()
+            ok = failure is None and (source is None or rows == sizes[source])
+            out.append({
+                "phase": "load", "scale": factor, "name": name, "seconds": elapsed, "rows": rows, "ok": ok,
+                "detail": {"attempts": attempts, "failure": failure,
+                           "requests": sum(s.requests for s in stubs.values()) - requests_before,
+                           "errors": sum(s.errors for s in stubs.values()) - errors_before,
+                           "spans": {k: round(v, 6) for k, v in sorted(spans.items())}},
+            })
+    return out
+
+
+# -- query phase --------------------------------------------------------------
+
+def text_summary(conn, path):
+    with redirect_stdout(io.StringIO()):
+        dnd.write_text_summary(dnd.spells_by_school_counts(conn), dnd.grouped_counts_by_school_level_bucket(conn),
+                               str(path))
+    return [path]
+
+
+def query_benchmarks(tmp: Path):
+    """(name, fn(conn) -> rows) for every report function."""
+    return [
+        ("calc_outputs.pokemon_avg_total_stats_by_type",
+         lambda c: list(calc_outputs.pokemon_avg_total_stats_by_type(c))),
+        ("calc_outputs.pokemon_avg_total_stats_by_type[recompute]",
+         lambda c: list(calc_outputs.pokemon_avg_total_stats_by_type(c, materialized=False))),
+        ("calc_outputs.pokemon_weight_vs_total_stats",
+         lambda c: list(calc_outputs.pokemon_weight_vs_total_stats(c, limit=calc_outputs.SCATTER_LIMIT))),
+        ("calc_outputs.pokemon_weight_vs_total_stats[recompute]",
+         lambda c: list(calc_outputs.pokemon_weight_vs_total_stats(c, materialized=False,
+                                                                   limit=calc_outputs.SCATTER_LIMIT))),
+        ("calc_outputs.fruit_avg_nutrients_by_family",
+         lambda c: list(calc_outputs.fruit_avg_nutrients_by_family(c))),
+        ("calc_outputs.fruit_avg_nutrients_by_family[recompute]",
+         lambda c: list(calc_outputs.fruit_avg_nutrients_by_family(c, materialized=False))),
+        ("calc_outputs.fruit_top_sugar", lambda c: list(calc_outputs.fruit_top_sugar(c, 10))),
+        ("calc_outputs.website_type_counts", lambda c: list(calc_outputs.website_type_counts(c))),
+        ("calc_outputs.check_aggregates", calc_outputs.check_aggregates),
+        ("dnd.spells_by_school_counts", dnd.spells_by_school_counts),
+        ("dnd.grouped_counts_by_school_level_bucket", dnd.grouped_counts_by_school_level_bucket),
+        ("dnd.write_text_summary", lambda c: text_summary(c, tmp / "spell_summary.txt")),
+        ("beans.groupSugarCounts", beans.groupSugarCounts),
+    ]
+
+
+def run_queries(factor: float, tmp: Path, args) -> list:
+    db = tmp / f"query-{factor:g}.sqlite"
+    start = time.perf_counter()
+    counts = synth.build(db, sizes=synth.shipped_sizes(factor), seed=args.seed)
+    print(f"  built {db.name} in {time.perf_counter() - start:.1f}s: {counts}")
+
+    conn = connect_readonly(db)
+    out = []
+    for name, fn in query_benchmarks(tmp):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            rows = fn(conn)
+            samples.append(time.perf_counter() - start)
+        ok = name != "calc_outputs.check_aggregates" or not rows  # the aggregates must match a recompute
+        out.append({"phase": "query", "scale": factor, "name": name, "seconds": min(samples),
+                    "rows": len(rows), "ok": ok,
+                    "detail": {"median_s": statistics.median(samples), "samples": len(samples)}})
+    conn.close()
+    db.unlink()
+    return out
+
+
+# -- results ------------------------------------------------------------------
+
+def open_results(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(RESULTS_SCHEMA)
+    return conn
+
+
+def save(conn: sqlite3.Connection, results: list, args) -> int:
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO runs(commit_sha, subject, dirty, started_at, args) VALUES (?, ?, ?, ?, ?)",
+            (git("rev-parse", "HEAD") or "unknown", git("log", "-1", "--format=%s"),
+             int(bool(git("status", "--porcelain", "--untracked-files=no"))),
+             datetime.now(timezone.utc).isoformat(timespec="seconds"),
+             json.dumps({k: v for k, v in vars(args).items() if k not in ("results", "compare", "list")})),
+        ).lastrowid
+        conn.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         ((run_id, r["phase"], r["scale"], r["name"], r["seconds"], r["rows"],
+                           json.dumps(r["detail"])) for r in results))
+    return run_id
+
+
+def baseline(conn: sqlite3.Connection, rev, run_id: int):
+    """(commit, {(phase, scale, name): seconds}) from the latest results of `rev`."""
+    if rev:
+        sha = git("rev-parse", rev)
+        if not sha:
+            sys.exit(f"unknown revision: {rev}")
+    else:
+        current = conn.execute("SELECT commit_sha FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+        row = conn.execute("SELECT commit_sha FROM runs WHERE commit_sha <> ? ORDER BY run_id DESC LIMIT 1",
+                           (current,)).fetchone()
+        if row is None:
+            return None, {}
+        sha = row[0]
+    times = {}
+    for phase, scale, name, seconds in conn.execute("""
+        SELECT phase, scale, name, seconds FROM results JOIN runs USING (run_id)
+        WHERE commit_sha = ? AND run_id <> ? ORDER BY run_id
+    """, (sha, run_id)):
+        times[(phase, scale, name)] = seconds
+    return sha, times
+
+
+def list_runs(conn: sqlite3.Connection) -> None:
+    for run_id, sha, subject, dirty, started, n in conn.execute("""
+        SELECT r.run_id, commit_sha, subject, dirty, started_at, COUNT(*)
+        FROM runs r JOIN results USING (run_id) GROUP BY r.run_id ORDER BY r.run_id
+    """):
+        print(f"#{run_id:<4} {started}  {sha[:10]}{'+' if dirty else ' '} {n:>4} results  {subject[:60]}")
+
+
+def report(results: list, base_sha, base: dict) -> None:
+    label = f"vs {base_sha[:10]}" if base_sha else "(no baseline)"
+    print(f"\n{'phase':<6} {'scale':>7} {'benchmark':<56} {'seconds':>10} {'rows':>9}  {label}")
+    for r in results:
+        key = (r["phase"], r["scale"], r["name"])
+        line = f"{r['phase']:<6} {r['scale']:>6g}x {r['name']:<56} {r['seconds']:>10.4f} {r['rows']:>9,}"
+        if key in base and base[key] > 0:
+            ratio = r["seconds"] / base[key]
+            slower = ratio > SLOWER and r["seconds"] - base[key] > NOISE_FLOOR
+            line += f"  {ratio:>5.2f}x{'  !! slower' if slower else ''}"
+        if r["phase"] == "load":
+            d = r["detail"]
+            line += f"  [{d['requests']} requests, {d['errors']} errors, {d['attempts']} attempts]"
+        if not r["ok"]:
+            line += f"  WRONG{': ' + r['detail']['failure'] if r['detail'].get('failure') else ''}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phase", nargs="+", choices=("load", "query"), default=["load", "query"])
+    parser.add_argument("--load-scale", type=float, nargs="+", default=[1, 10],
+                        help="load phase scale factors (each upstream entity is one HTTP request)")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1, 100], help="query phase scale factors")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stub request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, uniformly")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests that fail")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After on the stubs' 429s")
+    parser.add_argument("--attempts", type=int, default=20, help="runs per loader before it counts as failed")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query; the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    parser.add_argument("--compare", metavar="REV", help="compare with this commit's results "
+                                                        "(default: the most recent other commit)")
+    parser.add_argument("--list", action="store_true", help="list the stored runs and exit")
+    args = parser.parse_args(argv)
+
+    conn = open_results(args.results)
+    if args.list:
+        list_runs(conn)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if "load" in args.phase:
+            for factor in args.load_scale:
+                print(f"load phase, {factor:g}x: {synth.shipped_sizes(factor)}")
+                results += run_loads(factor, Path(tmp), args)
+        if "query" in args.phase:
+            for factor in args.scale:
+                print(f"query phase, {factor:g}x")
+                results += run_queries(factor, Path(tmp), args)
+
+    run_id = save(conn, results, args)
+    base_sha, base = baseline(conn, args.compare, run_id)
+    report(results, base_sha, base)
+    print(f"\nsaved as run #{run_id} in {args.results}")
+    conn.close()
+    if not all(r["ok"] for r in results):
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Peak memory and time of writing the full pokemon scatter (no LIMIT) as one
+json.dumps string versus through the streaming writers in pipeline/writers.py.
+The same rows are also written through the query cache (pipeline/query_cache.py):
+stored whole when uncapped, streamed past QUERY_CACHE_MAX_ROWS otherwise.
+
+    python bench/bench_writers.py --scale 100     # 100k pokemon
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import synth
+from pipeline import writers
+from pipeline.paths import add_script_paths
+from pipeline.query_cache import QueryCache
+
+add_script_paths()
+import calc_outputs
+
+
+def measure(label: str, fn) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed:>7.2f}s  peak {peak / 2**20:>8.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, default=50)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        counts = synth.build(tmp / "synth.sqlite", args.scale)
+        print(f"{counts['pokemon']:,} pokemon\n")
+        conn = sqlite3.connect(tmp / "synth.sqlite")
+        rows = lambda: calc_outputs.pokemon_weight_vs_total_stats(conn)
+
+        measure("list + json.dumps", lambda: (tmp / "old.json").write_text(
+            json.dumps(list(rows()), indent=2), encoding="utf-8"))
+        measure("streaming json", lambda: writers.write(tmp / "new", rows(), calc_outputs.SCATTER_FIELDS))
+        measure("streaming ndjson", lambda: writers.write(tmp / "new", rows(), calc_outputs.SCATTER_FIELDS,
+                                                          "ndjson"))
+        for label, cache in (("query cache, uncapped", QueryCache(tmp / "qc-all.sqlite", max_rows=2**30)),
+                             ("query cache, capped", QueryCache(tmp / "qc.sqlite"))):
+            measure(label, lambda: writers.write(tmp / "cached", cached_scatter(conn, cache),
+                                                 calc_outputs.SCATTER_FIELDS))
+            cache.close()
+        conn.close()
+        same = (tmp / "old.json").read_bytes() == (tmp / "new.json").read_bytes()
+        print(f"\njson output identical: {same}")
+        if not same:
+            sys.exit(1)
+
+
+def cached_scatter(conn, cache: QueryCache):
+    fields = [name for name, _ in calc_outputs.SCATTER_FIELDS]
+    for row in cache.iter_rows(conn, SCATTER_SQL):
+        yield dict(zip(fields, row))
+
+
+SCATTER_SQL = """
+    SELECT p.pokemon_id, p.name, p.weight, t.total_stats
+    FROM pokemon p
+    JOIN pokemon_total_stats t ON t.pokemon_id = p.pokemon_id
+    ORDER BY p.pokemon_id
+"""
+
+
+if __name__ == "__main__":
+    main()
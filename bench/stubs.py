@@ -0,0 +1,339 @@
+"""Local stand-ins for the upstream APIs, used by the benchmark scripts.
+
+A StubServer serves canned responses from a route function on 127.0.0.1 and
+counts every request it receives. Each request can be delayed by `latency`
+seconds plus up to `jitter` more, and `error_rate` of them fail before
+reaching the route: half with 429 + Retry-After, half with a bare 503.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+WRITE_CHUNK = 1 << 20
+
+
+class StubServer:
+    def __init__(self, route, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 retry_after: float = 0.1, seed: int = 0):
+        # route(path, headers) -> (status, headers_dict, body_bytes)
+        self.route = route
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    delay = stub.latency + stub._rng.uniform(0, stub.jitter) if stub.jitter else stub.latency
+                    roll = stub._rng.random() if stub.error_rate else 1.0
+                    stub.errors += roll < stub.error_rate
+                if delay:
+                    time.sleep(delay)
+                if roll < stub.error_rate / 2:
+                    status, headers, body = 429, {"Retry-After": str(stub.retry_after)}, b""
+                elif roll < stub.error_rate:
+                    status, headers, body = 503, {}, b""
+                else:
+                    status, headers, body = stub.route(self.path, self.headers)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                for i in range(0, len(body), WRITE_CHUNK):
+                    self.wfile.write(body[i:i + WRITE_CHUNK])
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # streaming clients hang up once they have enough
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def json_response(obj, status: int = 200):
+    return status, {"Content-Type": "application/json"}, json.dumps(obj).encode("utf-8")
+
+
+def not_found():
+    return json_response({"detail": "Not found."}, 404)
+
+
+def with_etag(route, max_age: int | None = None):
+    """Wrap a route so 200s carry a content ETag and matching revalidations get a 304."""
+    def wrapped(path, headers):
+        status, out_headers, body = route(path, headers)
+        if status != 200:
+            return status, out_headers, body
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        out_headers = dict(out_headers, ETag=etag)
+        if max_age is not None:
+            out_headers["Cache-Control"] = f"max-age={max_age}"
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return status, out_headers, body
+    return wrapped
+
+
+@contextmanager
+def fresh_http_cache(directory):
+    """Give the loaders an empty shared HttpCache under `directory` for one run.
+
+    Without it every run after the first in a process times cache hits, and a
+    stub that reuses an earlier port gets served the earlier stub's bodies.
+    """
+    from pipeline import http_cache
+
+    cache = http_cache.HttpCache(Path(directory) / "http_cache.sqlite")
+    previous, http_cache._shared = http_cache._shared, cache
+    try:
+        yield cache
+    finally:
+        http_cache._shared = previous
+        cache.close()
+
+
+STAT_NAMES = ["hp", "attack", "defense", "special-attack", "special-defense", "speed"]
+TYPE_NAMES = ["normal", "fire", "water", "grass", "electric", "bug", "poison", "rock"]
+
+
+def fake_pokemon(pid: int) -> dict:
+    return {
+        "id": pid,
+        "name": f"pokemon-{pid}",
+        "height": 3 + pid % 20,
+        "weight": 20 + (pid * 7) % 900,
+        "base_experience": 40 + pid % 200,
+        "types": [{"slot": 1, "type": {"name": TYPE_NAMES[pid % len(TYPE_NAMES)]}}],
+        "stats": [
+            {"base_stat": 30 + (pid * (i + 3)) % 100, "effort": i % 3, "stat": {"name": n}}
+            for i, n in enumerate(STAT_NAMES)
+        ],
+    }
+
+
+def pokeapi_route(n_pokemon: int, extra_ids=(), broken_ids=(), make=fake_pokemon):
+    """PokeAPI /api/v2/pokemon/<id>/ for ids 1..n_pokemon plus `extra_ids`; 404 otherwise.
+
+    The list endpoint (/api/v2/pokemon/?limit=&offset=) pages through the same
+    ids, like the real one does across its 1025 -> 10001 jump. `broken_ids`
+    are listed but 404 when fetched. Bodies come from make(pid), called per
+    request.
+    """
+    ids = sorted(set(range(1, n_pokemon + 1)) | set(extra_ids))
+    exists = set(ids) - set(broken_ids)
+
+    def route(path, headers):
+        path, _, query = path.partition("?")
+        parts = [p for p in path.split("/") if p]
+        if parts == ["api", "v2", "pokemon"]:
+            params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+            limit = int(params.get("limit", 20))
+            offset = int(params.get("offset", 0))
+            base = f"http://{headers.get('Host')}/api/v2/pokemon/"
+            page = ids[offset:offset + limit]
+            return json_response({
+                "count": len(ids),
+                "next": f"{base}?offset={offset + limit}&limit={limit}" if offset + limit < len(ids) else None,
+                "previous": None,
+                "results": [{"name": f"pokemon-{pid}", "url": f"{base}{pid}/"} for pid in page],
+            })
+        if len(parts) == 4 and parts[:3] == ["api", "v2", "pokemon"] and parts[3].isdigit():
+            pid = int(parts[3])
+            if pid in exists:
+                return json_response(make(pid))
+        return not_found()
+    return route
+
+
+SCHOOLS = ["Abjuration", "Conjuration", "Divination", "Enchantment",
+           "Evocation", "Illusion", "Necromancy", "Transmutation"]
+
+
+def fake_spell(i: int) -> dict:
+    return {
+        "index": f"spell-{i}",
+        "name": f"Spell {i}",
+        "level": i % 10,
+        "school": {"index": SCHOOLS[i % len(SCHOOLS)].lower(), "name": SCHOOLS[i % len(SCHOOLS)]},
+    }
+
+
+def dnd5e_route(n_spells: int, fault_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0,
+                make=fake_spell):
+    """dnd5eapi /api/2014/spells list and detail pages.
+
+    With fault_rate > 0, that fraction of detail requests fails: half with
+    429 + Retry-After, half with a bare 503.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def route(path, headers):
+        parts = [p for p in path.split("/") if p]
+        if parts == ["api", "2014", "spells"]:
+            return json_response({
+                "count": n_spells,
+                "results": [{"index": f"spell-{i}", "name": f"Spell {i}", "url": f"/api/2014/spells/spell-{i}"}
+                            for i in range(n_spells)],
+            })
+        if len(parts) == 4 and parts[:3] == ["api", "2014", "spells"] and parts[3].startswith("spell-"):
+            with lock:
+                roll = rng.random()
+            if roll < fault_rate / 2:
+                return 429, {"Retry-After": str(retry_after)}, b""
+            if roll < fault_rate:
+                return 503, {}, b""
+            return json_response(make(int(parts[3].split("-", 1)[1])))
+        return not_found()
+    return route
+
+
+def pokedex_html(n_rows: int) -> str:
+    """A pokemondb.net/pokedex/all lookalike: table#pokedex with n_rows forms."""
+    rows = []
+    for i in range(n_rows):
+        dex = i // 2 + 1
+        types = TYPE_NAMES[i % len(TYPE_NAMES)], TYPE_NAMES[(i * 3 + 1) % len(TYPE_NAMES)]
+        form = f'<br><small class="text-muted">Mega Form {i}</small>' if i % 2 else ""
+        rows.append(
+            f'<tr><td class="cell-num cell-fixed" data-sort-value="{dex}">'
+            f'<picture class="infocard-cell-img"><img class="img-fixed icon-pkmn" src="/s/{dex}.png" alt="Mon {dex}"></picture>'
+            f'<span class="infocard-cell-data">{dex:04d}</span></td>'
+            f'<td class="cell-name"><a class="ent-name" href="/pokedex/mon-{dex}">Mon {dex}</a>{form}</td>'
+            f'<td class="cell-icon"><a class="type-icon type-{types[0]}" href="/type/{types[0]}">{types[0].title()}</a><br> '
+            f'<a class="type-icon type-{types[1]}" href="/type/{types[1]}">{types[1].title()}</a> </td>'
+            + "".join(f'<td class="cell-num">{(i * k) % 150 + 20}</td>' for k in range(1, 8))
+            + "</tr>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Pok&eacute;mon Pok&eacute;dex</title></head><body>"
+        "<main><h1>Pok&eacute;dex</h1><table id=\"pokedex\" class=\"data-table\"><thead><tr>"
+        "<th>#</th><th>Name</th><th>Type</th><th>Total</th><th>HP</th><th>Attack</th>"
+        "<th>Defense</th><th>Sp. Atk</th><th>Sp. Def</th><th>Speed</th></tr></thead><tbody>"
+        + "".join(rows)
+        + "</tbody></table></main><footer><table><tr><td>a</td><td>b</td><td>c</td></tr></table></footer></body></html>"
+    )
+
+
+def pokedex_route(html: bytes):
+    """pokemondb.net/pokedex/all serving `html` (see pokedex_html)."""
+    def route(path, headers):
+        if path.rstrip("/") == "/pokedex/all":
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, html
+        return not_found()
+    return route
+
+
+GROUP_NAMES = ["Jelly Belly Official Flavors", "Sport Beans", "Sugar-Free", "Soda Pop Shoppe",
+               "BeanBoozled", "Cocktail Classics", "Gourmet Jelly Bean"]
+
+
+def fake_bean(bean_id: int) -> dict:
+    return {
+        "beanId": bean_id,
+        "flavorName": f"Flavor {bean_id}",
+        "groupName": [GROUP_NAMES[bean_id % len(GROUP_NAMES)]]
+                     + ([GROUP_NAMES[(bean_id * 3) % len(GROUP_NAMES)]] if bean_id % 4 == 0 else []),
+        "sugarFree": bean_id % 5 == 0,
+        "glutenFree": True,
+        "kosher": bean_id % 2 == 0,
+        "imageUrl": f"https://example.invalid/beans/{bean_id}.png",
+    }
+
+
+def jellybelly_route(n_beans: int, paged: bool = True, make=fake_bean):
+    """Jelly Belly wiki /api/Beans: paged list (?pageIndex=&pageSize=) and /api/Beans/<id>.
+
+    With paged=False the list endpoint 404s, as if only per-id lookups existed.
+    """
+    def route(path, headers):
+        path, _, query = path.partition("?")
+        parts = [p for p in path.split("/") if p]
+        if parts == ["api", "Beans"] and paged:
+            params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+            page = int(params.get("pageIndex", 1))
+            size = int(params.get("pageSize", 10))
+            first = (page - 1) * size + 1
+            return json_response({
+                "totalCount": n_beans,
+                "pageSize": size,
+                "currentPage": page,
+                "totalPages": -(-n_beans // size),
+                "items": [make(i) for i in range(first, min(first + size, n_beans + 1))],
+            })
+        if len(parts) == 3 and parts[:2] == ["api", "Beans"] and parts[2].isdigit():
+            bean_id = int(parts[2])
+            if 1 <= bean_id <= n_beans:
+                return json_response(make(bean_id))
+        return not_found()
+    return route
+
+
+FRUIT_FAMILIES = ["Rosaceae", "Rutaceae", "Musaceae", "Vitaceae", "Moraceae", "Anacardiaceae",
+                  "Bromeliaceae", "Ericaceae", "Cucurbitaceae", "Lythraceae"]
+
+
+def fake_fruit(fruit_id: int) -> dict:
+    return {
+        "name": f"Fruit {fruit_id}",
+        "id": fruit_id,
+        "family": FRUIT_FAMILIES[fruit_id % len(FRUIT_FAMILIES)],
+        "order": "Rosales",
+        "genus": f"Genus{fruit_id % 97}",
+        "nutritions": {
+            "calories": 20 + fruit_id % 80,
+            "fat": round((fruit_id % 13) / 10, 1),
+            "sugar": round((fruit_id % 170) / 10, 1),
+            "carbohydrates": round((fruit_id % 250) / 10, 1),
+            "protein": round((fruit_id % 30) / 10, 1),
+        },
+    }
+
+
+def fruityvice_body(n_fruits: int, make=fake_fruit) -> bytes:
+    """/api/fruit/all as Fruityvice serves it: one JSON array of every fruit."""
+    return b"[" + b",".join(json.dumps(make(i)).encode() for i in range(1, n_fruits + 1)) + b"]"
+
+
+def fruityvice_route(body: bytes):
+    def route(path, headers):
+        if path.rstrip("/") == "/api/fruit/all":
+            return 200, {"Content-Type": "application/json"}, body
+        return not_found()
+    return route
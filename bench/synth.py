@@ -0,0 +1,175 @@
+"""Synthetic databases for the benchmarks.
+
+fill(conn, scale) populates every source table with `scale` times a base
+catalog (1,000 pokemon / 500 fruits / 1,000 web rows / 300 spells / 100
+beans), or with explicit `sizes` such as shipped_sizes(100) for 100x the
+project database. The distributions are skewed the way the real data is:
+
+  - types, fruit families, spell schools and bean groups are Zipf-ish
+  - low spell levels are the common ones
+  - most pokemondb rows share their PokeAPI twin's name and types; the
+    rest only match by dex number, or disagree on types
+
+build() also writes what later migrations derive from the sources: the
+bean group bridge, content hashes, and pokemon_xref (by running the real
+reconcile over the filled tables).
+"""
+import hashlib
+import random
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from pipeline.migrations import LATEST, migrate
+from pipeline.paths import add_script_paths
+from stubs import GROUP_NAMES, SCHOOLS, STAT_NAMES
+
+TYPES = ["water", "normal", "grass", "bug", "psychic", "fire", "electric", "rock", "poison", "ground",
+         "dark", "fighting", "ghost", "dragon", "steel", "ice", "fairy", "flying"]
+NUTRIENTS = ["carbohydrates", "protein", "fat", "calories", "sugar"]
+
+BASE_POKEMON = 1000
+BASE_FRUITS = 500
+BASE_WEB = 1000
+BASE_SPELLS = 300
+BASE_BEANS = 100
+N_FAMILIES = 40
+WEB_SAME_NAME = 0.9     # pokemondb rows named like their PokeAPI twin
+WEB_SAME_TYPES = 0.95   # ... and typed like it
+# fact tables only; the aggregate triggers would otherwise fire per fill row
+FACT_TABLES_VERSION = 6
+# content hashes and pokemon_xref go in before the table change counters
+# (migration 12), for the same reason
+DERIVED_VERSION = 11
+
+# row counts of the shipped GamerSoups_final_project.sqlite
+SHIPPED = {"pokemon": 100, "fruits": 49, "web": 100, "spells": 319, "beans": 25}
+HASHED_TABLES = {"pokemon": "pokemon_id", "fruits": "fruit_id", "web_pokemon": "dex_num",
+                 "spells": "id", "Beans": "id"}
+
+
+def shipped_sizes(factor: float) -> dict:
+    """fill() sizes for `factor` times the project database."""
+    return {k: max(int(n * factor), 1) for k, n in SHIPPED.items()}
+
+
+def create_all(conn: sqlite3.Connection) -> None:
+    migrate(conn, FACT_TABLES_VERSION)
+
+
+def skewed(rng: random.Random, items):
+    # Zipf-ish: earlier items are much more common, like real type/family counts
+    return items[min(int(rng.paretovariate(1.2)) - 1, len(items) - 1)]
+
+
+def level(rng: random.Random) -> int:
+    # levels.id for level_num 0..9, cantrips through 3rd level the most common
+    return int(rng.expovariate(0.35)) % 10 + 1
+
+
+def fill(conn: sqlite3.Connection, scale: float = 1.0, seed: int = 0, sizes: dict = None) -> dict:
+    rng = random.Random(seed)
+    sizes = sizes or {}
+    n_pokemon = sizes.get("pokemon", int(BASE_POKEMON * scale))
+    n_fruits = sizes.get("fruits", int(BASE_FRUITS * scale))
+    n_web = sizes.get("web", int(BASE_WEB * scale))
+    n_spells = sizes.get("spells", int(BASE_SPELLS * scale))
+    n_beans = sizes.get("beans", int(BASE_BEANS * scale))
+
+    conn.executemany("INSERT OR IGNORE INTO stat_dim(stat_id, stat_name) VALUES (?, ?)",
+                     enumerate(STAT_NAMES, start=1))
+    conn.executemany("INSERT INTO pokemon VALUES (?, ?, ?, ?, ?)",
+                     ((i, f"pokemon-{i}", rng.randint(2, 200), rng.randint(1, 9999), rng.randint(36, 340))
+                      for i in range(1, n_pokemon + 1)))
+    types = [(i, skewed(rng, TYPES), rng.choice(TYPES)) for i in range(1, n_pokemon + 1)]
+    conn.executemany("INSERT INTO pokemon_type VALUES (?, 1, ?)", ((i, t1) for i, t1, _ in types))
+    conn.executemany("INSERT INTO pokemon_type VALUES (?, 2, ?)",
+                     ((i, t2) for i, t1, t2 in types if t2 != t1 and i % 2))
+    conn.executemany("INSERT INTO pokemon_stat VALUES (?, ?, ?, ?)",
+                     ((i, s, rng.randint(5, 255), rng.randint(0, 3))
+                      for i in range(1, n_pokemon + 1) for s in range(1, len(STAT_NAMES) + 1)))
+
+    families = [f"Family{j}aceae" for j in range(N_FAMILIES)]
+    conn.executemany("INSERT INTO fruit_family(family_id, family_name) VALUES (?, ?)",
+                     enumerate(families, start=1))
+    conn.executemany("INSERT INTO nutrient_dim(nutrient_id, nutrient_name) VALUES (?, ?)",
+                     enumerate(NUTRIENTS, start=1))
+    conn.executemany("INSERT INTO fruits VALUES (?, ?)", ((i, f"fruit-{i}") for i in range(1, n_fruits + 1)))
+    nutrition = [(i, families.index(skewed(rng, families)) + 1, "Genus", "Order",
+                  round(rng.uniform(0, 30), 1), round(rng.uniform(0, 3), 1), round(rng.uniform(0, 1), 2),
+                  rng.randint(10, 200), round(rng.uniform(0, 25), 1))
+                 for i in range(1, n_fruits + 1)]
+    conn.executemany("INSERT INTO fruityvice_nutrition VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", nutrition)
+    conn.executemany("INSERT INTO fruit_nutrient_long VALUES (?, ?, ?)",
+                     ((row[0], k + 1, row[4 + k]) for row in nutrition for k in range(len(NUTRIENTS))))
+    # the wiki tables predate the loaders and are only ever lightly filled
+    conn.executemany("INSERT INTO wiki_fruit_info VALUES (?, ?, ?)",
+                     ((i, f"https://en.wikipedia.org/wiki/Fruit_{i}", None if i % 3 else f"note {i}")
+                      for i in range(1, n_fruits + 1, 10)))
+    conn.executemany("INSERT INTO scraped_fruit_rows(source_page, item_name, item_value) VALUES (?, ?, ?)",
+                     ((f"page-{skewed(rng, families)}", f"item-{i}", str(rng.randint(0, 100)))
+                      for i in range(n_fruits // 5)))
+
+    def web_row(i):
+        twin = i <= n_pokemon
+        name = f"Pokemon {i}" if twin and rng.random() < WEB_SAME_NAME else f"Mon {i}"
+        if twin and rng.random() < WEB_SAME_TYPES:
+            _, t1, t2 = types[i - 1]
+            slots = [t1] + ([t2] if t2 != t1 and i % 2 else [])
+        else:
+            slots = [skewed(rng, TYPES)] + ([skewed(rng, TYPES)] if i % 3 == 0 else [])
+        return name, slots
+
+    web = [(i, *web_row(i)) for i in range(1, n_web + 1)]
+    conn.executemany("INSERT INTO web_type_dim(type_id, type_name) VALUES (?, ?)", enumerate(TYPES, start=1))
+    conn.executemany("INSERT INTO web_pokemon VALUES (?, ?)", ((i, name) for i, name, _ in web))
+    conn.executemany("INSERT INTO web_pokemon_type VALUES (?, ?, ?)",
+                     ((i, slot, TYPES.index(t) + 1) for i, _, slots in web for slot, t in enumerate(slots, 1)))
+
+    conn.executemany("INSERT INTO schools(id, name) VALUES (?, ?)", enumerate(SCHOOLS, start=1))
+    conn.executemany("INSERT INTO levels(id, level_num) VALUES (?, ?)", ((n + 1, n) for n in range(10)))
+    conn.executemany("INSERT INTO spells(api_index, name, school_id, level_id) VALUES (?, ?, ?, ?)",
+                     ((f"spell-{i}", f"Spell {i}", SCHOOLS.index(skewed(rng, SCHOOLS)) + 1, level(rng))
+                      for i in range(n_spells)))
+
+    def groups():
+        picked = {skewed(rng, GROUP_NAMES) for _ in range(min(int(rng.paretovariate(2)), 3))}
+        return ", ".join(sorted(picked, key=GROUP_NAMES.index))
+
+    conn.executemany("INSERT INTO Beans(id, name, groupName, sugarFree) VALUES (?, ?, ?, ?)",
+                     ((i, f"Flavor {i}", groups(), rng.random() < 0.2) for i in range(1, n_beans + 1)))
+    conn.commit()
+    return {"pokemon": n_pokemon, "pokemon_stat": n_pokemon * len(STAT_NAMES), "fruits": n_fruits,
+            "fruit_nutrient_long": n_fruits * len(NUTRIENTS), "web_pokemon": n_web, "spells": n_spells,
+            "beans": n_beans}
+
+
+def fill_derived(conn: sqlite3.Connection, seed: int = 0) -> dict:
+    """Content hashes on every entity, then pokemon_xref from the real reconcile."""
+    conn.create_function("synth_hash", 2, lambda table, key: hashlib.sha256(f"{seed}:{table}:{key}".encode())
+                         .hexdigest(), deterministic=True)
+    for table, key in HASHED_TABLES.items():
+        conn.execute(f"UPDATE {table} SET content_hash = synth_hash('{table}', {key})")
+    conn.commit()
+
+    add_script_paths()
+    import reconcile_pokemon
+    return {"pokemon_xref": reconcile_pokemon.reconcile(conn, incremental=False)["probed"]}
+
+
+def build(path: Path, scale: float = 1.0, seed: int = 0, version: int = LATEST, sizes: dict = None) -> dict:
+    """Fill a fresh database at `path`, then migrate it up to `version`."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF;")
+    conn.execute("PRAGMA synchronous=OFF;")
+    create_all(conn)
+    counts = fill(conn, scale, seed, sizes)
+    if version >= DERIVED_VERSION:
+        migrate(conn, DERIVED_VERSION)
+        counts.update(fill_derived(conn, seed))
+    migrate(conn, version)
+    conn.close()
+    return counts
@@ -1,22 +1,28 @@
+import argparse
 import sqlite3
-from typing import Dict, List, Tuple
+import sys
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
-import matplotlib.pyplot as plt
-import seaborn as sns
 
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.db import connect
+from pipeline.metrics import recorded
+from pipeline.query_cache import cached_rows
+from pipeline.render import Chart, render_all, report
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
+OUT_DIR = Path(__file__).resolve().parents[1] / "output"
 
 
 def connect_db(path: str = DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(path)
-    conn.execute("PRAGMA foreign_keys=ON;")
-    return conn
+    return connect(path)
 
 
 def spells_by_school_counts(conn: sqlite3.Connection) -> List[Tuple[str, int]]:
     # JOIN spells -> schools
-    return conn.execute(
+    return cached_rows(
+        conn,
         """
         SELECT sc.name AS school, COUNT(*) AS n
         FROM spells sp
@@ -24,11 +30,12 @@ def spells_by_school_counts(conn: sqlite3.Connection) -> List[Tuple[str, int]]:
         GROUP BY sc.name
         ORDER BY n DESC
         """
-    ).fetchall()
+    )
 
 
 def grouped_counts_by_school_level_bucket(conn: sqlite3.Connection) -> List[Tuple[str, str, int]]:
-    return conn.execute(
+    return cached_rows(
+        conn,
         """
         SELECT
             sc.name AS school,
@@ -46,7 +53,7 @@ def grouped_counts_by_school_level_bucket(conn: sqlite3.Connection) -> List[Tupl
         HAVING bucket IN ('1–5', '6–9')
         ORDER BY sc.name, bucket
         """
-    ).fetchall()
+    )
 
 
 def write_text_summary(
@@ -78,10 +85,19 @@ def write_text_summary(
     print(f"Wrote {out_path}")
 
 
-def pie_spells_by_school(school_counts: List[Tuple[str, int]], out_path: str = "spells_by_school_pie.png") -> None:
+def seaborn_rc(style: str) -> Dict[str, object]:
+    # what sns.set_theme(style=..., context="talk") would set, scoped to one
+    # render; a Chart theme, so it only runs in the render worker
+    import seaborn as sns
+
+    return {**sns.axes_style(style), **sns.plotting_context("talk")}
+
+
+def pie_spells_by_school(fig, school_counts: List[Tuple[str, int]]) -> None:
+    import seaborn as sns
+
     # Pastel look
-    sns.set_theme(style="white", context="talk")
-    plt.figure(figsize=(9, 7))
+    ax = fig.add_subplot()
 
     total = sum(n for _, n in school_counts)
     top = school_counts[:10]
@@ -93,7 +109,7 @@ def pie_spells_by_school(school_counts: List[Tuple[str, int]], out_path: str = "
     # pastel palette (matplotlib will cycle, we can supply explicit pastel colors via seaborn)
     colors = sns.color_palette("pastel", n_colors=len(values))
 
-    plt.pie(
+    ax.pie(
         values,
         labels=labels,
         autopct="%1.1f%%",
@@ -102,14 +118,13 @@ def pie_spells_by_school(school_counts: List[Tuple[str, int]], out_path: str = "
         wedgeprops={"linewidth": 1, "edgecolor": "white"},
         pctdistance=0.75,
     )
-    plt.title("Spells by School (Percent)", fontsize=16, fontweight="bold")
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=220)
-    plt.close()
-    print(f"Saved {out_path}")
+    ax.set_title("Spells by School (Percent)", fontsize=16, fontweight="bold")
+    fig.tight_layout()
 
 
-def pastel_grouped_bar(bucket_counts: List[Tuple[str, str, int]], out_path: str = "spells_level_buckets_by_school.png") -> None:
+def pastel_grouped_bar(fig, bucket_counts: List[Tuple[str, str, int]]) -> None:
+    import seaborn as sns
+
     schools: List[str] = []
     buckets: List[str] = []
     counts: List[int] = []
@@ -118,45 +133,77 @@ def pastel_grouped_bar(bucket_counts: List[Tuple[str, str, int]], out_path: str
         buckets.append(bucket)
         counts.append(n)
 
-    sns.set_theme(style="whitegrid", context="talk")
-    plt.figure(figsize=(14, 8))
-
-    ax = sns.barplot(
+    ax = fig.add_subplot()
+    sns.barplot(
         x=schools,
         y=counts,
         hue=buckets,
         palette=sns.color_palette("pastel", 2),
+        ax=ax,
     )
 
     ax.set_title("Spells by School: Low-Level (1–5) vs High-Level (6–9)", fontsize=16, fontweight="bold")
     ax.set_xlabel("School")
     ax.set_ylabel("Number of spells")
-    plt.xticks(rotation=35, ha="right")
-    plt.legend(title="Spell Level Bucket")
-
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=220)
-    plt.close()
-    print(f"Saved {out_path}")
+    ax.tick_params(axis="x", labelrotation=35)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    ax.legend(title="Spell Level Bucket")
+
+    fig.tight_layout()
+
+
+def charts(conn: sqlite3.Connection, out_dir: Optional[Path] = None,
+           counts: Optional[Tuple[list, list]] = None) -> List[Chart]:
+    """The spell charts; `counts` is (school_counts, bucket_counts) when the
+    caller already has them (main() on either backend), else they are queried."""
+    out_dir = OUT_DIR if out_dir is None else out_dir
+    if counts is None:
+        counts = spells_by_school_counts(conn), grouped_counts_by_school_level_bucket(conn)
+    school_counts = [list(r) for r in counts[0]]
+    bucket_counts = [list(r) for r in counts[1]]
+    if not school_counts:
+        return []
+    return [
+        Chart(out_dir / "spells_by_school_pie.png", pie_spells_by_school, school_counts,
+              figsize=(9, 7), dpi=220, theme=seaborn_rc, theme_args=("white",)),
+        Chart(out_dir / "spells_level_buckets_by_school.png", pastel_grouped_bar, bucket_counts,
+              figsize=(14, 8), dpi=220, theme=seaborn_rc, theme_args=("whitegrid",)),
+    ]
+
+
+@recorded("spells-report")
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Write the spell summary and charts to corey/output/.")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render even if the data is unchanged")
+    parser.add_argument("--backend", choices=("sql", "columnar"), default="sql",
+                        help="count in SQLite or in NumPy (pipeline/columnar.py)")
+    args = parser.parse_args(argv)
 
-
-def main() -> None:
     conn = connect_db(DB_PATH)
     try:
-        school_counts = spells_by_school_counts(conn)
-        bucket_counts = grouped_counts_by_school_level_bucket(conn)
+        if args.backend == "columnar":
+            from pipeline.columnar import ColumnarStore
+            store = ColumnarStore.load(conn)
+            school_counts = store.spells_by_school_counts()
+            bucket_counts = store.grouped_counts_by_school_level_bucket()
+        else:
+            school_counts = spells_by_school_counts(conn)
+            bucket_counts = grouped_counts_by_school_level_bucket(conn)
 
         if not school_counts:
             print("No spells found. Run ingest_to_db.py multiple times first (until you have 100+ spells).")
             return
 
-        write_text_summary(school_counts, bucket_counts, Path(__file__).resolve().parents[1] / "output" / "spell_summary.txt")
-        pie_spells_by_school(school_counts, Path(__file__).resolve().parents[1] / "output" / "spells_by_school_pie.png")
-        pastel_grouped_bar(bucket_counts, Path(__file__).resolve().parents[1] / "output" / "spells_level_buckets_by_school.png")
+        write_text_summary(school_counts, bucket_counts, OUT_DIR / "spell_summary.txt")
+        chart_set = charts(conn, counts=(school_counts, bucket_counts))
 
     finally:
         conn.close()
 
+    report(render_all(chart_set, args.workers, args.force))
+
 
 if __name__ == "__main__":
     main()
@@ -1,33 +1,107 @@
 import random
+import sys
+import threading
 import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
 from typing import Dict, List, Optional
 
 import requests
 
-API_ROOT_2014 = "https://www.dnd5eapi.co/api/2014"
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from pipeline.http_cache import OfflineMiss, cached_get
+from pipeline.metrics import count, span
+
+API_HOST = "https://www.dnd5eapi.co"
+API_ROOT_2014 = f"{API_HOST}/api/2014"
 TRANSIENT_HTTP = {429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
 
 
+class TokenBucket:
+    """Thread-safe rate limiter shared by every worker in a run.
+
+    Tokens refill at `rate` per second up to `capacity`. pause() stops all
+    acquisitions until the given time has passed, which is how a 429's
+    Retry-After is honored without each worker hammering the API on its own.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(int(rate), 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after_seconds(r: requests.Response) -> Optional[float]:
+    value = r.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        # HTTP-date form
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
 def get_json_with_retries(
     session: requests.Session,
     url: str,
     timeout: int = 30,
     max_retries: int = 8,
     base_sleep: float = 1.0,
+    limiter: Optional[TokenBucket] = None,
 ) -> Dict:
     last_exc: Optional[Exception] = None
     for attempt in range(1, max_retries + 1):
+        retry_after = None
         try:
-            r = session.get(url, timeout=timeout)
+            if limiter is not None:
+                limiter.acquire()
+            r = cached_get(url, session=session, timeout=timeout)
             if r.status_code in TRANSIENT_HTTP:
+                if r.status_code == 429:
+                    retry_after = retry_after_seconds(r)
                 raise requests.HTTPError(f"Transient HTTP {r.status_code}")
             r.raise_for_status()
-            return r.json()
+            with span("parse.json"):
+                return r.json()
+        except OfflineMiss:
+            raise
         except (requests.Timeout, requests.ConnectionError, requests.HTTPError, ValueError) as e:
             last_exc = e
-            sleep_s = min(base_sleep * (2 ** (attempt - 1)), 60.0) + random.uniform(0, 0.5)
+            if retry_after is not None:
+                sleep_s = retry_after
+            else:
+                sleep_s = min(base_sleep * (2 ** (attempt - 1)), 60.0) + random.uniform(0, 0.5)
             print(f"[retry {attempt}/{max_retries}] {e} -> sleeping {sleep_s:.2f}s")
-            time.sleep(sleep_s)
+            count("http.retries")
+            count("http.backoff_s", sleep_s)
+            if limiter is not None and retry_after is not None:
+                # server-wide throttle: hold every worker, not just this one
+                limiter.pause(sleep_s)
+            else:
+                time.sleep(sleep_s)
 
     raise last_exc if last_exc else RuntimeError("Unknown error")
 
@@ -38,11 +112,12 @@ def list_spells(session: requests.Session) -> List[Dict]:
     return data.get("results", [])
 
 
-def fetch_spell_detail_trimmed(session: requests.Session, spell_url: str) -> Dict:
+def fetch_spell_detail_trimmed(session: requests.Session, spell_url: str,
+                               limiter: Optional[TokenBucket] = None) -> Dict:
     if not spell_url.startswith("http"):
-        spell_url = "https://www.dnd5eapi.co" + spell_url
+        spell_url = API_HOST + spell_url
 
-    detail = get_json_with_retries(session, spell_url)
+    detail = get_json_with_retries(session, spell_url, limiter=limiter)
 
     school = detail.get("school")
     school_name = None
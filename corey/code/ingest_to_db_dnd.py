@@ -1,59 +1,51 @@
+import argparse
+import math
 import sqlite3
-from typing import Dict, Optional
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-from dnd5e_api import list_spells, fetch_spell_detail_trimmed
+from dnd5e_api import TokenBucket, list_spells, fetch_spell_detail_trimmed
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.changes import UNCHANGED, ChangeTracker, content_hash
+from pipeline.db import connect
+from pipeline.dims import DimResolver
+from pipeline.http_cache import shared_cache
+from pipeline.metrics import recorded
+from pipeline.migrations import migrate
+from pipeline.progress import Progress
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 MAX_NEW_PER_RUN = 25
+FLUSH_ROWS = 500
+WORKERS = 1
+RATE_PER_SEC = 10.0
 
 
 # ----------------------------
 # DB helpers
 # ----------------------------
 def connect_db(path: str = DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(path)
-    conn.execute("PRAGMA foreign_keys=ON;")
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    return conn
+    # PRAGMAs (foreign keys, WAL, synchronous=NORMAL) and pending migrations
+    return connect(path)
 
 
 def init_schema(conn: sqlite3.Connection) -> None:
-    conn.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS schools (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS levels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            level_num INTEGER UNIQUE NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS spells (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            api_index TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            school_id INTEGER NOT NULL,
-            level_id INTEGER NOT NULL,
-            FOREIGN KEY (school_id) REFERENCES schools(id),
-            FOREIGN KEY (level_id) REFERENCES levels(id)
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_spells_school ON spells(school_id);
-        CREATE INDEX IF NOT EXISTS idx_spells_level ON spells(level_id);
-        """
-    )
-    conn.commit()
+    # schools/levels/spells live in pipeline/migrations.py (version 5)
+    migrate(conn)
 
 
-def get_or_create_id(conn: sqlite3.Connection, table: str, column: str, value: int | str) -> int:
-    cur = conn.cursor()
-    cur.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
-    cur.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,))
-    return int(cur.fetchone()[0])
+def dim_resolvers(conn: sqlite3.Connection) -> Dict[str, DimResolver]:
+    return {
+        "schools": DimResolver(conn, "schools", "name"),
+        "levels": DimResolver(conn, "levels", "level_num"),
+    }
 
 
 def spell_exists(conn: sqlite3.Connection, api_index: str) -> bool:
@@ -63,62 +55,216 @@ def spell_exists(conn: sqlite3.Connection, api_index: str) -> bool:
     ).fetchone() is not None
 
 
-def insert_spell(conn: sqlite3.Connection, spell: Dict) -> bool:
-    api_index = spell.get("api_index")
-    name = spell.get("name")
-    level = spell.get("level")
-    school = spell.get("school_name")
-
-    if not api_index or not name or level is None or not school:
-        return False
-
-    if spell_exists(conn, api_index):
-        return False
+def spell_payload(spell: Dict) -> Optional[Dict]:
+    # what a spells row stores; None when the detail is missing a field
+    name, level, school = spell.get("name"), spell.get("level"), spell.get("school_name")
+    if not spell.get("api_index") or not name or level is None or not school:
+        return None
+    return {"name": name, "level": int(level), "school": school}
 
-    school_id = get_or_create_id(conn, "schools", "name", school)
-    level_id = get_or_create_id(conn, "levels", "level_num", int(level))
 
-    conn.execute(
+def upsert_spell(writer: BulkWriter, spell: Dict, dims: Dict[str, DimResolver], digest: str) -> None:
+    writer.add(
         """
-        INSERT INTO spells (api_index, name, school_id, level_id)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO spells (api_index, name, school_id, level_id, content_hash)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(api_index) DO UPDATE SET
+            name = excluded.name, school_id = excluded.school_id,
+            level_id = excluded.level_id, content_hash = excluded.content_hash
         """,
-        (api_index, name, school_id, level_id),
+        (spell["api_index"], spell["name"], dims["schools"](spell["school_name"]),
+         dims["levels"](int(spell["level"])), digest),
     )
+    writer.checkpoint()
+
+
+def insert_spell(writer: BulkWriter, spell: Dict, dims: Optional[Dict[str, DimResolver]] = None) -> bool:
+    conn = writer.conn
+    if dims is None:
+        dims = dim_resolvers(conn)
+    payload = spell_payload(spell)
+    if payload is None or spell_exists(conn, spell["api_index"]):
+        return False
+    upsert_spell(writer, spell, dims, content_hash(payload))
     return True
 
 
-def ingest_spells_capped(conn: sqlite3.Connection, session: requests.Session, max_new: int) -> int:
+def ingest_spells_capped(conn: sqlite3.Connection, session: requests.Session, max_new: float,
+                         flush_every: int = FLUSH_ROWS, progress: Optional[Progress] = None) -> int:
     inserted = 0
-    for item in list_spells(session):
-        if inserted >= max_new:
-            break
+    dims = dim_resolvers(conn)
+    items = list_spells(session)
+    if progress is not None:
+        progress.total = len(items)
+    with BulkWriter(conn, flush_every) as writer:
+        for item in items:
+            if inserted >= max_new:
+                break
+            if progress is not None:
+                progress.update()
+
+            api_index = item.get("index")
+            url = item.get("url")
+            if not api_index or not url:
+                continue
+
+            if spell_exists(conn, api_index):
+                continue
+
+            detail = fetch_spell_detail_trimmed(session, url)
+            if insert_spell(writer, detail, dims):
+                inserted += 1
+
+    return inserted
+
+
+def _timed_fetch(session: requests.Session, url: str, limiter: Optional[TokenBucket]) -> Tuple[Dict, float]:
+    start = time.perf_counter()
+    detail = fetch_spell_detail_trimmed(session, url, limiter)
+    return detail, time.perf_counter() - start
 
-        api_index = item.get("index")
-        url = item.get("url")
-        if not api_index or not url:
-            continue
 
-        if spell_exists(conn, api_index):
-            continue
+def ingest_spells_concurrent(
+    conn: sqlite3.Connection,
+    session: requests.Session,
+    max_new: float,
+    workers: int = WORKERS,
+    limiter: Optional[TokenBucket] = None,
+    latencies: Optional[List[float]] = None,
+    flush_every: int = FLUSH_ROWS,
+    progress: Optional[Progress] = None,
+) -> int:
+    """Same result as ingest_spells_capped, with detail fetches on a thread pool.
+
+    At most `workers` fetches are in flight and all draw from the shared
+    `limiter`, so a request sleeping through its own backoff doesn't hold up
+    the rest. Only the calling thread writes to the database. Per-spell fetch
+    times (retries included) are appended to `latencies` when given.
+    """
+    missing = [
+        item["url"] for item in list_spells(session)
+        if item.get("index") and item.get("url") and not spell_exists(conn, item["index"])
+    ]
+    if progress is not None:
+        progress.total = min(len(missing), max_new)
+    urls = iter(missing)
+
+    inserted = 0
+    dims = dim_resolvers(conn)
+    with BulkWriter(conn, flush_every) as writer, ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        while inserted < max_new:
+            # never request more details than could still be inserted
+            while len(in_flight) < workers and inserted + len(in_flight) < max_new:
+                url = next(urls, None)
+                if url is None:
+                    break
+                in_flight.add(pool.submit(_timed_fetch, session, url, limiter))
+            if not in_flight:
+                break
 
-        detail = fetch_spell_detail_trimmed(session, url)
-        if insert_spell(conn, detail):
-            inserted += 1
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                detail, elapsed = fut.result()
+                if latencies is not None:
+                    latencies.append(elapsed)
+                if progress is not None:
+                    progress.update()
+                if insert_spell(writer, detail, dims):
+                    inserted += 1
 
     return inserted
 
 
-def main() -> None:
+def refresh_spells(
+    conn: sqlite3.Connection,
+    session: requests.Session,
+    workers: int = WORKERS,
+    limiter: Optional[TokenBucket] = None,
+    flush_every: int = FLUSH_ROWS,
+    progress: Optional[Progress] = None,
+) -> Dict[str, int]:
+    """Re-fetch every listed spell and write only the new and changed ones.
+
+    Details are compared with spells.content_hash by api_index; changed
+    spells are upserted in place (their id stays the same). Returns the
+    inserted / updated / unchanged counts.
+    """
+    tracker = ChangeTracker(conn, "spells", "api_index")
+    dims = dim_resolvers(conn)
+    urls = [item["url"] for item in list_spells(session) if item.get("index") and item.get("url")]
+    if progress is not None:
+        progress.total = len(urls)
+    urls = iter(urls)
+
+    with BulkWriter(conn, flush_every) as writer, ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        while True:
+            while len(in_flight) < workers:
+                url = next(urls, None)
+                if url is None:
+                    break
+                in_flight.add(pool.submit(fetch_spell_detail_trimmed, session, url, limiter))
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                detail = fut.result()
+                if progress is not None:
+                    progress.update()
+                payload = spell_payload(detail)
+                if payload is None:
+                    continue
+                status, digest = tracker.classify(detail["api_index"], payload)
+                if status != UNCHANGED:
+                    upsert_spell(writer, detail, dims, digest)
+
+    return tracker.counts
+
+
+@recorded("load-spells")
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Ingest the next batch of D&D spells.")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="concurrent detail fetches (1 = original serial loop)")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC,
+                        help="max requests/sec across all workers")
+    parser.add_argument("--full", action="store_true", help="ingest every missing spell, not just one batch")
+    parser.add_argument("--commit-every", type=int, default=FLUSH_ROWS, help="rows buffered per transaction")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-fetch every spell and rewrite only the ones whose content changed")
+    args = parser.parse_args(argv)
+    max_new = math.inf if args.full else MAX_NEW_PER_RUN
+    progress = Progress("spells") if args.full or args.refresh else None
+
     conn = connect_db(DB_PATH)
     try:
         init_schema(conn)
         with requests.Session() as session:
-            new_spells = ingest_spells_capped(conn, session, MAX_NEW_PER_RUN)
+            if args.refresh:
+                shared_cache().revalidate = True
+                session.mount("https://", HTTPAdapter(pool_maxsize=max(args.workers, 1)))
+                counts = refresh_spells(conn, session, args.workers, TokenBucket(args.rate),
+                                        args.commit_every, progress)
+            elif args.workers > 1:
+                session.mount("https://", HTTPAdapter(pool_maxsize=args.workers))
+                limiter = TokenBucket(args.rate)
+                new_spells = ingest_spells_concurrent(conn, session, max_new, args.workers, limiter,
+                                                      flush_every=args.commit_every, progress=progress)
+            else:
+                new_spells = ingest_spells_capped(conn, session, max_new, args.commit_every, progress)
             conn.commit()
+        if progress is not None:
+            progress.finish()
 
         total = conn.execute("SELECT COUNT(*) FROM spells").fetchone()[0]
-        print(f"Inserted NEW spells this run: {new_spells} (max {MAX_NEW_PER_RUN})")
+        if args.refresh:
+            print(f"Refreshed spells: {counts['inserted']} inserted, {counts['updated']} updated, "
+                  f"{counts['unchanged']} unchanged")
+            print(f"Total spells currently in DB: {total}")
+            return
+        print(f"Inserted NEW spells this run: {new_spells} ({'full sync' if args.full else f'max {MAX_NEW_PER_RUN}'})")
         print(f"Total spells currently in DB: {total}")
 
     finally:
@@ -1,47 +1,68 @@
+import argparse
 import sqlite3
+import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.db import connect
+from pipeline.metrics import recorded
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 
 NAMES = ["carbohydrates", "protein", "fat", "calories", "sugar"]
+WATERMARK_KEY = "nutrient_long_watermark"
+
+# Unpivot inside SQLite: every nutrition row joined to the five nutrient_dim
+# rows, with CASE picking the matching wide column. ORDER BY keeps the inserts
+# in primary-key order. OR IGNORE (never REPLACE) so existing long rows and the
+# family_nutrient_totals triggers are left alone.
+BACKFILL_SQL = f"""
+    INSERT OR IGNORE INTO fruit_nutrient_long(fruit_id, nutrient_id, nutrient_value)
+    SELECT fn.fruit_id, nd.nutrient_id,
+           CASE nd.nutrient_name
+               {" ".join(f"WHEN '{n}' THEN fn.{n}" for n in NAMES)}
+           END
+    FROM fruityvice_nutrition fn
+    JOIN nutrient_dim nd ON nd.nutrient_name IN ({", ".join(f"'{n}'" for n in NAMES)})
+    WHERE fn.fruit_id > ?
+    ORDER BY fn.fruit_id, nd.nutrient_id
+"""
+
+def ensure_nutrients(conn: sqlite3.Connection) -> None:
+    conn.executemany("INSERT OR IGNORE INTO nutrient_dim(nutrient_name) VALUES (?)", [(n,) for n in NAMES])
+
+def get_watermark(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (WATERMARK_KEY,)).fetchone()
+    return int(row[0]) if row else 0
+
+def backfill(conn: sqlite3.Connection, incremental: bool = True) -> tuple:
+    """Pivot fruityvice_nutrition into fruit_nutrient_long in one transaction.
+
+    Incremental runs only look at fruit_ids above the watermark stored in meta;
+    returns (rows inserted, new watermark). load_fruityvice.py writes the long
+    rows itself as it loads, so this is for rows that predate that or were
+    added some other way; use --full if those may sit below the watermark.
+    """
+    with conn:
+        since = get_watermark(conn) if incremental else 0
+        ensure_nutrients(conn)
+        inserted = conn.execute(BACKFILL_SQL, (since,)).rowcount
+        high = conn.execute("SELECT COALESCE(MAX(fruit_id), 0) FROM fruityvice_nutrition").fetchone()[0]
+        watermark = max(since, high)
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)", (WATERMARK_KEY, str(watermark)))
+    return inserted, watermark
+
+@recorded("backfill-nutrients")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy the wide Fruityvice nutrient columns into fruit_nutrient_long.")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and rescan every fruit")
+    args = parser.parse_args(argv)
 
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
-
-    for n in NAMES:
-        conn.execute("INSERT OR IGNORE INTO nutrient_dim(nutrient_name) VALUES (?)", (n,))
-    conn.commit()
-
-    nutrient_ids = {
-        name: conn.execute("SELECT nutrient_id FROM nutrient_dim WHERE nutrient_name = ?", (name,)).fetchone()[0]
-        for name in NAMES
-    }
-
-    rows = conn.execute("""
-        SELECT fruit_id, carbohydrates, protein, fat, calories, sugar
-        FROM fruityvice_nutrition
-    """).fetchall()
-
-    inserted = 0
-    for fruit_id, carbs, protein, fat, calories, sugar in rows:
-        values = {
-            "carbohydrates": carbs,
-            "protein": protein,
-            "fat": fat,
-            "calories": calories,
-            "sugar": sugar
-        }
-        for name, val in values.items():
-            cur = conn.execute("""
-                INSERT OR IGNORE INTO fruit_nutrient_long(fruit_id, nutrient_id, nutrient_value)
-                VALUES (?, ?, ?)
-            """, (fruit_id, nutrient_ids[name], val))
-            inserted += cur.rowcount
-
-    conn.commit()
+    conn = connect(DB_PATH)
+    inserted, watermark = backfill(conn, incremental=not args.full)
     conn.close()
-    print(f"Inserted {inserted} fruit_nutrient_long rows.")
+    print(f"Inserted {inserted} fruit_nutrient_long rows. Watermark = fruit_id {watermark}.")
 
 if __name__ == "__main__":
     main()
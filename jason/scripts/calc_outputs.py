@@ -1,65 +1,126 @@
-import csv
-import json
-import sqlite3
+import argparse
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.metrics import recorded, span
+from pipeline.pool import ConnectionPool
+from pipeline.query_cache import cached_iter
+from pipeline import writers
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 OUT_DIR = Path(__file__).resolve().parents[1] / "outputs"
+SCATTER_LIMIT = 200
+
+# column types for the binary output formats (pipeline/writers.py)
+TYPE_AVG_FIELDS = [("type", "str"), ("avg_total_stats", "float"), ("count", "int")]
+SCATTER_FIELDS = [("pokemon_id", "int"), ("name", "str"), ("weight", "int"), ("total_stats", "int")]
+FAMILY_AVG_FIELDS = [("family", "str"), ("nutrient", "str"), ("avg_value", "float"), ("rows", "int")]
+TOP_SUGAR_FIELDS = [("fruit", "str"), ("family", "str"), ("sugar", "float")]
+TYPE_COUNT_FIELDS = [("type", "str"), ("count", "int")]
+
+# shared with make_viz's chart, so both hit the same query cache entry
+WEB_PRIMARY_TYPE_COUNTS = """
+    SELECT td.type_name, COUNT(*) AS n
+    FROM web_pokemon_type wpt
+    JOIN web_type_dim td ON td.type_id = wpt.type_id
+    WHERE wpt.slot = 1
+    GROUP BY td.type_name
+    ORDER BY n DESC, td.type_name;
+"""
 
 def ensure_outdir():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-def pokemon_avg_total_stats_by_type(conn):
-    rows = conn.execute("""
-        SELECT pt.type_name,
-               AVG(s.total_stats) AS avg_total_stats,
-               COUNT(*) AS pokemon_count
-        FROM (
-            SELECT ps.pokemon_id, SUM(ps.base_stat) AS total_stats
-            FROM pokemon_stat ps
-            GROUP BY ps.pokemon_id
-        ) s
-        JOIN pokemon_type pt ON pt.pokemon_id = s.pokemon_id AND pt.slot = 1
-        GROUP BY pt.type_name
-        ORDER BY avg_total_stats DESC;
-    """).fetchall()
-
-    out = [{"type": t, "avg_total_stats": float(avg), "count": int(c)} for (t, avg, c) in rows]
-    return out
-
-def pokemon_weight_vs_total_stats(conn):
-    rows = conn.execute("""
-        SELECT p.pokemon_id, p.name, p.weight,
-               SUM(ps.base_stat) AS total_stats
-        FROM pokemon p
-        JOIN pokemon_stat ps ON ps.pokemon_id = p.pokemon_id
-        GROUP BY p.pokemon_id
-        ORDER BY p.pokemon_id;
-    """).fetchall()
-
-    out = [{"pokemon_id": int(pid), "name": name, "weight": w, "total_stats": int(ts)}
-           for (pid, name, w, ts) in rows]
-    return out
-
-def fruit_avg_nutrients_by_family(conn):
-    rows = conn.execute("""
-        SELECT ff.family_name, nd.nutrient_name,
-               AVG(fnl.nutrient_value) AS avg_value,
-               COUNT(*) AS n_rows
-        FROM fruit_nutrient_long fnl
-        JOIN nutrient_dim nd ON nd.nutrient_id = fnl.nutrient_id
-        JOIN fruityvice_nutrition fn ON fn.fruit_id = fnl.fruit_id
-        JOIN fruit_family ff ON ff.family_id = fn.family_id
-        GROUP BY ff.family_name, nd.nutrient_name
-        ORDER BY ff.family_name, nd.nutrient_name;
-    """).fetchall()
+def has_aggregates(conn):
+    # summary tables come from migration 7 (pipeline/migrations.py)
+    return conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND name IN ('pokemon_total_stats', 'type_stat_totals', 'family_nutrient_totals')"
+    ).fetchone()[0] == 3
 
-    out = [{"family": fam, "nutrient": nut, "avg_value": (None if avg is None else float(avg)), "rows": int(n)}
-           for (fam, nut, avg, n) in rows]
-    return out
+def pokemon_avg_total_stats_by_type(conn, materialized=True):
+    if materialized:
+        rows = cached_iter(conn, """
+            SELECT type_name,
+                   CAST(sum_total_stats AS REAL) / pokemon_count AS avg_total_stats,
+                   pokemon_count
+            FROM type_stat_totals
+            WHERE pokemon_count > 0
+            ORDER BY avg_total_stats DESC;
+        """)
+    else:
+        rows = cached_iter(conn, """
+            SELECT pt.type_name,
+                   AVG(s.total_stats) AS avg_total_stats,
+                   COUNT(*) AS pokemon_count
+            FROM (
+                SELECT ps.pokemon_id, SUM(ps.base_stat) AS total_stats
+                FROM pokemon_stat ps
+                GROUP BY ps.pokemon_id
+            ) s
+            JOIN pokemon_type pt ON pt.pokemon_id = s.pokemon_id AND pt.slot = 1
+            GROUP BY pt.type_name
+            ORDER BY avg_total_stats DESC;
+        """)
+    for (t, avg, c) in rows:
+        yield {"type": t, "avg_total_stats": float(avg), "count": int(c)}
+
+def pokemon_weight_vs_total_stats(conn, materialized=True, limit=None):
+    # LIMIT -1 is "no limit" in SQLite; with a limit the ORDER BY walks the
+    # pokemon primary key and stops early instead of building every row
+    if materialized:
+        rows = conn.execute("""
+            SELECT p.pokemon_id, p.name, p.weight, t.total_stats
+            FROM pokemon p
+            JOIN pokemon_total_stats t ON t.pokemon_id = p.pokemon_id
+            ORDER BY p.pokemon_id
+            LIMIT ?;
+        """, (-1 if limit is None else limit,))
+    else:
+        rows = conn.execute("""
+            SELECT p.pokemon_id, p.name, p.weight,
+                   SUM(ps.base_stat) AS total_stats
+            FROM pokemon p
+            JOIN pokemon_stat ps ON ps.pokemon_id = p.pokemon_id
+            GROUP BY p.pokemon_id
+            ORDER BY p.pokemon_id
+            LIMIT ?;
+        """, (-1 if limit is None else limit,))
+    for (pid, name, w, ts) in rows:
+        yield {"pokemon_id": int(pid), "name": name, "weight": w, "total_stats": int(ts)}
+
+def fruit_avg_nutrients_by_family(conn, materialized=True):
+    if materialized:
+        rows = cached_iter(conn, """
+            SELECT ff.family_name, nd.nutrient_name,
+                   CASE WHEN t.n_values > 0 THEN t.sum_value / t.n_values END AS avg_value,
+                   t.n_rows
+            FROM family_nutrient_totals t
+            JOIN fruit_family ff ON ff.family_id = t.family_id
+            JOIN nutrient_dim nd ON nd.nutrient_id = t.nutrient_id
+            ORDER BY ff.family_name, nd.nutrient_name;
+        """)
+    else:
+        rows = cached_iter(conn, """
+            SELECT ff.family_name, nd.nutrient_name,
+                   fsum(fnl.nutrient_value) / COUNT(fnl.nutrient_value) AS avg_value,
+                   COUNT(*) AS n_rows
+            FROM fruit_nutrient_long fnl
+            JOIN nutrient_dim nd ON nd.nutrient_id = fnl.nutrient_id
+            JOIN fruityvice_nutrition fn ON fn.fruit_id = fnl.fruit_id
+            JOIN fruit_family ff ON ff.family_id = fn.family_id
+            GROUP BY ff.family_name, nd.nutrient_name
+            ORDER BY ff.family_name, nd.nutrient_name;
+        """)
+    for (fam, nut, avg, n) in rows:
+        yield {"family": fam, "nutrient": nut, "avg_value": (None if avg is None else float(avg)), "rows": int(n)}
 
 def fruit_top_sugar(conn, topn=10):
-    rows = conn.execute("""
+    rows = cached_iter(conn, """
         SELECT f.name, ff.family_name, fnl.nutrient_value AS sugar
         FROM fruit_nutrient_long fnl
         JOIN nutrient_dim nd ON nd.nutrient_id = fnl.nutrient_id
@@ -67,56 +128,155 @@ def fruit_top_sugar(conn, topn=10):
         JOIN fruityvice_nutrition fn ON fn.fruit_id = f.fruit_id
         JOIN fruit_family ff ON ff.family_id = fn.family_id
         WHERE nd.nutrient_name = 'sugar'
-        ORDER BY sugar DESC
+        ORDER BY sugar DESC, f.name
         LIMIT ?;
-    """, (topn,)).fetchall()
-
-    out = [{"fruit": name, "family": fam, "sugar": (None if sugar is None else float(sugar))}
-           for (name, fam, sugar) in rows]
-    return out
+    """, (topn,))
+    for (name, fam, sugar) in rows:
+        yield {"fruit": name, "family": fam, "sugar": (None if sugar is None else float(sugar))}
 
 def website_type_counts(conn):
-    rows = conn.execute("""
-        SELECT td.type_name, COUNT(*) AS n
-        FROM web_pokemon_type wpt
-        JOIN web_type_dim td ON td.type_id = wpt.type_id
-        WHERE wpt.slot = 1
-        GROUP BY td.type_name
-        ORDER BY n DESC, td.type_name;
-    """).fetchall()
-    return [{"type": t, "count": int(n)} for (t, n) in rows]
-
-def main():
+    for (t, n) in cached_iter(conn, WEB_PRIMARY_TYPE_COUNTS):
+        yield {"type": t, "count": int(n)}
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+def check_aggregates(conn):
+    """Compare every materialized report with a full recompute.
+
+    Returns a list of human-readable mismatches (empty when consistent).
+    Rows are matched on their group key, since ties in the ORDER BY may come
+    back in a different order.
+    """
+    reports = [
+        (pokemon_avg_total_stats_by_type, ("type",)),
+        (pokemon_weight_vs_total_stats, ("pokemon_id",)),
+        (fruit_avg_nutrients_by_family, ("family", "nutrient")),
+    ]
+    problems = []
+    for fn, key in reports:
+        fast = {tuple(r[k] for k in key): r for r in fn(conn, materialized=True)}
+        full = {tuple(r[k] for k in key): r for r in fn(conn, materialized=False)}
+        for k in sorted(fast.keys() | full.keys(), key=str):
+            a, b = fast.get(k), full.get(k)
+            if a is None or b is None or not all(_same(a[f], b[f]) for f in b):
+                problems.append(f"{fn.__name__} {k}: materialized={a} recomputed={b}")
+    return problems
+
+def check_columnar(conn, store=None):
+    """Compare every report on the NumPy backend (pipeline/columnar.py) with
+    the SQL recompute, matching rows on their group key like check_aggregates.
+    """
+    if store is None:
+        from pipeline.columnar import ColumnarStore
+        store = ColumnarStore.load(conn)
+    reports = [
+        ("pokemon_avg_total_stats_by_type", ("type",),
+         pokemon_avg_total_stats_by_type(conn, materialized=False), store.pokemon_avg_total_stats_by_type()),
+        ("pokemon_weight_vs_total_stats", ("pokemon_id",),
+         pokemon_weight_vs_total_stats(conn, materialized=False), store.pokemon_weight_vs_total_stats()),
+        ("fruit_avg_nutrients_by_family", ("family", "nutrient"),
+         fruit_avg_nutrients_by_family(conn, materialized=False), store.fruit_avg_nutrients_by_family()),
+        ("website_type_counts", ("type",), website_type_counts(conn), store.website_type_counts()),
+    ]
+    problems = []
+    # ties on sugar are broken by name in both, so the ranking must match row for row
+    want = [(r["fruit"], r["sugar"]) for r in fruit_top_sugar(conn, 10)]
+    got = [(r["fruit"], r["sugar"]) for r in store.fruit_top_sugar(10)]
+    if len(want) != len(got) or not all(a[0] == b[0] and _same(a[1], b[1]) for a, b in zip(got, want)):
+        problems.append(f"fruit_top_sugar: columnar={got} sql={want}")
+    for name, key, sql_rows, np_rows in reports:
+        full = {tuple(r[k] for k in key): r for r in sql_rows}
+        fast = {tuple(r[k] for k in key): r for r in np_rows}
+        for k in sorted(fast.keys() | full.keys(), key=str):
+            a, b = fast.get(k), full.get(k)
+            if a is None or b is None or a.keys() != b.keys() or not all(_same(a[f], b[f]) for f in b):
+                problems.append(f"{name} {k}: columnar={a} sql={b}")
+    return problems
+
+def sql_reports(materialized):
+    """(name, query, kwargs, fields) per report; each query takes its own connection."""
+    return [
+        ("pokemon_avg_total_stats_by_type", pokemon_avg_total_stats_by_type,
+         {"materialized": materialized}, TYPE_AVG_FIELDS),
+        ("pokemon_weight_vs_total_stats", pokemon_weight_vs_total_stats,
+         {"materialized": materialized, "limit": SCATTER_LIMIT}, SCATTER_FIELDS),
+        ("fruit_avg_nutrients_by_family", fruit_avg_nutrients_by_family,
+         {"materialized": materialized}, FAMILY_AVG_FIELDS),
+        ("fruit_top10_sugar", fruit_top_sugar, {"topn": 10}, TOP_SUGAR_FIELDS),
+        ("web_primary_type_counts", website_type_counts, {}, TYPE_COUNT_FIELDS),
+    ]
+
+def report_format(name, fmt):
+    # the type counts have always been a CSV; the binary formats cover every report
+    return "csv" if name == "web_primary_type_counts" and fmt in ("json", "ndjson") else fmt
+
+@recorded("reports")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write report JSON/CSV files to outputs/.")
+    parser.add_argument("--check", action="store_true",
+                        help="verify the materialized aggregates (and with --backend columnar, "
+                             "the NumPy results) against a full recompute and exit")
+    parser.add_argument("--backend", choices=("sql", "columnar"), default="sql",
+                        help="compute the reports in SQLite or in NumPy (pipeline/columnar.py)")
+    parser.add_argument("--format", choices=("json", "ndjson", "parquet", "arrow"), default="json",
+                        help="output format; parquet and arrow need pyarrow")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="reports written at once, each on its own read-only connection")
+    args = parser.parse_args(argv)
+    writers.check_format(args.format)
+
+    pool = ConnectionPool(DB_PATH, readers=max(args.workers, 1))
+    with pool.reader() as conn:
+        materialized = has_aggregates(conn)
+
+    if args.check:
+        if not materialized:
+            pool.close()
+            sys.exit("aggregate tables missing; run jason/scripts/schema.py first")
+        with pool.reader() as conn:
+            problems = check_aggregates(conn)
+            if args.backend == "columnar":
+                problems += check_columnar(conn)
+        pool.close()
+        for p in problems:
+            print(p)
+        print(f"{len(problems)} mismatches")
+        sys.exit(1 if problems else 0)
+
     ensure_outdir()
-    conn = sqlite3.connect(DB_PATH)
-
-    poke_type_avgs = pokemon_avg_total_stats_by_type(conn)
-    poke_scatter = pokemon_weight_vs_total_stats(conn)
-    fruit_family_avgs = fruit_avg_nutrients_by_family(conn)
-    fruit_top10_sugar = fruit_top_sugar(conn, 10)
-    web_primary_type_counts = website_type_counts(conn)
-
-    (OUT_DIR / "pokemon_avg_total_stats_by_type.json").write_text(
-        json.dumps(poke_type_avgs, indent=2), encoding="utf-8"
-    )
-    (OUT_DIR / "pokemon_weight_vs_total_stats.json").write_text(
-        json.dumps(poke_scatter[:200], indent=2), encoding="utf-8"
-    )
-    (OUT_DIR / "fruit_avg_nutrients_by_family.json").write_text(
-        json.dumps(fruit_family_avgs, indent=2), encoding="utf-8"
-    )
-    (OUT_DIR / "fruit_top10_sugar.json").write_text(
-        json.dumps(fruit_top10_sugar, indent=2), encoding="utf-8"
-    )
-
-    with open(OUT_DIR / "web_primary_type_counts.csv", "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["type", "count"])
-        for row in web_primary_type_counts:
-            w.writerow([row["type"], row["count"]])
-
-    conn.close()
-    print("Wrote outputs to outputs/")
+    if args.backend == "columnar":
+        from pipeline.columnar import ColumnarStore
+        with pool.reader() as conn:
+            store = ColumnarStore.load(conn)
+        reports = [
+            ("pokemon_avg_total_stats_by_type", store.pokemon_avg_total_stats_by_type(), TYPE_AVG_FIELDS),
+            ("pokemon_weight_vs_total_stats", store.pokemon_weight_vs_total_stats(SCATTER_LIMIT), SCATTER_FIELDS),
+            ("fruit_avg_nutrients_by_family", store.fruit_avg_nutrients_by_family(), FAMILY_AVG_FIELDS),
+            ("fruit_top10_sugar", store.fruit_top_sugar(10), TOP_SUGAR_FIELDS),
+            ("web_primary_type_counts", store.website_type_counts(), TYPE_COUNT_FIELDS),
+        ]
+        results = [writers.write(OUT_DIR / name, rows, fields, report_format(name, args.format))
+                   for name, rows, fields in reports]
+    else:
+        # each query streams into its file as it runs, on a reader of its own
+        def write_report(report):
+            name, query, kwargs, fields = report
+            with pool.reader() as conn, span("report"):
+                return writers.write(OUT_DIR / name, query(conn, **kwargs), fields,
+                                     report_format(name, args.format))
+
+        if args.workers > 1:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(executor.map(write_report, sql_reports(materialized)))
+        else:
+            results = [write_report(r) for r in sql_reports(materialized)]
+    pool.close()
+
+    for path, n in results:
+        print(f"Wrote {n} rows to {path.relative_to(OUT_DIR.parent)}")
 
 if __name__ == "__main__":
     main()
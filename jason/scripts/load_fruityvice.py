@@ -1,10 +1,25 @@
+import argparse
 import sqlite3
+import sys
+import time
 from pathlib import Path
-import requests
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.changes import UNCHANGED, UPDATED, ChangeTracker, content_hash
+from pipeline.db import connect
+from pipeline.dims import DimResolver
+from pipeline.http_cache import cached_stream, shared_cache
+from pipeline.json_stream import iter_array
+from pipeline.metrics import recorded
+from pipeline.progress import Progress
+from backfill_fruityvice_long import NAMES as NUTRIENT_NAMES
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 URL = "https://www.fruityvice.com/api/fruit/all"
 BATCH = 25
+FLUSH_ROWS = 500
 
 def get_meta(conn: sqlite3.Connection, key: str, default: str) -> str:
     row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
@@ -14,68 +29,165 @@ def get_meta(conn: sqlite3.Connection, key: str, default: str) -> str:
         return default
     return row[0]
 
-def set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
-    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)", (key, value))
-    conn.commit()
-
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
-
-    offset = int(get_meta(conn, "fruit_offset", "0"))
-
-    r = requests.get(URL, timeout=30)
-    r.raise_for_status()
-    all_fruits = r.json()
-
-    inserted = 0
-    idx = offset
-
-    while inserted < BATCH and idx < len(all_fruits):
-        f = all_fruits[idx]
-        idx += 1
-
-        fruit_id = int(f["id"])
-        name = f["name"]
-        family = f.get("family")
-        genus = f.get("genus")
-        order = f.get("order")
-        nut = f.get("nutritions", {})
-
-        cur = conn.execute(
-            "INSERT OR IGNORE INTO fruits(fruit_id, name) VALUES (?, ?)",
-            (fruit_id, name)
-        )
-        if cur.rowcount == 0:
-            continue
-
-        inserted += 1
-
-        family_id = None
-        if family:
-            conn.execute("INSERT OR IGNORE INTO fruit_family(family_name) VALUES (?)", (family,))
-            family_id = conn.execute(
-                "SELECT family_id FROM fruit_family WHERE family_name = ?",
-                (family,)
-            ).fetchone()[0]
-
-        conn.execute("""
+def fruit_exists(conn: sqlite3.Connection, fruit_id: int, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM fruits WHERE fruit_id = ? OR name = ? LIMIT 1",
+        (fruit_id, name)
+    ).fetchone() is not None
+
+def fruit_payload(f: dict) -> dict:
+    """The part of a Fruityvice fruit add_fruit stores; its content_hash covers this."""
+    nut = f.get("nutritions", {})
+    return {
+        "name": f["name"],
+        "family": f.get("family"),
+        "genus": f.get("genus"),
+        "order": f.get("order"),
+        "nutritions": {n: nut.get(n) for n in NUTRIENT_NAMES},
+    }
+
+def add_fruit(writer: BulkWriter, family_ids: DimResolver, nutrient_ids: DimResolver, f: dict,
+              digest: str | None = None, update: bool = False) -> None:
+    fruit_id = int(f["id"])
+    nut = f.get("nutritions", {})
+    family = f.get("family")
+    family_id = family_ids(family) if family else None
+    if digest is None:
+        digest = content_hash(fruit_payload(f))
+
+    writer.add(
+        "INSERT INTO fruits(fruit_id, name, content_hash) VALUES (?, ?, ?) "
+        "ON CONFLICT(fruit_id) DO UPDATE SET name = excluded.name, content_hash = excluded.content_hash",
+        (fruit_id, f["name"], digest)
+    )
+    # the wide nutrient columns are named after the nutrients, in NAMES order
+    values = (family_id, f.get("genus"), f.get("order"), *(nut.get(n) for n in NUTRIENT_NAMES))
+    if update:
+        # Not an UPSERT: the BEFORE INSERT trigger on this table backs the old
+        # row out of family_nutrient_totals even when the insert turns into
+        # an update, and the UPDATE trigger would then back it out again.
+        writer.add("""
+            UPDATE fruityvice_nutrition
+            SET family_id = ?, genus = ?, fruit_order = ?,
+                carbohydrates = ?, protein = ?, fat = ?, calories = ?, sugar = ?
+            WHERE fruit_id = ?
+        """, (*values, fruit_id))
+    else:
+        writer.add("""
             INSERT OR REPLACE INTO fruityvice_nutrition(
                 fruit_id, family_id, genus, fruit_order,
                 carbohydrates, protein, fat, calories, sugar
             )
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            fruit_id, family_id, genus, order,
-            nut.get("carbohydrates"), nut.get("protein"), nut.get("fat"),
-            nut.get("calories"), nut.get("sugar")
-        ))
+        """, (fruit_id, *values))
+    # long format in the same flush, so no separate backfill is needed
+    for n in NUTRIENT_NAMES:
+        writer.add(
+            "INSERT INTO fruit_nutrient_long(fruit_id, nutrient_id, nutrient_value) VALUES (?, ?, ?) "
+            "ON CONFLICT(fruit_id, nutrient_id) DO UPDATE SET nutrient_value = excluded.nutrient_value "
+            "WHERE nutrient_value IS NOT excluded.nutrient_value",
+            (fruit_id, nutrient_ids(n), nut.get(n))
+        )
 
-        conn.commit()
+def refresh(conn: sqlite3.Connection, url: str, flush_every: int = FLUSH_ROWS) -> dict:
+    """Re-read the whole fruit array and write only the fruits whose content changed.
+
+    Fruits are compared by id against fruits.content_hash: new ones are
+    inserted, changed ones updated in place, unchanged ones not written. The
+    fruit_offset cursor is not moved.
+    """
+    tracker = ChangeTracker(conn, "fruits", "fruit_id")
+    family_ids = DimResolver(conn, "fruit_family", "family_name", "family_id")
+    nutrient_ids = DimResolver(conn, "nutrient_dim", "nutrient_name", "nutrient_id")
+    seen_names = set()
+    start = time.perf_counter()
+    progress = Progress("fruityvice refresh")
+
+    body = cached_stream(url, timeout=30)
+    with BulkWriter(conn, flush_every) as writer:
+        for f in iter_array(body):
+            progress.update()
+            fruit_id, name = int(f["id"]), f["name"]
+            if fruit_id not in tracker and (name in seen_names or fruit_exists(conn, fruit_id, name)):
+                continue
+            seen_names.add(name)
+            status, digest = tracker.classify(fruit_id, fruit_payload(f))
+            if status != UNCHANGED:
+                add_fruit(writer, family_ids, nutrient_ids, f, digest, update=status == UPDATED)
+            writer.checkpoint()
+    body.close()
+    progress.finish()
+    return {**tracker.counts, "elapsed": time.perf_counter() - start}
+
+@recorded("load-fruit")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the next batch of fruits from Fruityvice.")
+    parser.add_argument("--full", action="store_true", help="load every remaining fruit, not just one batch")
+    parser.add_argument("--commit-every", type=int, default=FLUSH_ROWS, help="rows buffered per transaction")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-read every fruit and rewrite only the ones whose content changed")
+    args = parser.parse_args(argv)
+    batch = None if args.full else BATCH
+
+    conn = connect(DB_PATH)
+
+    if args.refresh:
+        shared_cache().revalidate = True
+        stats = refresh(conn, URL, flush_every=args.commit_every)
+        conn.close()
+        print(f"Refreshed fruits: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged in {stats['elapsed']:.2f}s.")
+        return
 
-    set_meta(conn, "fruit_offset", str(idx))
+    offset = int(get_meta(conn, "fruit_offset", "0"))
+
+    # stream the array: skip the first `offset` fruits without decoding them
+    # and hang up once the batch is full
+    body = cached_stream(URL, timeout=30)
+    fruits = iter_array(body, skip=offset)
+
+    inserted = 0
+    idx = offset
+    exhausted = True
+    seen = set()
+    family_ids = DimResolver(conn, "fruit_family", "family_name", "family_id")
+    nutrient_ids = DimResolver(conn, "nutrient_dim", "nutrient_name", "nutrient_id")
+
+    progress = Progress("fruityvice") if args.full else None
+
+    with BulkWriter(conn, args.commit_every) as writer:
+        flushes = writer.flushes
+        for f in fruits:
+            idx += 1
+            if progress:
+                progress.update()
+            if writer.flushes != flushes:
+                # flushed fruits are visible to fruit_exists now
+                flushes = writer.flushes
+                seen.clear()
+
+            fruit_id = int(f["id"])
+            name = f["name"]
+
+            if fruit_id in seen or name in seen or fruit_exists(conn, fruit_id, name):
+                writer.checkpoint("fruit_offset", idx)
+                continue
+
+            seen.update((fruit_id, name))
+            inserted += 1
+            add_fruit(writer, family_ids, nutrient_ids, f)
+            writer.checkpoint("fruit_offset", idx)
+            if batch is not None and inserted >= batch:
+                exhausted = False
+                break
+
+        writer.set_meta("fruit_offset", idx)
+
+    body.close()
     conn.close()
-    print(f"Inserted {inserted} new fruits. Next offset = {idx} / {len(all_fruits)}.")
+    if progress:
+        progress.finish()
+    print(f"Inserted {inserted} new fruits. Next offset = {idx}{' (end of list)' if exhausted else ''}.")
 
 if __name__ == "__main__":
     main()
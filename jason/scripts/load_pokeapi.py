@@ -1,10 +1,32 @@
+import argparse
+import itertools
+import json
 import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 import requests
+from requests.adapters import HTTPAdapter
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.changes import UNCHANGED, UPDATED, ChangeTracker, content_hash
+from pipeline.db import connect
+from pipeline.dims import DimResolver
+from pipeline.http_cache import cached_get, shared_cache
+from pipeline.metrics import recorded, span
+from pipeline.progress import Progress
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 BASE = "https://pokeapi.co/api/v2/pokemon/"
 BATCH = 25
+WORKERS = 1
+FLUSH_ROWS = 500
+LIST_PAGE = 1000
 
 def get_meta(conn: sqlite3.Connection, key: str, default: str) -> str:
     row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
@@ -14,69 +36,331 @@ def get_meta(conn: sqlite3.Connection, key: str, default: str) -> str:
         return default
     return row[0]
 
-def set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
-    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)", (key, value))
-    conn.commit()
+def make_session(workers: int = WORKERS) -> requests.Session:
+    # one keep-alive pool shared by every worker thread
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-def fetch_pokemon(pid: int) -> dict:
-    r = requests.get(f"{BASE}{pid}/", timeout=30)
+def fetch_pokemon(pid: int, session: requests.Session | None = None, base: str = BASE) -> dict:
+    r = cached_get(f"{base}{pid}/", session=session, timeout=30)
     r.raise_for_status()
-    return r.json()
+    with span("parse.json"):
+        return r.json()
+
+def list_ids(session: requests.Session | None = None, base: str = BASE) -> List[int]:
+    """Every pokemon id the list endpoint reports, ascending.
+
+    PokeAPI ids are not contiguous (1..1025, then 10001 on for alternate
+    forms), so this list, not the first 404, is what marks the end of the data.
+    """
+    ids = []
+    url = f"{base}?limit={LIST_PAGE}&offset=0"
+    while url:
+        r = cached_get(url, session=session, timeout=30)
+        r.raise_for_status()
+        with span("parse.json"):
+            data = r.json()
+        ids.extend(int(item["url"].rstrip("/").rsplit("/", 1)[-1]) for item in data.get("results", []))
+        url = data.get("next")
+    return sorted(ids)
+
+def iter_serial(session: requests.Session, start_id: int, base: str = BASE, ids=None):
+    # ids defaults to start_id, start_id + 1, ... with no end
+    for pid in itertools.count(start_id) if ids is None else ids:
+        try:
+            yield pid, fetch_pokemon(pid, session, base), None
+        except requests.HTTPError as e:
+            yield pid, None, e
+
+def iter_concurrent(session: requests.Session, start_id: int, workers: int, base: str = BASE, ids=None):
+    """Fetch ids on a thread pool but yield results strictly in id order.
+
+    Keeps at most 2 * workers requests in flight; anything still pending when
+    the caller stops iterating is cancelled (or discarded if already running).
+    """
+    ids = itertools.count(start_id) if ids is None else iter(ids)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            while True:
+                for pid in itertools.islice(ids, workers * 2 - len(pending)):
+                    pending.append((pid, pool.submit(fetch_pokemon, pid, session, base)))
+                if not pending:
+                    return
+                pid, fut = pending.popleft()
+                try:
+                    yield pid, fut.result(), None
+                except requests.HTTPError as e:
+                    yield pid, None, e
+        finally:
+            for _, fut in pending:
+                fut.cancel()
+
+def pokemon_exists(conn: sqlite3.Connection, pid: int, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM pokemon WHERE pokemon_id = ? OR name = ? LIMIT 1",
+        (pid, name)
+    ).fetchone() is not None
+
+def pokemon_payload(data: dict) -> dict:
+    """The part of a PokeAPI response add_pokemon stores; its content_hash covers this."""
+    return {
+        "name": data.get("name"),
+        "height": data.get("height"),
+        "weight": data.get("weight"),
+        "base_experience": data.get("base_experience"),
+        "types": sorted((int(t["slot"]), t["type"]["name"]) for t in data.get("types", [])),
+        "stats": sorted((s["stat"]["name"], int(s["base_stat"]), int(s["effort"])) for s in data.get("stats", [])),
+    }
+
+def add_pokemon(writer: BulkWriter, stat_ids: DimResolver, pid: int, data: dict,
+                digest: str | None = None, update: bool = False) -> None:
+    """Write one pokemon with UPSERTs. Child rows whose values did not change
+    are left alone; with `update`, types and stats no longer in `data` are deleted."""
+    if digest is None:
+        digest = content_hash(pokemon_payload(data))
+    writer.add(
+        "INSERT INTO pokemon(pokemon_id, name, height, weight, base_experience, content_hash) "
+        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(pokemon_id) DO UPDATE SET "
+        "name = excluded.name, height = excluded.height, weight = excluded.weight, "
+        "base_experience = excluded.base_experience, content_hash = excluded.content_hash",
+        (pid, data.get("name"), data.get("height"), data.get("weight"), data.get("base_experience"), digest)
+    )
+
+    slots = []
+    for t in data.get("types", []):
+        slots.append(int(t["slot"]))
+        writer.add(
+            "INSERT INTO pokemon_type(pokemon_id, slot, type_name) VALUES (?, ?, ?) "
+            "ON CONFLICT(pokemon_id, slot) DO UPDATE SET type_name = excluded.type_name "
+            "WHERE type_name IS NOT excluded.type_name",
+            (pid, slots[-1], t["type"]["name"])
+        )
+
+    stats = []
+    for s in data.get("stats", []):
+        stats.append(stat_ids(s["stat"]["name"]))
+        writer.add(
+            "INSERT INTO pokemon_stat(pokemon_id, stat_id, base_stat, effort) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(pokemon_id, stat_id) DO UPDATE SET base_stat = excluded.base_stat, effort = excluded.effort "
+            "WHERE base_stat IS NOT excluded.base_stat OR effort IS NOT excluded.effort",
+            (pid, stats[-1], int(s["base_stat"]), int(s["effort"]))
+        )
+
+    if update:
+        writer.add(
+            "DELETE FROM pokemon_type WHERE pokemon_id = ? AND slot NOT IN (SELECT value FROM json_each(?))",
+            (pid, json.dumps(slots))
+        )
+        writer.add(
+            "DELETE FROM pokemon_stat WHERE pokemon_id = ? AND stat_id NOT IN (SELECT value FROM json_each(?))",
+            (pid, json.dumps(stats))
+        )
 
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
+def load_batch(conn: sqlite3.Connection, batch: int = BATCH, workers: int = WORKERS, base: str = BASE,
+               flush_every: int = FLUSH_ROWS) -> dict:
+    """Load up to `batch` new pokemon starting at the poke_next_id cursor.
 
+    Fetching runs on `workers` threads when workers > 1; this (calling) thread
+    is the only one that touches the database, and it consumes results in id
+    order so the cursor advances exactly as in the serial loop. Rows and the
+    cursor are written together by a BulkWriter every `flush_every` rows.
+    """
     next_id = int(get_meta(conn, "poke_next_id", "1"))
     inserted = 0
     attempted = 0
+    seen_names = set()
+    stat_ids = DimResolver(conn, "stat_dim", "stat_name", "stat_id")
+    start = time.perf_counter()
 
-    while inserted < BATCH:
-        pid = next_id
-        next_id += 1
-        attempted += 1
+    with make_session(workers) as session, BulkWriter(conn, flush_every) as writer:
+        if workers > 1:
+            results = iter_concurrent(session, next_id, workers, base)
+        else:
+            results = iter_serial(session, next_id, base)
 
         try:
-            data = fetch_pokemon(pid)
-        except requests.HTTPError:
-            break
+            while inserted < batch:
+                pid, data, err = next(results)
+                next_id = pid + 1
+                attempted += 1
 
-        cur = conn.execute(
-            "INSERT OR IGNORE INTO pokemon(pokemon_id, name, height, weight, base_experience) VALUES (?, ?, ?, ?, ?)",
-            (pid, data.get("name"), data.get("height"), data.get("weight"), data.get("base_experience"))
-        )
-        if cur.rowcount == 0:
-            continue
+                if err is not None:
+                    writer.set_meta("poke_next_id", next_id)
+                    break
 
-        inserted += 1
+                name = data.get("name")
+                if name not in seen_names and not pokemon_exists(conn, pid, name):
+                    seen_names.add(name)
+                    add_pokemon(writer, stat_ids, pid, data)
+                    inserted += 1
+                writer.checkpoint("poke_next_id", next_id)
+        finally:
+            results.close()
 
-        for t in data.get("types", []):
-            conn.execute(
-                "INSERT OR IGNORE INTO pokemon_type(pokemon_id, slot, type_name) VALUES (?, ?, ?)",
-                (pid, int(t["slot"]), t["type"]["name"])
-            )
+    elapsed = time.perf_counter() - start
+    return {
+        "inserted": inserted,
+        "attempted": attempted,
+        "next_id": next_id,
+        "elapsed": elapsed,
+        "req_per_sec": attempted / elapsed if elapsed > 0 else 0.0,
+    }
 
-        for s in data.get("stats", []):
-            stat_name = s["stat"]["name"]
-            base_stat = int(s["base_stat"])
-            effort = int(s["effort"])
+def load_full(conn: sqlite3.Connection, workers: int = WORKERS, base: str = BASE,
+              flush_every: int = FLUSH_ROWS) -> dict:
+    """Load every listed pokemon from the poke_next_id cursor on, in one run.
 
-            conn.execute("INSERT OR IGNORE INTO stat_dim(stat_name) VALUES (?)", (stat_name,))
-            stat_id = conn.execute(
-                "SELECT stat_id FROM stat_dim WHERE stat_name = ?",
-                (stat_name,)
-            ).fetchone()[0]
+    A listed id that 404s is a gap: it is counted and the cursor moves past
+    it. Any other HTTP error stops the run with the cursor still on that id,
+    so the next run retries it. Memory stays bounded: at most `flush_every`
+    rows are buffered, 2 * workers responses are in flight, and the
+    duplicate-name set only covers rows not yet written.
+    """
+    next_id = int(get_meta(conn, "poke_next_id", "1"))
+    inserted = 0
+    attempted = 0
+    gaps = []
+    error = None
+    seen_names = set()
+    stat_ids = DimResolver(conn, "stat_dim", "stat_name", "stat_id")
+    start = time.perf_counter()
 
-            conn.execute(
-                "INSERT OR IGNORE INTO pokemon_stat(pokemon_id, stat_id, base_stat, effort) VALUES (?, ?, ?, ?)",
-                (pid, stat_id, base_stat, effort)
-            )
+    with make_session(workers) as session, BulkWriter(conn, flush_every) as writer:
+        ids = [pid for pid in list_ids(session, base) if pid >= next_id]
+        progress = Progress("pokeapi", total=len(ids))
+        if workers > 1:
+            results = iter_concurrent(session, next_id, workers, base, ids)
+        else:
+            results = iter_serial(session, next_id, base, ids)
 
-        conn.commit()
+        flushes = writer.flushes
+        try:
+            for pid, data, err in results:
+                attempted += 1
+                progress.update()
+                if err is not None:
+                    if err.response is None or err.response.status_code != 404:
+                        error = f"id {pid}: {err}"
+                        break
+                    gaps.append(pid)
+                else:
+                    name = data.get("name")
+                    if name not in seen_names and not pokemon_exists(conn, pid, name):
+                        seen_names.add(name)
+                        add_pokemon(writer, stat_ids, pid, data)
+                        inserted += 1
+                next_id = pid + 1
+                writer.checkpoint("poke_next_id", next_id)
+                if writer.flushes != flushes:
+                    # flushed rows are visible to pokemon_exists now
+                    flushes = writer.flushes
+                    seen_names.clear()
+        finally:
+            results.close()
+        writer.set_meta("poke_next_id", next_id)
+    progress.finish()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "inserted": inserted,
+        "attempted": attempted,
+        "gaps": gaps,
+        "error": error,
+        "next_id": next_id,
+        "elapsed": elapsed,
+        "req_per_sec": attempted / elapsed if elapsed > 0 else 0.0,
+    }
+
+def refresh(conn: sqlite3.Connection, workers: int = WORKERS, base: str = BASE,
+            flush_every: int = FLUSH_ROWS) -> dict:
+    """Re-fetch every listed pokemon and write only those whose content changed.
+
+    Each response is hashed and compared with pokemon.content_hash: new ids
+    are inserted, changed ones are upserted in place, unchanged ones cost no
+    write at all. The poke_next_id cursor is not moved. Ids that fail are
+    reported and left as stored.
+    """
+    tracker = ChangeTracker(conn, "pokemon", "pokemon_id")
+    stat_ids = DimResolver(conn, "stat_dim", "stat_name", "stat_id")
+    seen_names = set()
+    gaps, errors = [], []
+    start = time.perf_counter()
+
+    with make_session(workers) as session, BulkWriter(conn, flush_every) as writer:
+        ids = list_ids(session, base)
+        progress = Progress("pokeapi refresh", total=len(ids))
+        if workers > 1:
+            results = iter_concurrent(session, 1, workers, base, ids)
+        else:
+            results = iter_serial(session, 1, base, ids)
+
+        try:
+            for pid, data, err in results:
+                progress.update()
+                if err is not None:
+                    if err.response is not None and err.response.status_code == 404:
+                        gaps.append(pid)
+                    else:
+                        errors.append(f"id {pid}: {err}")
+                    continue
+                name = data.get("name")
+                if pid not in tracker and (name in seen_names or pokemon_exists(conn, pid, name)):
+                    continue
+                seen_names.add(name)
+                status, digest = tracker.classify(pid, pokemon_payload(data))
+                if status != UNCHANGED:
+                    add_pokemon(writer, stat_ids, pid, data, digest, update=status == UPDATED)
+                writer.checkpoint()
+        finally:
+            results.close()
+    progress.finish()
+
+    return {**tracker.counts, "gaps": gaps, "errors": errors, "elapsed": time.perf_counter() - start}
+
+@recorded("load-pokeapi")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the next batch of pokemon from PokeAPI.")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="concurrent fetch threads (1 = serial)")
+    parser.add_argument("--batch", type=int, default=BATCH)
+    parser.add_argument("--full", action="store_true",
+                        help="load every pokemon the list endpoint reports, not just one batch")
+    parser.add_argument("--commit-every", type=int, default=FLUSH_ROWS,
+                        help="rows buffered per transaction")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-fetch every pokemon and rewrite only the ones whose content changed")
+    args = parser.parse_args(argv)
+
+    conn = connect(DB_PATH)
+
+    if args.refresh:
+        shared_cache().revalidate = True
+        stats = refresh(conn, workers=args.workers, flush_every=args.commit_every)
+        conn.close()
+        print(f"Refreshed pokemon: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged in {stats['elapsed']:.2f}s.")
+        if stats["errors"]:
+            sys.exit(f"{len(stats['errors'])} ids failed, first: {stats['errors'][0]}")
+        return
 
-    set_meta(conn, "poke_next_id", str(next_id))
+    if args.full:
+        stats = load_full(conn, workers=args.workers, flush_every=args.commit_every)
+    else:
+        stats = load_batch(conn, batch=args.batch, workers=args.workers, flush_every=args.commit_every)
     conn.close()
-    print(f"Inserted {inserted} new pokemon. Next start id = {next_id}. Attempted ids = {attempted}.")
+    print(f"Inserted {stats['inserted']} new pokemon. Next start id = {stats['next_id']}. "
+          f"Attempted ids = {stats['attempted']}.")
+    print(f"Fetched in {stats['elapsed']:.2f}s ({stats['req_per_sec']:.1f} req/s, workers = {args.workers}).")
+    if args.full:
+        if stats["gaps"]:
+            print(f"Skipped {len(stats['gaps'])} listed ids that returned 404: {stats['gaps'][:10]}"
+                  f"{' ...' if len(stats['gaps']) > 10 else ''}")
+        if stats["error"]:
+            sys.exit(f"Stopped early at {stats['error']}; re-run to resume.")
 
 if __name__ == "__main__":
     main()
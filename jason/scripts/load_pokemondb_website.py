@@ -1,12 +1,27 @@
+import argparse
+import codecs
 import sqlite3
+import sys
+import time
+from html.parser import HTMLParser
 from pathlib import Path
-import requests
-from bs4 import BeautifulSoup
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.changes import UNCHANGED, UPDATED, ChangeTracker, content_hash
+from pipeline.db import connect
+from pipeline.dims import DimResolver
+from pipeline.http_cache import cached_get, cached_stream, shared_cache
+from pipeline.metrics import recorded, span
+from pipeline.progress import Progress
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 URL = "https://pokemondb.net/pokedex/all"
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 BATCH = 25
+FLUSH_ROWS = 500
+CHUNK_SIZE = 64 * 1024
 
 def get_meta(conn, key, default):
     row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
@@ -16,11 +31,15 @@ def get_meta(conn, key, default):
         return str(default)
     return row[0]
 
-def set_meta(conn, key, value):
-    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)", (key, str(value)))
-    conn.commit()
+def web_pokemon_exists(conn, dex_num, name):
+    return conn.execute(
+        "SELECT 1 FROM web_pokemon WHERE dex_num = ? OR name = ? LIMIT 1",
+        (dex_num, name)
+    ).fetchone() is not None
 
 def parse_rows(html: str):
+    from bs4 import BeautifulSoup  # only the --parser soup path needs bs4
+
     soup = BeautifulSoup(html, "html.parser")
     table = soup.select_one("table#pokedex")
     if table is None:
@@ -36,47 +55,240 @@ def parse_rows(html: str):
         out.append((dex_num, name, types))
     return out
 
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
+class PokedexRowParser(HTMLParser):
+    """Event-based reader for table#pokedex that matches parse_rows() output.
 
-    offset = int(get_meta(conn, "web_offset", 0))
+    Completed rows collect in `rows` as markup is fed in; callers drain the
+    list between feeds, so nothing but the row being read is held in memory.
+    Cell text is built like BeautifulSoup's get_text(strip=True): every text
+    node stripped, then joined with no separator. A text node can arrive over
+    several handle_data calls when it straddles a chunk boundary, so pieces
+    are buffered until the next tag.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.found_table = False
+        self.done = False
+        self._depth = 0          # nested <table> depth inside table#pokedex
+        self._in_tbody = False
+        self._cells = None       # list of cell texts for the current <tr>
+        self._cell = None        # text pieces of the current <td>
+        self._types = None
+        self._link = None        # text pieces of the current <a> in the type cell
+        self._text = []          # raw pieces of the text node being read
+
+    def _end_text(self):
+        text = "".join(self._text).strip()
+        self._text.clear()
+        if text:
+            self._cell.append(text)
+            if self._link is not None:
+                self._link.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if self._text:
+            self._end_text()
+        if self.done:
+            return
+        if tag == "table":
+            if self._depth or ("id", "pokedex") in attrs:
+                self.found_table = True
+                self._depth += 1
+        elif not self._depth:
+            return
+        elif tag == "tbody":
+            self._in_tbody = True
+        elif tag == "tr" and self._in_tbody:
+            self._cells = []
+            self._types = []
+        elif tag == "td" and self._cells is not None:
+            self._cell = []
+        elif tag == "a" and self._cell is not None and len(self._cells) == 2:
+            self._link = []
+
+    def handle_endtag(self, tag):
+        if self._text:
+            self._end_text()
+        if not self._depth or self.done:
+            return
+        if tag == "table":
+            self._depth -= 1
+            self.done = self._depth == 0
+        elif tag == "tbody":
+            self._in_tbody = False
+        elif tag == "a" and self._link is not None:
+            self._types.append("".join(self._link).lower())
+            self._link = None
+        elif tag == "td" and self._cell is not None:
+            self._cells.append("".join(self._cell))
+            self._cell = None
+        elif tag == "tr" and self._cells is not None:
+            if len(self._cells) >= 3:
+                dex_num = int(self._cells[0].lstrip("#"))
+                self.rows.append((dex_num, self._cells[1], self._types))
+            self._cells = None
 
-    r = requests.get(URL, headers=HEADERS, timeout=30)
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._text.append(data)
+
+def iter_rows(chunks):
+    """Yield (dex_num, name, types) from an iterable of HTML text chunks.
+
+    Stops reading as soon as table#pokedex closes, and stops entirely if the
+    caller stops iterating.
+    """
+    parser = PokedexRowParser()
+    for chunk in chunks:
+        with span("parse.html"):
+            parser.feed(chunk)
+        yield from parser.rows
+        parser.rows.clear()
+        if parser.done:
+            return
+    parser.close()
+    yield from parser.rows
+    if not parser.found_table:
+        raise RuntimeError("Could not find table#pokedex")
+
+def stream_rows():
+    """iter_rows() fed straight from the network (or a fresh cache entry) as
+    chunks arrive; closing it hangs up. The page is served as UTF-8."""
+    body = cached_stream(URL, CHUNK_SIZE, headers=HEADERS, timeout=30)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        yield from iter_rows(decoder.decode(chunk) for chunk in body)
+        # every row was read: take the rest of the page too, so the cache
+        # stores it and the next run can revalidate instead of downloading
+        for _ in body:
+            pass
+    finally:
+        body.close()
+
+def fetch_rows(parser: str = "stream"):
+    if parser == "stream":
+        return stream_rows()
+    # the soup parser needs the whole document anyway
+    r = cached_get(URL, headers=HEADERS, timeout=30)
     r.raise_for_status()
-    rows = parse_rows(r.text)
+    with span("parse.html"):
+        return iter(parse_rows(r.text))
 
-    inserted = 0
-    i = offset
-    while inserted < BATCH and i < len(rows):
-        dex_num, name, types = rows[i]
-        i += 1
-
-        cur = conn.execute(
-            "INSERT OR IGNORE INTO web_pokemon(dex_num, name) VALUES (?, ?)",
-            (dex_num, name)
+def add_web_pokemon(writer: BulkWriter, type_ids: DimResolver, dex_num: int, name: str, types: list,
+                    digest: str | None = None, update: bool = False) -> None:
+    if digest is None:
+        digest = content_hash({"name": name, "types": types})
+    writer.add(
+        "INSERT INTO web_pokemon(dex_num, name, content_hash) VALUES (?, ?, ?) "
+        "ON CONFLICT(dex_num) DO UPDATE SET name = excluded.name, content_hash = excluded.content_hash",
+        (dex_num, name, digest)
+    )
+    for slot, tname in enumerate(types, start=1):
+        writer.add(
+            "INSERT INTO web_pokemon_type(dex_num, slot, type_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(dex_num, slot) DO UPDATE SET type_id = excluded.type_id "
+            "WHERE type_id IS NOT excluded.type_id",
+            (dex_num, slot, type_ids(tname))
         )
-        if cur.rowcount == 0:
-            continue
+    if update:
+        writer.add("DELETE FROM web_pokemon_type WHERE dex_num = ? AND slot > ?", (dex_num, len(types)))
 
-        inserted += 1
+def refresh(conn, rows, flush_every: int = FLUSH_ROWS) -> dict:
+    """Compare every row of the page with web_pokemon.content_hash by dex number
+    and write only new and changed ones. The web_offset cursor is not moved."""
+    tracker = ChangeTracker(conn, "web_pokemon", "dex_num")
+    type_ids = DimResolver(conn, "web_type_dim", "type_name", "type_id")
+    seen_dex = set()
+    seen_names = set()
+    start = time.perf_counter()
+    progress = Progress("pokemondb refresh")
 
-        for slot, tname in enumerate(types, start=1):
-            conn.execute("INSERT OR IGNORE INTO web_type_dim(type_name) VALUES (?)", (tname,))
-            type_id = conn.execute(
-                "SELECT type_id FROM web_type_dim WHERE type_name = ?",
-                (tname,)
-            ).fetchone()[0]
-            conn.execute(
-                "INSERT OR IGNORE INTO web_pokemon_type(dex_num, slot, type_id) VALUES (?, ?, ?)",
-                (dex_num, slot, type_id)
-            )
+    with BulkWriter(conn, flush_every) as writer:
+        for dex_num, name, types in rows:
+            progress.update()
+            # first form listed under a dex number wins, as in the normal load
+            if dex_num in seen_dex:
+                continue
+            seen_dex.add(dex_num)
+            if dex_num not in tracker and (name in seen_names or web_pokemon_exists(conn, dex_num, name)):
+                continue
+            seen_names.add(name)
+            status, digest = tracker.classify(dex_num, {"name": name, "types": types})
+            if status != UNCHANGED:
+                add_web_pokemon(writer, type_ids, dex_num, name, types, digest, update=status == UPDATED)
+            writer.checkpoint()
+    progress.finish()
+    return {**tracker.counts, "elapsed": time.perf_counter() - start}
 
-        conn.commit()
+@recorded("load-web")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the next batch of rows from pokemondb.net/pokedex/all.")
+    parser.add_argument("--parser", choices=["stream", "soup"], default="stream",
+                        help="incremental event parser (default) or the full BeautifulSoup tree")
+    parser.add_argument("--full", action="store_true", help="load every remaining row, not just one batch")
+    parser.add_argument("--commit-every", type=int, default=FLUSH_ROWS, help="rows buffered per transaction")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-read the whole page and rewrite only the rows whose content changed")
+    args = parser.parse_args(argv)
+    batch = None if args.full else BATCH
+
+    conn = connect(DB_PATH)
+
+    if args.refresh:
+        shared_cache().revalidate = True
+        stats = refresh(conn, fetch_rows(args.parser), flush_every=args.commit_every)
+        conn.close()
+        print(f"Refreshed web_pokemon: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged in {stats['elapsed']:.2f}s.")
+        return
+
+    offset = int(get_meta(conn, "web_offset", 0))
+    rows = fetch_rows(args.parser)
+
+    inserted = 0
+    i = 0
+    seen_dex = set()
+    seen_names = set()
+    type_ids = DimResolver(conn, "web_type_dim", "type_name", "type_id")
+    progress = Progress("pokemondb") if args.full else None
+
+    with BulkWriter(conn, args.commit_every) as writer:
+        flushes = writer.flushes
+        for dex_num, name, types in rows:
+            if batch is not None and inserted >= batch:
+                break
+            i += 1
+            if i <= offset:
+                continue
+            if progress:
+                progress.update()
+            if writer.flushes != flushes:
+                # flushed rows are visible to web_pokemon_exists now
+                flushes = writer.flushes
+                seen_dex.clear()
+                seen_names.clear()
+
+            # pokedex/all lists alternate forms under the same dex number
+            if dex_num in seen_dex or name in seen_names or web_pokemon_exists(conn, dex_num, name):
+                writer.checkpoint("web_offset", i)
+                continue
+
+            seen_dex.add(dex_num)
+            seen_names.add(name)
+            inserted += 1
+
+            add_web_pokemon(writer, type_ids, dex_num, name, types)
+            writer.checkpoint("web_offset", i)
+
+        writer.set_meta("web_offset", max(i, offset))
+    rows.close()
 
-    set_meta(conn, "web_offset", i)
     conn.close()
-    print(f"Inserted {inserted} web_pokemon rows. Next offset = {i} / {len(rows)}.")
+    if progress:
+        progress.finish()
+    print(f"Inserted {inserted} web_pokemon rows. Next offset = {max(i, offset)}.")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,16 @@
+import argparse
 import json
-import sqlite3
+import sys
 from pathlib import Path
-import matplotlib.pyplot as plt
 
 ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.db import connect
+from pipeline.metrics import recorded
+from pipeline.query_cache import cached_rows
+from pipeline.render import Chart, render_all, report
+from calc_outputs import WEB_PRIMARY_TYPE_COUNTS
+
 DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
 OUT_DIR = ROOT / "jason" / "outputs"
 VIZ_DIR = ROOT / "jason" / "viz"
@@ -12,66 +19,74 @@ def ensure_dirs():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     VIZ_DIR.mkdir(parents=True, exist_ok=True)
 
-def bar_avg_stats_by_type():
-    data = json.loads((OUT_DIR / "pokemon_avg_total_stats_by_type.json").read_text(encoding="utf-8"))
+def rotate_xticks(ax, degrees):
+    ax.tick_params(axis="x", labelrotation=degrees)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+
+def bar_avg_stats_by_type(fig, data):
     types = [d["type"] for d in data]
     avgs = [d["avg_total_stats"] for d in data]
 
-    plt.figure()
-    plt.bar(types, avgs)
-    plt.title("Average Total Base Stats by Primary Type (PokeAPI)")
-    plt.xlabel("Primary Type")
-    plt.ylabel("Avg Total Base Stats")
-    plt.xticks(rotation=60, ha="right")
-    plt.tight_layout()
-    plt.savefig(VIZ_DIR / "pokemon_avg_stats_by_type.png", dpi=200)
-    plt.close()
-
-def scatter_weight_vs_total_stats():
-    data = json.loads((OUT_DIR / "pokemon_weight_vs_total_stats.json").read_text(encoding="utf-8"))
+    ax = fig.add_subplot()
+    ax.bar(types, avgs)
+    ax.set_title("Average Total Base Stats by Primary Type (PokeAPI)")
+    ax.set_xlabel("Primary Type")
+    ax.set_ylabel("Avg Total Base Stats")
+    rotate_xticks(ax, 60)
+    fig.tight_layout()
+
+def scatter_weight_vs_total_stats(fig, data):
     x = [d["weight"] for d in data if d["weight"] is not None]
     y = [d["total_stats"] for d in data if d["weight"] is not None]
 
-    plt.figure()
-    plt.scatter(x, y, s=12)
-    plt.title("Weight vs Total Base Stats (PokeAPI)")
-    plt.xlabel("Weight")
-    plt.ylabel("Total Base Stats")
-    plt.tight_layout()
-    plt.savefig(VIZ_DIR / "pokemon_weight_vs_total_stats.png", dpi=200)
-    plt.close()
-
-def bar_web_primary_type_counts():
-    conn = sqlite3.connect(DB_PATH)
-    rows = conn.execute("""
-        SELECT td.type_name, COUNT(*) AS n
-        FROM web_pokemon_type wpt
-        JOIN web_type_dim td ON td.type_id = wpt.type_id
-        WHERE wpt.slot = 1
-        GROUP BY td.type_name
-        ORDER BY n DESC, td.type_name;
-    """).fetchall()
-    conn.close()
+    ax = fig.add_subplot()
+    ax.scatter(x, y, s=12)
+    ax.set_title("Weight vs Total Base Stats (PokeAPI)")
+    ax.set_xlabel("Weight")
+    ax.set_ylabel("Total Base Stats")
+    fig.tight_layout()
+
+def web_primary_type_counts(conn):
+    return cached_rows(conn, WEB_PRIMARY_TYPE_COUNTS)
 
+def bar_web_primary_type_counts(fig, rows):
     types = [t for (t, _) in rows]
     counts = [n for (_, n) in rows]
 
-    plt.figure()
-    plt.bar(types, counts)
-    plt.title("Website (PokemonDB) Primary Type Counts")
-    plt.xlabel("Primary Type")
-    plt.ylabel("Count")
-    plt.xticks(rotation=60, ha="right")
-    plt.tight_layout()
-    plt.savefig(VIZ_DIR / "web_primary_type_counts.png", dpi=200)
-    plt.close()
-
-def main():
+    ax = fig.add_subplot()
+    ax.bar(types, counts)
+    ax.set_title("Website (PokemonDB) Primary Type Counts")
+    ax.set_xlabel("Primary Type")
+    ax.set_ylabel("Count")
+    rotate_xticks(ax, 60)
+    fig.tight_layout()
+
+def read_output(name):
+    return json.loads((OUT_DIR / name).read_text(encoding="utf-8"))
+
+def charts(conn):
+    return [
+        Chart(VIZ_DIR / "pokemon_avg_stats_by_type.png", bar_avg_stats_by_type,
+              read_output("pokemon_avg_total_stats_by_type.json")),
+        Chart(VIZ_DIR / "pokemon_weight_vs_total_stats.png", scatter_weight_vs_total_stats,
+              read_output("pokemon_weight_vs_total_stats.json")),
+        Chart(VIZ_DIR / "web_primary_type_counts.png", bar_web_primary_type_counts,
+              [list(r) for r in web_primary_type_counts(conn)]),
+    ]
+
+@recorded("viz")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the PokeAPI / PokemonDB charts into viz/.")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render even if the data is unchanged")
+    args = parser.parse_args(argv)
+
     ensure_dirs()
-    bar_avg_stats_by_type()
-    scatter_weight_vs_total_stats()
-    bar_web_primary_type_counts()
-    print("Saved plots to viz/")
+    conn = connect(DB_PATH)
+    chart_set = charts(conn)
+    conn.close()
+    report(render_all(chart_set, args.workers, args.force))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+"""Match PokeAPI pokemon to pokemondb.net rows and report where they disagree.
+
+The match is a hash join. The build side holds every web_pokemon row in
+memory, keyed by normalized name. The probe side streams pokemon with their
+types in id order. Each pokemon is matched by the first of:
+
+  name   its normalized name is a pokemondb name ("Mr. Mime" -> "mr-mime")
+  dex    pokemondb has its id as a dex number (PokeAPI ids below 10001 are
+         national dex numbers; this catches "deoxys-normal" vs "Deoxys")
+  form   the longest "-"-prefix of its name that names exactly one species
+         ("charizard-mega-x" -> "charizard", "deoxys-attack" -> "deoxys")
+  none   no match, dex_num stays NULL
+
+Results go to pokemon_xref (migration 11). The default incremental run
+only probes pokemon that have no pair yet, no match yet, or whose own row
+or matched web row has changed content_hash since. --full re-probes everything.
+"""
+import argparse
+import re
+import sqlite3
+import sys
+import unicodedata
+from itertools import chain, groupby
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.bulk import BulkWriter
+from pipeline.db import connect
+from pipeline.metrics import recorded
+from pipeline import writers
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
+OUT_DIR = Path(__file__).resolve().parents[1] / "outputs"
+FORM_ID_START = 10001
+FLUSH_ROWS = 500
+
+DIFF_FIELDS = [("kind", "str"), ("pokemon_id", "int"), ("api_name", "str"), ("dex_num", "int"),
+               ("web_name", "str"), ("method", "str"), ("api_types", "str"), ("web_types", "str")]
+
+SEPARATORS = re.compile(r"[^a-z0-9]+")
+DROPPED = re.compile(r"[.'’:]")
+
+CANDIDATES_FULL = "SELECT pokemon_id, name, content_hash FROM pokemon"
+CANDIDATES_INCREMENTAL = """
+    SELECT p.pokemon_id, p.name, p.content_hash
+    FROM pokemon p
+    LEFT JOIN pokemon_xref x ON x.pokemon_id = p.pokemon_id
+    LEFT JOIN web_pokemon w ON w.dex_num = x.dex_num
+    WHERE x.pokemon_id IS NULL OR x.dex_num IS NULL
+       OR x.api_hash IS NOT p.content_hash OR x.web_hash IS NOT w.content_hash
+"""
+PROBE_SQL = """
+    SELECT c.pokemon_id, c.name, c.content_hash, t.type_name
+    FROM temp.xref_probe c
+    LEFT JOIN pokemon_type t ON t.pokemon_id = c.pokemon_id
+    ORDER BY c.pokemon_id, t.slot
+"""
+XREF_UPSERT = """
+    INSERT INTO pokemon_xref(pokemon_id, dex_num, method, api_types, web_types, types_agree, api_hash, web_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(pokemon_id) DO UPDATE SET
+        dex_num = excluded.dex_num, method = excluded.method, api_types = excluded.api_types,
+        web_types = excluded.web_types, types_agree = excluded.types_agree,
+        api_hash = excluded.api_hash, web_hash = excluded.web_hash
+    WHERE dex_num IS NOT excluded.dex_num OR method IS NOT excluded.method
+       OR api_types IS NOT excluded.api_types OR web_types IS NOT excluded.web_types
+       OR api_hash IS NOT excluded.api_hash OR web_hash IS NOT excluded.web_hash
+"""
+
+def normalize_name(name: str) -> str:
+    """Fold a display name onto PokeAPI's slug form: "Farfetch'd" -> "farfetchd",
+    "Nidoran♀" -> "nidoran-f", "Flabébé" -> "flabebe", "Type: Null" -> "type-null"."""
+    text = unicodedata.normalize("NFKD", name.replace("♀", "-f").replace("♂", "-m"))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return SEPARATORS.sub("-", DROPPED.sub("", text)).strip("-")
+
+class WebSide:
+    """The build side: pokemondb rows indexed for the probe."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.names: Dict[str, int] = {}
+        self.rows: Dict[int, Tuple[List[str], Optional[str]]] = {}
+        for dex, name, digest in conn.execute("SELECT dex_num, name, content_hash FROM web_pokemon"):
+            self.names.setdefault(normalize_name(name), dex)
+            self.rows[dex] = ([], digest)
+        for dex, type_name in conn.execute(
+            "SELECT t.dex_num, d.type_name FROM web_pokemon_type t "
+            "JOIN web_type_dim d ON d.type_id = t.type_id ORDER BY t.dex_num, t.slot"
+        ):
+            if dex in self.rows:
+                self.rows[dex][0].append(type_name)
+
+        # every "-"-prefix of a species name, from pokemondb and from the
+        # PokeAPI base species on the same dex number; a prefix shared by two
+        # species ("mr" for mr-mime and mr-rime) names neither
+        species = conn.execute(
+            "SELECT p.pokemon_id, p.name FROM pokemon p JOIN web_pokemon w ON w.dex_num = p.pokemon_id"
+        )
+        self.prefixes: Dict[str, int] = {}
+        ambiguous = set()
+        for key, dex in chain(self.names.items(), ((normalize_name(n), pid) for pid, n in species)):
+            parts = key.split("-")
+            for i in range(1, len(parts) + 1):
+                prefix = "-".join(parts[:i])
+                if self.prefixes.setdefault(prefix, dex) != dex:
+                    ambiguous.add(prefix)
+        for prefix in ambiguous:
+            del self.prefixes[prefix]
+
+    def match(self, pokemon_id: int, name: str) -> Tuple[Optional[int], str]:
+        key = normalize_name(name)
+        dex = self.names.get(key)
+        if dex is not None:
+            return dex, "name"
+        if pokemon_id < FORM_ID_START and pokemon_id in self.rows:
+            return pokemon_id, "dex"
+        parts = key.split("-")
+        for i in range(len(parts) - 1, 0, -1):
+            dex = self.prefixes.get("-".join(parts[:i]))
+            if dex is not None:
+                return dex, "form"
+        return None, "none"
+
+def reconcile(conn: sqlite3.Connection, incremental: bool = True, flush_every: int = FLUSH_ROWS) -> dict:
+    """Fill pokemon_xref; returns how many pokemon were probed and how each matched."""
+    counts = {"probed": 0, "name": 0, "dex": 0, "form": 0, "none": 0, "types_disagree": 0}
+
+    # the candidates are picked by looking at pokemon_xref, so they are fixed
+    # in a temp table before the writer starts changing it. They are read in
+    # full before the first write too: a cursor still open when the writer
+    # flushes is a read snapshot, and if another process committed since,
+    # SQLite cannot upgrade it to a write and fails at once with "locked".
+    conn.execute("DROP TABLE IF EXISTS temp.xref_probe")
+    conn.execute("CREATE TEMP TABLE xref_probe (pokemon_id INTEGER PRIMARY KEY, name TEXT, content_hash TEXT)")
+    conn.execute(f"INSERT INTO temp.xref_probe {CANDIDATES_INCREMENTAL if incremental else CANDIDATES_FULL}")
+    conn.commit()
+    probe = conn.execute(PROBE_SQL).fetchall()
+    web = WebSide(conn)
+
+    with BulkWriter(conn, flush_every) as writer:
+        if not incremental:
+            writer.add("DELETE FROM pokemon_xref WHERE pokemon_id NOT IN (SELECT pokemon_id FROM pokemon)", ())
+        for (pokemon_id, name, digest), group in groupby(probe, key=lambda r: r[:3]):
+            api_types = [r[3] for r in group if r[3] is not None]
+            dex, method = web.match(pokemon_id, name)
+            web_types, web_hash = web.rows[dex] if dex is not None else (None, None)
+            agree = None if dex is None else int(api_types == web_types)
+            counts["probed"] += 1
+            counts[method] += 1
+            counts["types_disagree"] += agree == 0
+            writer.add(XREF_UPSERT, (pokemon_id, dex, method, "/".join(api_types),
+                                     None if web_types is None else "/".join(web_types), agree, digest, web_hash))
+            writer.checkpoint()
+    conn.execute("DROP TABLE temp.xref_probe")
+    return counts
+
+def diff_rows(conn: sqlite3.Connection) -> Iterator[dict]:
+    """Type disagreements, then pokemon with no pokemondb row, then pokemondb rows no pokemon maps to."""
+    for pid, api_name, dex, web_name, method, api_types, web_types in conn.execute("""
+        SELECT x.pokemon_id, p.name, x.dex_num, w.name, x.method, x.api_types, x.web_types
+        FROM pokemon_xref x
+        JOIN pokemon p ON p.pokemon_id = x.pokemon_id
+        JOIN web_pokemon w ON w.dex_num = x.dex_num
+        WHERE x.types_agree = 0
+        ORDER BY x.pokemon_id
+    """):
+        yield {"kind": "types", "pokemon_id": pid, "api_name": api_name, "dex_num": dex, "web_name": web_name,
+               "method": method, "api_types": api_types, "web_types": web_types}
+    for pid, api_name, api_types in conn.execute("""
+        SELECT x.pokemon_id, p.name, x.api_types
+        FROM pokemon_xref x JOIN pokemon p ON p.pokemon_id = x.pokemon_id
+        WHERE x.dex_num IS NULL
+        ORDER BY x.pokemon_id
+    """):
+        yield {"kind": "no_web_match", "pokemon_id": pid, "api_name": api_name, "dex_num": None, "web_name": None,
+               "method": "none", "api_types": api_types, "web_types": None}
+    for dex, web_name in conn.execute("""
+        SELECT w.dex_num, w.name FROM web_pokemon w
+        WHERE NOT EXISTS (SELECT 1 FROM pokemon_xref x WHERE x.dex_num = w.dex_num)
+        ORDER BY w.dex_num
+    """):
+        yield {"kind": "no_api_match", "pokemon_id": None, "api_name": None, "dex_num": dex, "web_name": web_name,
+               "method": None, "api_types": None, "web_types": None}
+
+@recorded("reconcile")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map PokeAPI pokemon to pokemondb rows and write the diff report.")
+    parser.add_argument("--full", action="store_true", help="re-probe every pokemon, not only new and changed ones")
+    parser.add_argument("--format", choices=("csv", "json", "ndjson", "parquet", "arrow"), default="csv",
+                        help="diff report format; parquet and arrow need pyarrow")
+    args = parser.parse_args(argv)
+    writers.check_format(args.format)
+
+    conn = connect(DB_PATH)
+    counts = reconcile(conn, incremental=not args.full)
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    path, n = writers.write(OUT_DIR / "pokemon_xref_diff", diff_rows(conn), DIFF_FIELDS, args.format)
+    conn.close()
+
+    print(f"Probed {counts['probed']} pokemon: {counts['name']} by name, {counts['dex']} by dex number, "
+          f"{counts['form']} as forms, {counts['none']} unmatched; {counts['types_disagree']} type disagreements.")
+    print(f"Wrote {n} diff rows to {path.relative_to(OUT_DIR.parent)}")
+
+if __name__ == "__main__":
+    main()
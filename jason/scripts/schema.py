@@ -1,101 +1,42 @@
-import sqlite3
+import argparse
+import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parents[2] / "GamerSoups_final_project.sqlite"
-
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    cur = conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS meta (
-        key TEXT PRIMARY KEY,
-        value TEXT NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS pokemon (
-        pokemon_id INTEGER PRIMARY KEY,
-        name TEXT UNIQUE NOT NULL,
-        height INTEGER,
-        weight INTEGER,
-        base_experience INTEGER
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS pokemon_type (
-        pokemon_id INTEGER NOT NULL,
-        slot INTEGER NOT NULL,
-        type_name TEXT NOT NULL,
-        PRIMARY KEY (pokemon_id, slot),
-        FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id)
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS stat_dim (
-        stat_id INTEGER PRIMARY KEY,
-        stat_name TEXT UNIQUE NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS pokemon_stat (
-        pokemon_id INTEGER NOT NULL,
-        stat_id INTEGER NOT NULL,
-        base_stat INTEGER NOT NULL,
-        effort INTEGER NOT NULL,
-        PRIMARY KEY (pokemon_id, stat_id),
-        FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id),
-        FOREIGN KEY (stat_id) REFERENCES stat_dim(stat_id)
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS fruits (
-        fruit_id INTEGER PRIMARY KEY,
-        name TEXT UNIQUE NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS fruit_family (
-        family_id INTEGER PRIMARY KEY,
-        family_name TEXT UNIQUE NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS fruityvice_nutrition (
-        fruit_id INTEGER PRIMARY KEY,
-        family_id INTEGER,
-        genus TEXT,
-        fruit_order TEXT,
-        carbohydrates REAL,
-        protein REAL,
-        fat REAL,
-        calories REAL,
-        sugar REAL,
-        FOREIGN KEY (fruit_id) REFERENCES fruits(fruit_id),
-        FOREIGN KEY (family_id) REFERENCES fruit_family(family_id)
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS wiki_fruit_info (
-        fruit_id INTEGER PRIMARY KEY,
-        source_page TEXT NOT NULL,
-        note TEXT,
-        FOREIGN KEY (fruit_id) REFERENCES fruits(fruit_id)
-    );
-    """)
-
-    conn.commit()
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from pipeline.db import connect
+from pipeline.metrics import recorded
+from pipeline.migrations import LATEST, MIGRATIONS, current_version, migrate, rebuild_aggregates
+
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
+
+@recorded("migrate")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring the project database up to the latest schema version.")
+    parser.add_argument("--to", type=int, default=LATEST, help="stop at this migration version")
+    parser.add_argument("--list", action="store_true", help="show migrations and the current version")
+    parser.add_argument("--rebuild-aggregates", action="store_true",
+                        help="recompute the report summary tables from scratch")
+    args = parser.parse_args(argv)
+
+    conn = connect(DB_PATH, migrate_to=None)
+    if args.list:
+        version = current_version(conn)
+        for v, name, _ in MIGRATIONS:
+            print(f"{'*' if v <= version else ' '} {v:3d}  {name}")
+        conn.close()
+        return
+
+    applied = migrate(conn, args.to)
+    if args.rebuild_aggregates:
+        rebuild_aggregates(conn)
+    version = current_version(conn)
     conn.close()
-    print(f"Created/updated schema at {DB_PATH}")
+
+    if applied:
+        print(f"Applied migrations {applied[0]}..{applied[-1]}; {DB_PATH.name} is at version {version}.")
+    else:
+        print(f"{DB_PATH.name} is already at version {version}.")
 
 if __name__ == "__main__":
     main()
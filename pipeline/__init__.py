@@ -0,0 +1 @@
+"""Shared helpers used by the loaders and reports in jason/, corey/ and the beans script."""
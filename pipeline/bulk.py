@@ -0,0 +1,76 @@
+import sqlite3
+from typing import Dict, List, Sequence
+
+from pipeline.metrics import count, span
+
+META_UPSERT = "INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)"
+
+
+class BulkWriter:
+    """Buffers rows per INSERT statement and writes them with executemany.
+
+    Loaders call add() for every row of an entity and then checkpoint() once
+    the entity is complete. A checkpoint records the new meta cursor value and
+    flushes when enough rows are buffered, so the cursor is always committed
+    in the same transaction as the rows it covers.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = 500):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.flushes = 0
+        self._buffers: Dict[str, List[Sequence]] = {}
+        self._pending = 0
+        self._meta: Dict[str, str] = {}
+
+    def add(self, sql: str, row: Sequence) -> None:
+        # statements are flushed in first-seen order, so parents added before
+        # children keep foreign keys satisfied
+        self._buffers.setdefault(sql, []).append(row)
+        self._pending += 1
+
+    def set_meta(self, key: str, value) -> None:
+        self._meta[key] = str(value)
+
+    def checkpoint(self, key: str | None = None, value=None) -> None:
+        if key is not None:
+            self.set_meta(key, value)
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending and not self._meta:
+            return
+        try:
+            with span("db.write"):
+                for sql, rows in self._buffers.items():
+                    if rows:
+                        self.conn.executemany(sql, rows)
+                if self._meta:
+                    self.conn.executemany(META_UPSERT, list(self._meta.items()))
+            with span("db.commit"):
+                self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.rows_written += self._pending
+        self.flushes += 1
+        count("db.rows_written", self._pending)
+        count("db.flushes")
+        self._buffers.clear()
+        self._pending = 0
+        self._meta.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._buffers.clear()
+            self._pending = 0
+            self._meta.clear()
+            self.conn.rollback()
+        return False
@@ -0,0 +1,56 @@
+"""Content hashes for change detection on re-syncs.
+
+Every entity row (pokemon, fruits, web_pokemon, spells, Beans) carries a
+content_hash of the normalized payload the loader writes for it (migration
+10). A refresh re-fetches entities and runs each through a ChangeTracker. Only
+"inserted" and "updated" entities are written, with UPSERTs that leave
+unchanged child rows alone. "unchanged" ones cost a dict lookup.
+
+    tracker = ChangeTracker(conn, "pokemon", "pokemon_id")
+    status, digest = tracker.classify(pid, payload)
+    if status != UNCHANGED:
+        ...write, storing digest in content_hash...
+    print(tracker.summary())
+"""
+import hashlib
+import json
+import sqlite3
+from typing import Any, Dict, Tuple
+
+INSERTED, UPDATED, UNCHANGED = "inserted", "updated", "unchanged"
+
+
+def content_hash(payload: Any) -> str:
+    """SHA-256 of the payload as canonical JSON (sorted keys, no whitespace)."""
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ChangeTracker:
+    """Classifies entities against the content_hash stored on their rows.
+
+    Loads every (key, hash) of `table` once. Rows written before hashes
+    existed have a NULL hash and count as updated the first time round.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, key_col: str):
+        self.hashes: Dict[Any, str] = dict(conn.execute(f"SELECT {key_col}, content_hash FROM {table}"))
+        self.counts = {INSERTED: 0, UPDATED: 0, UNCHANGED: 0}
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.hashes
+
+    def classify(self, key: Any, payload: Any) -> Tuple[str, str]:
+        digest = content_hash(payload)
+        if key not in self.hashes:
+            status = INSERTED
+        elif self.hashes[key] == digest:
+            status = UNCHANGED
+        else:
+            status = UPDATED
+        self.hashes[key] = digest
+        self.counts[status] += 1
+        return status, digest
+
+    def summary(self) -> str:
+        return ", ".join(f"{n} {status}" for status, n in self.counts.items())
@@ -0,0 +1,61 @@
+"""One entry point for every project script.
+
+    python -m pipeline <command> [args...]
+    python -m pipeline --list
+
+Commands are looked up in COMMANDS and their module is imported only when
+that command runs, so `python -m pipeline load-fruit` never pays for
+matplotlib, seaborn or bs4, and `migrate` never imports requests. Anything
+after the command name is handed to that script's own argparse.
+"""
+import importlib
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.paths import add_script_paths
+
+# command -> (module, function, one-line help)
+COMMANDS: Dict[str, Tuple[str, str, str]] = {
+    "migrate": ("schema", "main", "apply pending schema migrations"),
+    "load-pokeapi": ("load_pokeapi", "main", "load the next batch of PokeAPI pokemon"),
+    "load-fruit": ("load_fruityvice", "main", "load the next batch of Fruityvice fruits"),
+    "load-web": ("load_pokemondb_website", "main", "load the next batch of pokemondb.net rows"),
+    "load-spells": ("ingest_to_db_dnd", "main", "load the next batch of D&D spells"),
+    "beans": ("SI201FinalProjectAttempt", "main", "load the next batch of Jelly Belly beans and chart them"),
+    "backfill-nutrients": ("backfill_fruityvice_long", "main", "pivot nutrients into fruit_nutrient_long"),
+    "reconcile": ("reconcile_pokemon", "main", "match PokeAPI pokemon to pokemondb rows, write the diff report"),
+    "reports": ("calc_outputs", "main", "write the report JSON/CSV files"),
+    "viz": ("make_viz", "main", "render the PokeAPI / PokemonDB charts"),
+    "spells-report": ("analyze_and_visualize_dnd", "main", "write the spell summary and charts"),
+    "render": ("pipeline.render", "main", "render every chart"),
+    "advise": ("pipeline.index_advisor", "main", "flag full scans in the report queries"),
+    "query-cache": ("pipeline.query_cache", "main", "show the report query cache hit rates, or clear it"),
+    "metrics": ("pipeline.metrics", "main", "show recent runs from run_metrics, flagging slow stages"),
+    "run": ("pipeline.orchestrator", "main", "run every stage in dependency order, loaders in parallel"),
+}
+
+
+def usage() -> str:
+    width = max(map(len, COMMANDS))
+    lines = ["usage: python -m pipeline <command> [args...]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {help_}" for name, (_, _, help_) in COMMANDS.items()]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help", "--list"):
+        print(usage())
+        return 0
+
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"unknown command: {name}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module, func, _ = COMMANDS[name]
+    add_script_paths()
+    entry = getattr(importlib.import_module(module), func)
+    sys.argv = [f"pipeline {name}"] + rest
+    entry(rest)
+    return 0
@@ -0,0 +1,198 @@
+"""NumPy backend for the report queries in calc_outputs.py and
+analyze_and_visualize_dnd.py.
+
+ColumnarStore.load(conn) reads the fact tables once into arrays, with every
+dimension id mapped to a dense integer code. Each report method then takes a
+handful of bincount/argpartition calls. The methods return the same rows as
+their SQL counterparts: same keys, order, counts and integer aggregates.
+The fruit nutrient sums use math.fsum like the SQL side's fsum(), so those
+averages match exactly too; calc_outputs._same is the comparison to use.
+
+numpy is only imported when this module is, so the SQL path never pays for it.
+
+    store = ColumnarStore.load(conn)
+    store.pokemon_avg_total_stats_by_type()
+"""
+import math
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+LOW, HIGH = "1–5", "6–9"
+
+
+def _ids(conn: sqlite3.Connection, sql: str) -> np.ndarray:
+    return np.fromiter((r[0] for r in conn.execute(sql)), dtype=np.int64)
+
+
+def _dim(conn: sqlite3.Connection, sql: str) -> Tuple[np.ndarray, List[str]]:
+    """(id -> code lookup, labels) with codes assigned in label order, so the
+    code order matches an ORDER BY on the label."""
+    rows = sorted(conn.execute(sql), key=lambda r: r[1])
+    labels = [name for _, name in rows]
+    lut = np.full(max((i for i, _ in rows), default=0) + 1, -1, dtype=np.int64)
+    for code, (dim_id, _) in enumerate(rows):
+        lut[dim_id] = code
+    return lut, labels
+
+
+def _lookup(lut: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """lut[ids], with -1 for ids outside the table (an inner join drops them)."""
+    out = np.full(len(ids), -1, dtype=np.int64)
+    ok = (ids >= 0) & (ids < len(lut))
+    out[ok] = lut[ids[ok]]
+    return out
+
+
+def _by_count_desc(labels: List[str], counts: np.ndarray) -> List[Tuple[str, int]]:
+    # labels are in name order; a stable sort on -count keeps that as the tie-break
+    order = np.argsort(-counts, kind="stable")
+    return [(labels[i], int(counts[i])) for i in order if counts[i] > 0]
+
+
+class ColumnarStore:
+    def __init__(self):
+        self.loaded_rows = 0
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "ColumnarStore":
+        s = cls()
+
+        # pokemon: per-pokemon totals computed once at load
+        stat = np.array(conn.execute("SELECT pokemon_id, base_stat FROM pokemon_stat").fetchall(),
+                         dtype=np.int64).reshape(-1, 2)
+        s.stat_pid, s.stat_value = stat[:, 0], stat[:, 1]
+        size = int(stat[:, 0].max()) + 1 if len(stat) else 1
+        s.total_by_pid = np.bincount(s.stat_pid, weights=s.stat_value, minlength=size).astype(np.int64)
+        s.has_stats = np.bincount(s.stat_pid, minlength=size) > 0
+
+        primary = conn.execute("SELECT pokemon_id, type_name FROM pokemon_type WHERE slot = 1").fetchall()
+        s.type_labels = sorted({t for _, t in primary})
+        codes = {t: i for i, t in enumerate(s.type_labels)}
+        s.primary_pid = np.fromiter((p for p, _ in primary), dtype=np.int64, count=len(primary))
+        s.primary_type = np.fromiter((codes[t] for _, t in primary), dtype=np.int64, count=len(primary))
+
+        s.pokemon = conn.execute("SELECT pokemon_id, name, weight FROM pokemon ORDER BY pokemon_id").fetchall()
+        s.pokemon_pid = np.fromiter((p for p, _, _ in s.pokemon), dtype=np.int64, count=len(s.pokemon))
+
+        # fruits: nutrient values with NULL as NaN, family/nutrient as codes
+        fnl = conn.execute("SELECT fruit_id, nutrient_id, nutrient_value FROM fruit_nutrient_long").fetchall()
+        s.fnl_fruit = np.fromiter((r[0] for r in fnl), dtype=np.int64, count=len(fnl))
+        s.fnl_nutrient = np.fromiter((r[1] for r in fnl), dtype=np.int64, count=len(fnl))
+        s.fnl_value = np.fromiter((np.nan if r[2] is None else r[2] for r in fnl), dtype=np.float64, count=len(fnl))
+        del fnl
+
+        family_lut, s.family_labels = _dim(conn, "SELECT family_id, family_name FROM fruit_family")
+        nutrient_lut, s.nutrient_labels = _dim(conn, "SELECT nutrient_id, nutrient_name FROM nutrient_dim")
+        nutrition = conn.execute(
+            "SELECT fruit_id, family_id FROM fruityvice_nutrition WHERE family_id IS NOT NULL"
+        ).fetchall()
+        fruit_family = np.full(max((f for f, _ in nutrition), default=0) + 1, -1, dtype=np.int64)
+        for fruit_id, family_id in nutrition:
+            fruit_family[fruit_id] = family_lut[family_id] if family_id < len(family_lut) else -1
+        s.fnl_family = _lookup(fruit_family, s.fnl_fruit)
+        s.fnl_nutrient_code = _lookup(nutrient_lut, s.fnl_nutrient)
+        s.fruit_names: Dict[int, str] = dict(conn.execute("SELECT fruit_id, name FROM fruits"))
+
+        # pokemondb primary types
+        web_lut, s.web_type_labels = _dim(conn, "SELECT type_id, type_name FROM web_type_dim")
+        s.web_primary = _lookup(web_lut, _ids(conn, "SELECT type_id FROM web_pokemon_type WHERE slot = 1"))
+
+        # spells
+        school_lut, s.school_labels = _dim(conn, "SELECT id, name FROM schools")
+        level_ids = dict(conn.execute("SELECT id, level_num FROM levels"))
+        level_lut = np.full(max(level_ids, default=0) + 1, -1, dtype=np.int64)
+        for level_id, level_num in level_ids.items():
+            level_lut[level_id] = level_num
+        spells = np.array(conn.execute("SELECT school_id, level_id FROM spells").fetchall(),
+                          dtype=np.int64).reshape(-1, 2)
+        s.spell_school = _lookup(school_lut, spells[:, 0])
+        s.spell_level = _lookup(level_lut, spells[:, 1])
+
+        s.loaded_rows = (len(s.stat_pid) + len(s.primary_pid) + len(s.pokemon) + len(s.fnl_fruit)
+                         + len(s.web_primary) + len(s.spell_school))
+        return s
+
+    # calc_outputs.py
+
+    def pokemon_avg_total_stats_by_type(self) -> List[dict]:
+        has = _lookup(self.has_stats.astype(np.int64), self.primary_pid) == 1
+        pids, types = self.primary_pid[has], self.primary_type[has]
+        n = len(self.type_labels)
+        sums = np.bincount(types, weights=self.total_by_pid[pids], minlength=n)
+        counts = np.bincount(types, minlength=n)
+        present = np.flatnonzero(counts)
+        avgs = sums[present] / counts[present]
+        order = np.argsort(-avgs, kind="stable")
+        return [{"type": self.type_labels[present[i]], "avg_total_stats": float(avgs[i]),
+                 "count": int(counts[present[i]])} for i in order]
+
+    def pokemon_weight_vs_total_stats(self, limit: Optional[int] = None) -> List[dict]:
+        keep = np.flatnonzero(_lookup(self.has_stats.astype(np.int64), self.pokemon_pid) == 1)[:limit]
+        totals = self.total_by_pid
+        return [{"pokemon_id": int(pid), "name": name, "weight": w, "total_stats": int(totals[pid])}
+                for pid, name, w in (self.pokemon[i] for i in keep)]
+
+    def fruit_avg_nutrients_by_family(self) -> List[dict]:
+        ok = (self.fnl_family >= 0) & (self.fnl_nutrient_code >= 0)
+        n_nut = len(self.nutrient_labels)
+        key = self.fnl_family[ok] * n_nut + self.fnl_nutrient_code[ok]
+        values = self.fnl_value[ok]
+        size = len(self.family_labels) * n_nut
+        n_rows = np.bincount(key, minlength=size)
+        n_values = np.bincount(key, weights=~np.isnan(values), minlength=size)
+        # one math.fsum per group, over the values sorted by group: the
+        # correctly rounded sum, as fsum() gives the SQL side
+        order = np.argsort(key, kind="stable")
+        groups = np.split(np.nan_to_num(values[order], nan=0.0), np.cumsum(n_rows)[:-1])
+        out = []
+        # codes follow name order, so walking keys in order is ORDER BY family, nutrient
+        for k in np.flatnonzero(n_rows):
+            fam, nut = divmod(int(k), n_nut)
+            avg = math.fsum(groups[k]) / int(n_values[k]) if n_values[k] else None
+            out.append({"family": self.family_labels[fam], "nutrient": self.nutrient_labels[nut],
+                        "avg_value": avg, "rows": int(n_rows[k])})
+        return out
+
+    def fruit_top_sugar(self, topn: int = 10) -> List[dict]:
+        if "sugar" not in self.nutrient_labels:
+            return []
+        sugar = self.nutrient_labels.index("sugar")
+        rows = np.flatnonzero((self.fnl_nutrient_code == sugar) & (self.fnl_family >= 0)
+                              & np.isin(self.fnl_fruit, np.fromiter(self.fruit_names, dtype=np.int64)))
+        # SQLite sorts NULL below every number, so DESC puts NaN last
+        keys = np.where(np.isnan(self.fnl_value[rows]), -np.inf, self.fnl_value[rows])
+        if topn < len(rows):
+            # keep every row tied with the topn-th, so the name tie-break sees them all
+            cut = np.partition(-keys, topn - 1)[topn - 1]
+            keep = -keys <= cut
+            rows, keys = rows[keep], keys[keep]
+        names = np.array([self.fruit_names[int(f)] for f in self.fnl_fruit[rows]], dtype=str)
+        # ORDER BY sugar DESC, name
+        order = np.lexsort((names, -keys))[:topn]
+        out = []
+        for i in rows[order]:
+            value = self.fnl_value[i]
+            out.append({"fruit": self.fruit_names[int(self.fnl_fruit[i])],
+                        "family": self.family_labels[self.fnl_family[i]],
+                        "sugar": None if np.isnan(value) else float(value)})
+        return out
+
+    def website_type_counts(self) -> List[dict]:
+        codes = self.web_primary[self.web_primary >= 0]
+        counts = np.bincount(codes, minlength=len(self.web_type_labels))
+        return [{"type": t, "count": n} for t, n in _by_count_desc(self.web_type_labels, counts)]
+
+    # analyze_and_visualize_dnd.py
+
+    def spells_by_school_counts(self) -> List[Tuple[str, int]]:
+        codes = self.spell_school[self.spell_school >= 0]
+        return _by_count_desc(self.school_labels, np.bincount(codes, minlength=len(self.school_labels)))
+
+    def grouped_counts_by_school_level_bucket(self) -> List[Tuple[str, str, int]]:
+        ok = (self.spell_school >= 0) & (self.spell_level >= 1) & (self.spell_level <= 9)
+        bucket = (self.spell_level[ok] >= 6).astype(np.int64)
+        counts = np.bincount(self.spell_school[ok] * 2 + bucket, minlength=len(self.school_labels) * 2)
+        return [(self.school_labels[k // 2], HIGH if k % 2 else LOW, int(counts[k]))
+                for k in np.flatnonzero(counts)]
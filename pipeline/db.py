@@ -0,0 +1,58 @@
+"""Single place every script opens the project database.
+
+connect() applies the connection PRAGMAs the loaders and reports want and
+brings the schema up to date with pipeline.migrations. Once the database is
+current that costs one PRAGMA user_version read. connect_readonly() opens a
+`mode=ro` connection with the read-side PRAGMAS and never migrates.
+Threads that share the database use pipeline.pool instead.
+"""
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from pipeline.metrics import note_database
+from pipeline.migrations import LATEST, current_version, migrate, register_functions
+from pipeline.paths import DB_PATH
+
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -64000;",     # ~64 MB page cache
+    "PRAGMA mmap_size = 268435456;",   # 256 MB
+    "PRAGMA temp_store = MEMORY;",
+)
+# the subset that means anything on a read-only connection (journal_mode
+# would have to write the header; the database is WAL once connect() ran)
+READ_PRAGMAS = (
+    "PRAGMA cache_size = -64000;",
+    "PRAGMA mmap_size = 268435456;",
+    "PRAGMA temp_store = MEMORY;",
+)
+STATEMENT_CACHE = 256  # prepared statements kept per connection (sqlite3 default: 128)
+
+
+def connect(path: Path = DB_PATH, migrate_to: Optional[int] = LATEST, **kwargs) -> sqlite3.Connection:
+    """Open `path`, apply PRAGMAS and run pending migrations up to `migrate_to`.
+
+    Pass migrate_to=None to skip migrating (e.g. read-only tools).
+    """
+    kwargs.setdefault("cached_statements", STATEMENT_CACHE)
+    conn = sqlite3.connect(path, **kwargs)
+    register_functions(conn)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if migrate_to is not None and current_version(conn) < migrate_to:
+        migrate(conn, migrate_to)
+    note_database(path)
+    return conn
+
+
+def connect_readonly(path: Path = DB_PATH, **kwargs) -> sqlite3.Connection:
+    """Open `path` read-only (a `mode=ro` URI) with READ_PRAGMAS; writes raise OperationalError."""
+    kwargs.setdefault("cached_statements", STATEMENT_CACHE)
+    conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True, **kwargs)
+    register_functions(conn)
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
@@ -0,0 +1,59 @@
+import sqlite3
+from typing import Dict
+
+# INSERT ... RETURNING landed in SQLite 3.35
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class DimResolver:
+    """Maps dimension values (stat names, type names, ...) to their surrogate ids.
+
+    The whole dimension table is read into a dict once; afterwards only values
+    never seen before touch SQLite, via a single INSERT ... RETURNING where the
+    library supports it. `hits` and `misses` count cache lookups.
+
+    A new value is committed at once unless the connection was already in a
+    transaction, so a loader never holds the write lock while it goes back to
+    fetching (other processes may be loading into the same database).
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, key_col: str, id_col: str = "id"):
+        self.conn = conn
+        self.table = table
+        self.key_col = key_col
+        self.id_col = id_col
+        self.hits = 0
+        self.misses = 0
+        self.ids: Dict = dict(conn.execute(f"SELECT {key_col}, {id_col} FROM {table}"))
+
+    def __call__(self, value) -> int:
+        dim_id = self.ids.get(value)
+        if dim_id is not None:
+            self.hits += 1
+            return dim_id
+        self.misses += 1
+        own_transaction = not self.conn.in_transaction
+        dim_id = self._create(value)
+        if own_transaction:
+            self.conn.commit()
+        self.ids[value] = dim_id
+        return dim_id
+
+    def _create(self, value) -> int:
+        if HAS_RETURNING:
+            # DO UPDATE (not DO NOTHING) so a row written by another
+            # connection since we loaded the cache still returns its id
+            return self.conn.execute(
+                f"INSERT INTO {self.table}({self.key_col}) VALUES (?) "
+                f"ON CONFLICT({self.key_col}) DO UPDATE SET {self.key_col} = excluded.{self.key_col} "
+                f"RETURNING {self.id_col}",
+                (value,)
+            ).fetchone()[0]
+        self.conn.execute(f"INSERT OR IGNORE INTO {self.table}({self.key_col}) VALUES (?)", (value,))
+        return self.conn.execute(
+            f"SELECT {self.id_col} FROM {self.table} WHERE {self.key_col} = ?",
+            (value,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.ids), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,292 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from pipeline.metrics import count, span
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_PATH = Path(os.environ.get("HTTP_CACHE_PATH", ROOT / ".http_cache.sqlite"))
+DEFAULT_TTL = float(os.environ.get("HTTP_CACHE_TTL", 24 * 3600))
+MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+OFFLINE = os.environ.get("HTTP_CACHE_OFFLINE", "") not in ("", "0")
+
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class OfflineMiss(requests.ConnectionError):
+    """Offline mode and the URL is not cached; retrying cannot help."""
+
+
+class HttpCache:
+    """On-disk GET cache shared by every fetcher in the project.
+
+    Entries are served without touching the network while younger than their
+    TTL (Cache-Control max-age if the server sent one, otherwise `ttl`). Stale
+    entries are revalidated with If-None-Match / If-Modified-Since, and a 304
+    just refreshes the timestamp. Only 200 responses are stored; the least
+    recently used entries are evicted once the bodies exceed `max_bytes`.
+    In offline mode cached entries are returned regardless of age and
+    anything uncached raises OfflineMiss (a ConnectionError). With `revalidate` set (the
+    loaders' --refresh) every entry counts as stale, so a refresh always asks
+    the server and still gets a cheap 304 for unchanged bodies.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = MAX_BYTES, offline: bool = OFFLINE, revalidate: bool = False):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.revalidate = revalidate
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                max_age REAL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used);")
+        self._conn.commit()
+
+    def get(self, url: str, session: Optional[requests.Session] = None,
+            headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> requests.Response:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT headers, body, etag, last_modified, fetched_at, max_age FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+        if row is not None:
+            cached_headers, body, etag, last_modified, fetched_at, max_age = row
+            ttl = self.ttl if max_age is None else max_age
+            if self.offline or (not self.revalidate and now - fetched_at < ttl):
+                self.hits += 1
+                count("http.cache_hits")
+                self._touch(url, now)
+                return self._response(url, cached_headers, body)
+        elif self.offline:
+            raise OfflineMiss(f"offline and not cached: {url}")
+
+        send = dict(headers or {})
+        if row is not None:
+            if etag:
+                send["If-None-Match"] = etag
+            if last_modified:
+                send["If-Modified-Since"] = last_modified
+
+        getter = session.get if session is not None else requests.get
+        with span("http.fetch"):
+            r = getter(url, headers=send, timeout=timeout)
+            body = r.content
+        self.bytes_downloaded += len(body)
+        count("http.requests")
+        count("http.bytes", len(body))
+
+        if r.status_code == 304 and row is not None:
+            self.revalidated += 1
+            count("http.not_modified")
+            self._refreshed(url, now, r.headers)
+            return self._response(url, row[0], row[1])
+
+        self.misses += 1
+        if r.status_code == 200:
+            self._store(url, r, now)
+        return r
+
+    def stream(self, url: str, chunk_size: int = 64 * 1024, session: Optional[requests.Session] = None,
+               headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> Iterator[bytes]:
+        """Yield the body of url in chunks.
+
+        A fresh cached copy (or any cached copy when offline) is served from
+        the cache. A stale one is revalidated like get() does, and a 304 is
+        served from the cache. Otherwise the body is streamed from the
+        network and copied to a temporary file as it goes. Once the reader
+        has taken the last chunk, that copy is stored with its ETag and
+        Last-Modified. A reader that stops part way through stores nothing.
+        close() the generator to drop the connection early.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched_at, max_age FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is not None:
+            etag, last_modified, fetched_at, max_age = row
+            fresh = not self.revalidate and now - fetched_at < (self.ttl if max_age is None else max_age)
+            if self.offline or fresh:
+                self.hits += 1
+                count("http.cache_hits")
+                self._touch(url, now)
+                yield from self._cached_chunks(url, chunk_size)
+                return
+        elif self.offline:
+            raise OfflineMiss(f"offline and not cached: {url}")
+
+        send = dict(headers or {})
+        if row is not None:
+            if row[0]:
+                send["If-None-Match"] = row[0]
+            if row[1]:
+                send["If-Modified-Since"] = row[1]
+
+        getter = session.get if session is not None else requests.get
+        count("http.requests")
+        with getter(url, headers=send, timeout=timeout, stream=True) as r:
+            if r.status_code == 304 and row is not None:
+                self.revalidated += 1
+                count("http.not_modified")
+                self._refreshed(url, now, r.headers)
+                yield from self._cached_chunks(url, chunk_size)
+                return
+            r.raise_for_status()
+            self.misses += 1
+            with tempfile.TemporaryFile() as copy:
+                chunks = r.iter_content(chunk_size)
+                while True:
+                    # only the network reads are timed, not the consumer between chunks
+                    with span("http.stream"):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    self.bytes_downloaded += len(chunk)
+                    count("http.bytes", len(chunk))
+                    copy.write(chunk)
+                    yield chunk
+                if r.status_code == 200:
+                    self._store_file(url, r.headers, copy, now)
+
+    def _cached_chunks(self, url: str, chunk_size: int) -> Iterator[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM responses WHERE url = ?", (url,)).fetchone()
+        body = row[0] if row is not None else b""
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    def _refreshed(self, url: str, now: float, headers) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, last_used = ?, max_age = ? WHERE url = ?",
+                (now, now, self._max_age(headers), url)
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _kept_headers(headers) -> str:
+        return json.dumps({k: v for k, v in headers.items() if k.lower() in ("content-type", "etag", "last-modified")})
+
+    def _store(self, url: str, r: requests.Response, now: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(url, headers, body, size, etag, last_modified, fetched_at, max_age, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, self._kept_headers(r.headers), r.content, len(r.content), r.headers.get("ETag"),
+                 r.headers.get("Last-Modified"), now, self._max_age(r.headers), now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _store_file(self, url: str, headers, copy, now: float) -> None:
+        """Store a streamed body from its temporary copy, a chunk at a time."""
+        size = copy.tell()
+        copy.seek(0)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR REPLACE INTO responses(url, headers, body, size, etag, last_modified, fetched_at, max_age, last_used) "
+                "VALUES (?, ?, zeroblob(?), ?, ?, ?, ?, ?, ?)",
+                (url, self._kept_headers(headers), size, size, headers.get("ETag"), headers.get("Last-Modified"),
+                 now, self._max_age(headers), now)
+            )
+            with self._conn.blobopen("responses", "body", cur.lastrowid) as blob:
+                for chunk in iter(lambda: copy.read(1024 * 1024), b""):
+                    blob.write(chunk)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for url, size in self._conn.execute("SELECT url, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((url,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+
+    def _touch(self, url: str, now: float) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+
+    @staticmethod
+    def _max_age(headers) -> Optional[float]:
+        m = MAX_AGE.search(headers.get("Cache-Control", ""))
+        return float(m.group(1)) if m else None
+
+    @staticmethod
+    def _response(url: str, headers_json: str, body: bytes) -> requests.Response:
+        r = requests.Response()
+        r.status_code = 200
+        r.url = url
+        r._content = body
+        r._content_consumed = True
+        r.headers = CaseInsensitiveDict(json.loads(headers_json))
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers) or "utf-8"
+        return r
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_shared: Optional[HttpCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> HttpCache:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HttpCache()
+        return _shared
+
+
+def cached_get(url: str, session: Optional[requests.Session] = None,
+               headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> requests.Response:
+    return shared_cache().get(url, session=session, headers=headers, timeout=timeout)
+
+
+def cached_stream(url: str, chunk_size: int = 64 * 1024, session: Optional[requests.Session] = None,
+                  headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> Iterator[bytes]:
+    return shared_cache().stream(url, chunk_size, session=session, headers=headers, timeout=timeout)
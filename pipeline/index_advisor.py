@@ -0,0 +1,137 @@
+"""Runs every report query through EXPLAIN QUERY PLAN and flags full table scans.
+
+The query set is captured, not copied: each report function runs against the
+target database with a trace callback, and every SELECT it issues is explained.
+
+    python -m pipeline.index_advisor [--db PATH] [--strict]
+"""
+import argparse
+import re
+import sqlite3
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from pipeline.db import connect_readonly
+from pipeline.paths import DB_PATH, add_script_paths
+from pipeline.query_cache import shared_query_cache
+
+# Tables small enough that scanning them is expected and harmless.
+SMALL_TABLES = {
+    "stat_dim", "web_type_dim", "fruit_family", "nutrient_dim", "schools", "levels",
+    "type_stat_totals", "family_nutrient_totals", "bean_group_dim",
+}
+
+# (query label, table) pairs whose full scan is inherent to the report.
+EXPECTED_SCANS = {
+    ("calc_outputs.pokemon_weight_vs_total_stats", "pokemon"): "scatter lists every pokemon",
+    ("SI201FinalProjectAttempt.groupSugarCounts", "Beans"): "counts every bean",
+}
+
+ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|GROUP\b|ORDER\b|LEFT\b|INNER\b)(\w+))?",
+                   re.IGNORECASE)
+SCAN = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+def query_set() -> List[Tuple[str, Callable]]:
+    add_script_paths()
+    import SI201FinalProjectAttempt as beans
+    import analyze_and_visualize_dnd as dnd
+    import calc_outputs
+    import make_viz
+
+    queries = []
+    for fn in (calc_outputs.pokemon_avg_total_stats_by_type,
+               calc_outputs.pokemon_weight_vs_total_stats,
+               calc_outputs.fruit_avg_nutrients_by_family):
+        queries.append((f"calc_outputs.{fn.__name__}", fn))
+        queries.append((f"calc_outputs.{fn.__name__} (recompute)", lambda c, fn=fn: fn(c, materialized=False)))
+    queries += [
+        ("calc_outputs.fruit_top_sugar", calc_outputs.fruit_top_sugar),
+        ("calc_outputs.website_type_counts", calc_outputs.website_type_counts),
+        ("make_viz.web_primary_type_counts", make_viz.web_primary_type_counts),
+        ("analyze_and_visualize_dnd.spells_by_school_counts", dnd.spells_by_school_counts),
+        ("analyze_and_visualize_dnd.grouped_counts_by_school_level_bucket", dnd.grouped_counts_by_school_level_bucket),
+        ("SI201FinalProjectAttempt.groupSugarCounts", beans.groupSugarCounts),
+    ]
+    return queries
+
+
+def capture(conn: sqlite3.Connection, fn: Callable) -> List[str]:
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        list(fn(conn))  # report functions may be generators
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and "sqlite_master" not in s]
+
+
+def aliases(sql: str) -> Dict[str, str]:
+    out = {}
+    for table, alias in ALIAS.findall(sql):
+        out[alias or table] = table
+        out[table] = table
+    return out
+
+
+def advise(conn: sqlite3.Connection, label: str, sql: str) -> Tuple[List[str], List[str]]:
+    """Return (plan lines, flagged full scans) for one statement."""
+    names = aliases(sql)
+    plan, flagged = [], []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        detail = row[-1]
+        plan.append(detail)
+        m = SCAN.match(detail)
+        if not m or "INDEX" in m.group(2):
+            continue
+        table = names.get(m.group(1))
+        if table is None or table in SMALL_TABLES or (label.split(" (")[0], table) in EXPECTED_SCANS:
+            continue  # subquery, tiny table, or known-necessary scan
+        flagged.append(f"full scan of {table}")
+    return plan, flagged
+
+
+def run(conn: sqlite3.Connection, verbose: bool = True) -> List[str]:
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    problems = []
+    # a cache hit would skip the very statements being captured
+    shared_query_cache().enabled = False
+    for label, fn in query_set():
+        try:
+            statements = capture(conn, fn)
+        except sqlite3.OperationalError as e:
+            if verbose:
+                print(f"-- {label}: skipped ({e})")
+            continue
+        for sql in statements:
+            plan, flagged = advise(conn, label, sql)
+            problems += [f"{label}: {f}" for f in flagged]
+            if verbose:
+                print(f"-- {label}")
+                for line in plan:
+                    print(f"     {line}")
+                for f in flagged:
+                    print(f"  !! {f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--strict", action="store_true", help="exit 1 if any full scan is flagged")
+    parser.add_argument("--quiet", action="store_true", help="only print flagged scans")
+    args = parser.parse_args(argv)
+
+    conn = connect_readonly(args.db)
+    problems = run(conn, verbose=not args.quiet)
+    conn.close()
+
+    print(f"\n{len(problems)} full table scans flagged")
+    for p in problems:
+        print(f"  {p}")
+    if args.strict and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
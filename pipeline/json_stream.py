@@ -0,0 +1,110 @@
+"""Incremental reader for one large top-level JSON array.
+
+iter_array(chunks, skip=n) reads the array a chunk at a time and yields its
+elements from index n on, decoding one element at a time. The first n are
+stepped over by a regex that only finds bracket, brace and comma positions
+outside strings, so no objects are built for them. Stop iterating (and
+close the response) once you have enough. Nothing past the last element
+asked for is read, except that a caller who iterates to the end also drains
+whatever follows the closing bracket, so a caching source (HttpCache.stream)
+sees the whole body and stores it.
+
+    for fruit in iter_array(r.iter_content(CHUNK), skip=offset):
+        ...
+"""
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator
+
+# Everything up to the next structural character, with strings consumed
+# whole so brackets and commas inside them are ignored. Possessive
+# quantifiers keep a failed match (string cut off at the buffer end) linear.
+# Commas only matter between top-level elements, so nested levels skip them.
+_STRING = r'"(?:[^"\\]++|\\.)*+"'
+TOP_LEVEL = re.compile(rf'(?:[^"\[\]{{}},]++|{_STRING})*+([\[\]{{}},])', re.DOTALL)
+NESTED = re.compile(rf'(?:[^"\[\]{{}}]++|{_STRING})*+([\[\]{{}}])', re.DOTALL)
+
+# Fast path: a whole element nested at most two levels deep (a fruit with its
+# nutritions object) and the , or ] after it, in a single match.
+_FLAT = rf'(?:[^"\[\]{{}}]++|{_STRING})*+'
+_ONE = rf'(?:\{{{_FLAT}\}}|\[{_FLAT}\])'
+_TWO = rf'(?:\{{(?:[^"\[\]{{}}]++|{_STRING}|{_ONE})*+\}}|\[(?:[^"\[\]{{}}]++|{_STRING}|{_ONE})*+\])'
+ELEMENT = re.compile(rf'((?:[^"\[\]{{}},]++|{_STRING}|{_TWO})*+)([,\]])', re.DOTALL)
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+def iter_array(chunks: Iterable[bytes], skip: int = 0, encoding: str = "utf-8") -> Iterator[Any]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0     # scan position in buf
+    start = 0   # start of the current element (just after the previous , or [)
+
+    def more() -> bool:
+        nonlocal buf, pos, start
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                # drop everything before the element in progress
+                buf = buf[start:] + text
+                pos -= start
+                start = 0
+                return True
+        text = decoder.decode(b"", final=True)
+        buf += text
+        return bool(text)
+
+    while not buf.lstrip():
+        if not more():
+            raise JSONStreamError("empty document")
+    head = buf.lstrip()
+    if head[0] != "[":
+        raise JSONStreamError("expected a top-level JSON array")
+    pos = start = len(buf) - len(head) + 1
+
+    depth = 1
+    index = 0
+    while depth:
+        m = ELEMENT.match(buf, pos) if pos == start else None
+        if m is not None:
+            c = m.group(2)
+            pos = m.end()
+            if c == "]":
+                depth = 0
+            text = m.group(1)
+            if text.strip():
+                if index >= skip:
+                    yield json.loads(text)
+                index += 1
+            elif c == "," or index:
+                raise JSONStreamError(f"empty element at index {index}")
+            start = pos
+            continue
+
+        # deeper element, or one cut off by the end of the buffer: walk it
+        m = (TOP_LEVEL if depth == 1 else NESTED).match(buf, pos)
+        if m is None:
+            if not more():
+                raise JSONStreamError(f"truncated JSON array after {index} elements")
+            continue
+        c = m.group(1)
+        pos = m.end()
+        if c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+        if depth == 0 or (depth == 1 and c == ","):
+            text = buf[start:m.start(1)]
+            if text.strip():
+                if index >= skip:
+                    yield json.loads(text)
+                index += 1
+            elif c == "," or index:
+                raise JSONStreamError(f"empty element at index {index}")
+            start = pos
+    for _ in chunks:
+        pass
@@ -0,0 +1,216 @@
+"""Per-run timings and counters, saved to the run_metrics table.
+
+The hot paths report into one process-wide Metrics object:
+
+  span(name)         times a block. Totals are summed over every thread, so
+                     http.fetch can add up to more than the run's wall time
+                     when workers fetch in parallel.
+  observe(name, s)   records a duration measured elsewhere (a render worker)
+  count(name, n)     adds to a counter (bytes, rows, retries, backoff seconds)
+
+The stages are http.fetch / http.stream, parse.json / parse.html, db.write /
+db.commit, db.query, report and render.
+
+Each script's main() is wrapped in @recorded("<command>"). A recorded run
+resets the counters, runs, and then writes one row to run_metrics
+(migration 13) in the database the run opened through pipeline.db.connect:
+command, argv, start time, wall seconds, status and the spans and counters
+as JSON. A run that never opened the database (--help), or left it below
+migration 13, saves nothing; saving never migrates.
+Recorded runs do not nest: a main() called from inside another run adds to
+the outer run's record.
+
+    python -m pipeline.metrics                  # last runs, slow spans flagged
+    python -m pipeline.metrics --command load-pokeapi --last 20
+"""
+import argparse
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pipeline.paths import DB_PATH
+
+REGRESSION_RATIO = 1.5  # a span this much slower than its median over past runs is flagged
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: Dict[str, List[float]] = {}     # name -> [count, total_s, max_s]
+        self.counters: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self.spans.get(name)
+            if s is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                s[0] += 1
+                s[1] += seconds
+                s[2] = max(s[2], seconds)
+
+    def count(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "spans": {k: {"count": int(c), "total_s": round(t, 6), "max_s": round(m, 6)}
+                          for k, (c, t, m) in sorted(self.spans.items())},
+                "counters": {k: (round(v, 6) if isinstance(v, float) else v) for k, v in sorted(self.counters.items())},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+METRICS = Metrics()
+span = METRICS.span
+observe = METRICS.observe
+count = METRICS.count
+
+_run: Optional[dict] = None
+_run_lock = threading.Lock()
+
+
+def note_database(path) -> None:
+    """Called by pipeline.db.connect: the first database a run opens is where its record goes."""
+    run = _run
+    if run is not None and run["db"] is None:
+        run["db"] = Path(path)
+
+
+def save_run(path: Path, record: dict) -> Optional[int]:
+    """Insert `record` into run_metrics; None if the database has no run_metrics yet.
+
+    The database is opened without migrating: recording `migrate --to 5`
+    must leave it at version 5.
+    """
+    from pipeline.db import connect
+
+    conn = connect(path, migrate_to=None)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'run_metrics'").fetchone() is None:
+            return None
+        cur = conn.execute(
+            "INSERT INTO run_metrics(command, started_at, wall_s, status, metrics) VALUES (?, ?, ?, ?, ?)",
+            (record["command"], record["started_at"], record["wall_s"], record["status"],
+             json.dumps({k: record[k] for k in ("argv", "spans", "counters")}))
+        )
+        conn.commit()
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def recorded(command: str):
+    """Decorator for a script's main(argv=None): record the run in run_metrics."""
+    def wrap(main):
+        @functools.wraps(main)
+        def run(argv=None, *args, **kwargs):
+            global _run
+            with _run_lock:
+                nested = _run is not None
+                if not nested:
+                    _run = {"db": None}
+                    METRICS.reset()
+            if nested:
+                return main(argv, *args, **kwargs)
+
+            started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = main(argv, *args, **kwargs)
+                status = "ok"
+                return result
+            except SystemExit as e:
+                status = "ok" if e.code in (None, 0) else "exit"
+                raise
+            finally:
+                wall = time.perf_counter() - start
+                with _run_lock:
+                    db, _run = _run["db"], None
+                if db is not None:
+                    record = {"command": command, "argv": list(sys.argv[1:] if argv is None else argv),
+                              "started_at": started, "wall_s": round(wall, 6), "status": status,
+                              **METRICS.snapshot()}
+                    try:
+                        save_run(db, record)
+                    except Exception as e:  # metrics must never fail the run itself
+                        print(f"run_metrics not saved: {e}", file=sys.stderr)
+        return run
+    return wrap
+
+
+def load_runs(conn, command: Optional[str] = None, last: int = 10) -> List[dict]:
+    where, params = ("WHERE command = ?", (command,)) if command else ("", ())
+    rows = conn.execute(f"""
+        SELECT run_id, command, started_at, wall_s, status, metrics
+        FROM run_metrics {where}
+        ORDER BY run_id DESC LIMIT ?
+    """, (*params, last)).fetchall()
+    return [{"run_id": r, "command": c, "started_at": s, "wall_s": w, "status": st, **json.loads(m)}
+            for r, c, s, w, st, m in rows]
+
+
+def regressions(run: dict, history: List[dict], ratio: float = REGRESSION_RATIO) -> List[str]:
+    """Spans (and the wall time) of `run` over `ratio` x their median in earlier ok runs."""
+    import statistics
+
+    past = [h for h in history if h["run_id"] < run["run_id"] and h["status"] == "ok"]
+    if not past:
+        return []
+    flagged = []
+    base = statistics.median(h["wall_s"] for h in past)
+    if base > 0 and run["wall_s"] > ratio * base:
+        flagged.append(f"wall {run['wall_s']:.2f}s vs median {base:.2f}s")
+    for name, s in run["spans"].items():
+        totals = [h["spans"][name]["total_s"] for h in past if name in h["spans"]]
+        if totals:
+            base = statistics.median(totals)
+            if base > 0 and s["total_s"] > ratio * base:
+                flagged.append(f"{name} {s['total_s']:.3f}s vs median {base:.3f}s")
+    return flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show recent pipeline runs from run_metrics.")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--command", help="only runs of this command")
+    parser.add_argument("--last", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    from pipeline.db import connect_readonly
+    conn = connect_readonly(args.db)
+    runs = load_runs(conn, args.command, args.last)
+    for run in runs:
+        history = load_runs(conn, run["command"], 50)
+        top = sorted(run["spans"].items(), key=lambda kv: -kv[1]["total_s"])[:4]
+        spans = ", ".join(f"{k} {v['total_s']:.2f}s/{v['count']}" for k, v in top)
+        print(f"#{run['run_id']:<5} {run['started_at']}  {run['command']:<16} {run['status']:<5} "
+              f"{run['wall_s']:>8.2f}s  {spans}")
+        for flag in regressions(run, history):
+            print(f"       !! slower: {flag}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,840 @@
+"""Versioned schema migrations for GamerSoups_final_project.sqlite.
+
+Each migration is plain SQL. migrate() compares PRAGMA user_version with the
+last version below and applies only the pending ones, all inside a single
+transaction, so an up-to-date database costs one PRAGMA read at startup.
+Every CREATE is idempotent (IF NOT EXISTS), so databases created by the
+old schema.py / schema_patch*.py scripts start at version 0 and upgrade
+cleanly. The ADD COLUMNs of migrations 10 and 14 are not, but those columns
+never existed before them.
+"""
+import math
+import sqlite3
+from typing import List, Optional, Tuple
+
+BASE_TABLES = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pokemon (
+    pokemon_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    height INTEGER,
+    weight INTEGER,
+    base_experience INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS pokemon_type (
+    pokemon_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    type_name TEXT NOT NULL,
+    PRIMARY KEY (pokemon_id, slot),
+    FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id)
+);
+
+CREATE TABLE IF NOT EXISTS stat_dim (
+    stat_id INTEGER PRIMARY KEY,
+    stat_name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pokemon_stat (
+    pokemon_id INTEGER NOT NULL,
+    stat_id INTEGER NOT NULL,
+    base_stat INTEGER NOT NULL,
+    effort INTEGER NOT NULL,
+    PRIMARY KEY (pokemon_id, stat_id),
+    FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id),
+    FOREIGN KEY (stat_id) REFERENCES stat_dim(stat_id)
+);
+
+CREATE TABLE IF NOT EXISTS fruits (
+    fruit_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fruit_family (
+    family_id INTEGER PRIMARY KEY,
+    family_name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fruityvice_nutrition (
+    fruit_id INTEGER PRIMARY KEY,
+    family_id INTEGER,
+    genus TEXT,
+    fruit_order TEXT,
+    carbohydrates REAL,
+    protein REAL,
+    fat REAL,
+    calories REAL,
+    sugar REAL,
+    FOREIGN KEY (fruit_id) REFERENCES fruits(fruit_id),
+    FOREIGN KEY (family_id) REFERENCES fruit_family(family_id)
+);
+
+CREATE TABLE IF NOT EXISTS wiki_fruit_info (
+    fruit_id INTEGER PRIMARY KEY,
+    source_page TEXT NOT NULL,
+    note TEXT,
+    FOREIGN KEY (fruit_id) REFERENCES fruits(fruit_id)
+);
+"""
+
+SCRAPED_FRUIT_ROWS = """
+CREATE TABLE IF NOT EXISTS scraped_fruit_rows (
+    row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_page TEXT NOT NULL,
+    item_name TEXT NOT NULL,
+    item_value TEXT,
+    UNIQUE(source_page, item_name, item_value)
+);
+"""
+
+NUTRIENT_TABLES = """
+CREATE TABLE IF NOT EXISTS nutrient_dim (
+    nutrient_id INTEGER PRIMARY KEY,
+    nutrient_name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fruit_nutrient_long (
+    fruit_id INTEGER NOT NULL,
+    nutrient_id INTEGER NOT NULL,
+    nutrient_value REAL,
+    PRIMARY KEY (fruit_id, nutrient_id),
+    FOREIGN KEY (fruit_id) REFERENCES fruits(fruit_id),
+    FOREIGN KEY (nutrient_id) REFERENCES nutrient_dim(nutrient_id)
+);
+"""
+
+WEB_TABLES = """
+CREATE TABLE IF NOT EXISTS web_pokemon (
+    dex_num INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS web_type_dim (
+    type_id INTEGER PRIMARY KEY,
+    type_name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS web_pokemon_type (
+    dex_num INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    type_id INTEGER NOT NULL,
+    PRIMARY KEY (dex_num, slot),
+    FOREIGN KEY (dex_num) REFERENCES web_pokemon(dex_num),
+    FOREIGN KEY (type_id) REFERENCES web_type_dim(type_id)
+);
+"""
+
+DND_TABLES = """
+CREATE TABLE IF NOT EXISTS schools (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS levels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    level_num INTEGER UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS spells (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    api_index TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    school_id INTEGER NOT NULL,
+    level_id INTEGER NOT NULL,
+    FOREIGN KEY (school_id) REFERENCES schools(id),
+    FOREIGN KEY (level_id) REFERENCES levels(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_spells_school ON spells(school_id);
+CREATE INDEX IF NOT EXISTS idx_spells_level ON spells(level_id);
+"""
+
+BEANS_TABLE = """
+CREATE TABLE IF NOT EXISTS Beans (id INTEGER PRIMARY KEY, name TEXT, groupName TEXT, sugarFree BOOLEAN);
+"""
+
+# Summary tables read by calc_outputs.py. Triggers keep them in step with the
+# fact tables inside whatever transaction the loaders write in, so the
+# reports cost O(groups) instead of re-aggregating every stat/nutrient row.
+#
+#   pokemon_total_stats        one row per pokemon that has stats
+#   type_stat_totals           running sum/count of those totals per primary type
+#   family_nutrient_totals     running sum/counts per (fruit family, nutrient)
+#
+# calc_outputs.py --check compares them against a full recompute; rebuild
+# with `python jason/scripts/schema.py --rebuild-aggregates` if they drift.
+AGGREGATE_TABLES = """
+CREATE TABLE IF NOT EXISTS pokemon_total_stats (
+    pokemon_id INTEGER PRIMARY KEY,
+    total_stats INTEGER NOT NULL,
+    n_stats INTEGER NOT NULL,
+    FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id)
+);
+
+CREATE TABLE IF NOT EXISTS type_stat_totals (
+    type_name TEXT PRIMARY KEY,
+    sum_total_stats INTEGER NOT NULL,
+    pokemon_count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS family_nutrient_totals (
+    family_id INTEGER NOT NULL,
+    nutrient_id INTEGER NOT NULL,
+    sum_value REAL NOT NULL,
+    n_values INTEGER NOT NULL,
+    n_rows INTEGER NOT NULL,
+    PRIMARY KEY (family_id, nutrient_id),
+    FOREIGN KEY (family_id) REFERENCES fruit_family(family_id),
+    FOREIGN KEY (nutrient_id) REFERENCES nutrient_dim(nutrient_id)
+);
+"""
+
+POKEMON_TRIGGERS = """
+-- pokemon_stat -> pokemon_total_stats
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_stat_ins AFTER INSERT ON pokemon_stat
+BEGIN
+    INSERT INTO pokemon_total_stats(pokemon_id, total_stats, n_stats)
+    VALUES (new.pokemon_id, new.base_stat, 1)
+    ON CONFLICT(pokemon_id) DO UPDATE SET
+        total_stats = total_stats + excluded.total_stats,
+        n_stats = n_stats + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_stat_del AFTER DELETE ON pokemon_stat
+BEGIN
+    UPDATE pokemon_total_stats
+    SET total_stats = total_stats - old.base_stat, n_stats = n_stats - 1
+    WHERE pokemon_id = old.pokemon_id;
+    DELETE FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id AND n_stats <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_stat_upd AFTER UPDATE OF pokemon_id, base_stat ON pokemon_stat
+BEGIN
+    UPDATE pokemon_total_stats
+    SET total_stats = total_stats - old.base_stat, n_stats = n_stats - 1
+    WHERE pokemon_id = old.pokemon_id;
+    DELETE FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id AND n_stats <= 0;
+    INSERT INTO pokemon_total_stats(pokemon_id, total_stats, n_stats)
+    VALUES (new.pokemon_id, new.base_stat, 1)
+    ON CONFLICT(pokemon_id) DO UPDATE SET
+        total_stats = total_stats + excluded.total_stats,
+        n_stats = n_stats + 1;
+END;
+
+-- pokemon_total_stats -> type_stat_totals (primary type only)
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_total_ins AFTER INSERT ON pokemon_total_stats
+BEGIN
+    INSERT INTO type_stat_totals(type_name, sum_total_stats, pokemon_count)
+    SELECT type_name, new.total_stats, 1
+    FROM pokemon_type WHERE pokemon_id = new.pokemon_id AND slot = 1
+    ON CONFLICT(type_name) DO UPDATE SET
+        sum_total_stats = sum_total_stats + excluded.sum_total_stats,
+        pokemon_count = pokemon_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_total_upd AFTER UPDATE OF total_stats ON pokemon_total_stats
+BEGIN
+    UPDATE type_stat_totals
+    SET sum_total_stats = sum_total_stats + new.total_stats - old.total_stats
+    WHERE type_name = (SELECT type_name FROM pokemon_type WHERE pokemon_id = new.pokemon_id AND slot = 1);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_total_del AFTER DELETE ON pokemon_total_stats
+BEGIN
+    UPDATE type_stat_totals
+    SET sum_total_stats = sum_total_stats - old.total_stats, pokemon_count = pokemon_count - 1
+    WHERE type_name = (SELECT type_name FROM pokemon_type WHERE pokemon_id = old.pokemon_id AND slot = 1);
+    DELETE FROM type_stat_totals WHERE pokemon_count <= 0;
+END;
+
+-- pokemon_type (slot 1) -> type_stat_totals, for pokemon whose stats landed first
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_type_ins AFTER INSERT ON pokemon_type WHEN new.slot = 1
+BEGIN
+    INSERT INTO type_stat_totals(type_name, sum_total_stats, pokemon_count)
+    SELECT new.type_name, total_stats, 1
+    FROM pokemon_total_stats WHERE pokemon_id = new.pokemon_id
+    ON CONFLICT(type_name) DO UPDATE SET
+        sum_total_stats = sum_total_stats + excluded.sum_total_stats,
+        pokemon_count = pokemon_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_type_del AFTER DELETE ON pokemon_type WHEN old.slot = 1
+BEGIN
+    UPDATE type_stat_totals
+    SET sum_total_stats = sum_total_stats - (SELECT total_stats FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id),
+        pokemon_count = pokemon_count - 1
+    WHERE type_name = old.type_name
+      AND EXISTS (SELECT 1 FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id);
+    DELETE FROM type_stat_totals WHERE pokemon_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pokemon_type_upd AFTER UPDATE ON pokemon_type
+BEGIN
+    UPDATE type_stat_totals
+    SET sum_total_stats = sum_total_stats - (SELECT total_stats FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id),
+        pokemon_count = pokemon_count - 1
+    WHERE old.slot = 1 AND type_name = old.type_name
+      AND EXISTS (SELECT 1 FROM pokemon_total_stats WHERE pokemon_id = old.pokemon_id);
+    INSERT INTO type_stat_totals(type_name, sum_total_stats, pokemon_count)
+    SELECT new.type_name, total_stats, 1
+    FROM pokemon_total_stats WHERE new.slot = 1 AND pokemon_id = new.pokemon_id
+    ON CONFLICT(type_name) DO UPDATE SET
+        sum_total_stats = sum_total_stats + excluded.sum_total_stats,
+        pokemon_count = pokemon_count + 1;
+    DELETE FROM type_stat_totals WHERE pokemon_count <= 0;
+END;
+"""
+
+FRUIT_TRIGGERS = """
+-- fruit_nutrient_long -> family_nutrient_totals via the fruit's family
+CREATE TRIGGER IF NOT EXISTS trg_fruit_nutrient_ins AFTER INSERT ON fruit_nutrient_long
+BEGIN
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows)
+    SELECT family_id, new.nutrient_id, COALESCE(new.nutrient_value, 0), new.nutrient_value IS NOT NULL, 1
+    FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id AND family_id IS NOT NULL
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        sum_value = sum_value + excluded.sum_value,
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fruit_nutrient_del AFTER DELETE ON fruit_nutrient_long
+BEGIN
+    UPDATE family_nutrient_totals
+    SET sum_value = sum_value - COALESCE(old.nutrient_value, 0),
+        n_values = n_values - (old.nutrient_value IS NOT NULL),
+        n_rows = n_rows - 1
+    WHERE nutrient_id = old.nutrient_id
+      AND family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = old.fruit_id);
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fruit_nutrient_upd AFTER UPDATE ON fruit_nutrient_long
+BEGIN
+    UPDATE family_nutrient_totals
+    SET sum_value = sum_value - COALESCE(old.nutrient_value, 0),
+        n_values = n_values - (old.nutrient_value IS NOT NULL),
+        n_rows = n_rows - 1
+    WHERE nutrient_id = old.nutrient_id
+      AND family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = old.fruit_id);
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows)
+    SELECT family_id, new.nutrient_id, COALESCE(new.nutrient_value, 0), new.nutrient_value IS NOT NULL, 1
+    FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id AND family_id IS NOT NULL
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        sum_value = sum_value + excluded.sum_value,
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + 1;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+-- fruityvice_nutrition decides which family a fruit's nutrients count toward.
+-- INSERT OR REPLACE does not fire delete triggers, so the row being replaced
+-- is backed out in a BEFORE INSERT trigger instead.
+CREATE TRIGGER IF NOT EXISTS trg_fruit_family_replace BEFORE INSERT ON fruityvice_nutrition
+BEGIN
+    UPDATE family_nutrient_totals
+    SET sum_value = sum_value - (SELECT COALESCE(SUM(nutrient_value), 0) FROM fruit_nutrient_long l
+                                 WHERE l.fruit_id = new.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_values = n_values - (SELECT COUNT(nutrient_value) FROM fruit_nutrient_long l
+                               WHERE l.fruit_id = new.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_rows = n_rows - (SELECT COUNT(*) FROM fruit_nutrient_long l
+                           WHERE l.fruit_id = new.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id)
+    WHERE family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id);
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fruit_family_ins AFTER INSERT ON fruityvice_nutrition WHEN new.family_id IS NOT NULL
+BEGIN
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows)
+    SELECT new.family_id, nutrient_id, COALESCE(SUM(nutrient_value), 0), COUNT(nutrient_value), COUNT(*)
+    FROM fruit_nutrient_long WHERE fruit_id = new.fruit_id
+    GROUP BY nutrient_id
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        sum_value = sum_value + excluded.sum_value,
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + excluded.n_rows;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fruit_family_del AFTER DELETE ON fruityvice_nutrition WHEN old.family_id IS NOT NULL
+BEGIN
+    UPDATE family_nutrient_totals
+    SET sum_value = sum_value - (SELECT COALESCE(SUM(nutrient_value), 0) FROM fruit_nutrient_long l
+                                 WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_values = n_values - (SELECT COUNT(nutrient_value) FROM fruit_nutrient_long l
+                               WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_rows = n_rows - (SELECT COUNT(*) FROM fruit_nutrient_long l
+                           WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id)
+    WHERE family_id = old.family_id;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fruit_family_upd AFTER UPDATE OF fruit_id, family_id ON fruityvice_nutrition
+BEGIN
+    UPDATE family_nutrient_totals
+    SET sum_value = sum_value - (SELECT COALESCE(SUM(nutrient_value), 0) FROM fruit_nutrient_long l
+                                 WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_values = n_values - (SELECT COUNT(nutrient_value) FROM fruit_nutrient_long l
+                               WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id),
+        n_rows = n_rows - (SELECT COUNT(*) FROM fruit_nutrient_long l
+                           WHERE l.fruit_id = old.fruit_id AND l.nutrient_id = family_nutrient_totals.nutrient_id)
+    WHERE family_id = old.family_id;
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows)
+    SELECT new.family_id, nutrient_id, COALESCE(SUM(nutrient_value), 0), COUNT(nutrient_value), COUNT(*)
+    FROM fruit_nutrient_long WHERE new.family_id IS NOT NULL AND fruit_id = new.fruit_id
+    GROUP BY nutrient_id
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        sum_value = sum_value + excluded.sum_value,
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + excluded.n_rows;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+"""
+
+REBUILD_AGGREGATES = """
+DELETE FROM type_stat_totals;
+DELETE FROM pokemon_total_stats;
+DELETE FROM family_nutrient_totals;
+
+-- type_stat_totals is filled by trg_pokemon_total_ins as these land
+INSERT INTO pokemon_total_stats(pokemon_id, total_stats, n_stats)
+SELECT pokemon_id, SUM(base_stat), COUNT(*)
+FROM pokemon_stat
+GROUP BY pokemon_id;
+
+INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows)
+SELECT fn.family_id, fnl.nutrient_id,
+       COALESCE(SUM(fnl.nutrient_value), 0), COUNT(fnl.nutrient_value), COUNT(*)
+FROM fruit_nutrient_long fnl
+JOIN fruityvice_nutrition fn ON fn.fruit_id = fnl.fruit_id
+WHERE fn.family_id IS NOT NULL
+GROUP BY fn.family_id, fnl.nutrient_id;
+"""
+
+# Covering indexes for the report queries in calc_outputs.py, make_viz.py and
+# corey/code/analyze_and_visualize_dnd.py; `python -m pipeline.index_advisor`
+# shows the resulting plans.
+REPORT_INDEXES = """
+-- SUM(base_stat) GROUP BY pokemon_id (per-pokemon totals, scatter)
+CREATE INDEX IF NOT EXISTS idx_pokemon_stat_total ON pokemon_stat(pokemon_id, base_stat);
+-- primary type (slot = 1) lookups, grouped by type
+CREATE INDEX IF NOT EXISTS idx_pokemon_type_primary ON pokemon_type(slot, type_name, pokemon_id);
+CREATE INDEX IF NOT EXISTS idx_web_pokemon_type_primary ON web_pokemon_type(slot, type_id, dex_num);
+-- nutrient_name = 'sugar' ... ORDER BY value DESC LIMIT n, and per-nutrient averages
+CREATE INDEX IF NOT EXISTS idx_fruit_nutrient_long_nutrient ON fruit_nutrient_long(nutrient_id, nutrient_value, fruit_id);
+-- family joins and the aggregate triggers
+CREATE INDEX IF NOT EXISTS idx_fruityvice_nutrition_family ON fruityvice_nutrition(family_id, fruit_id);
+-- spells by school / by school and level bucket
+CREATE INDEX IF NOT EXISTS idx_spells_school_level ON spells(school_id, level_id);
+ANALYZE;
+"""
+
+# Beans.groupName holds the API's group list joined with ", ". The bridge
+# lets the sugar-free chart count per group with one GROUP BY; existing rows
+# are split here with a recursive CTE, new ones are written by the loader.
+BEAN_GROUPS = """
+CREATE TABLE IF NOT EXISTS bean_group_dim (
+    group_id INTEGER PRIMARY KEY,
+    group_name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bean_group (
+    bean_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    PRIMARY KEY (bean_id, group_id),
+    FOREIGN KEY (bean_id) REFERENCES Beans(id),
+    FOREIGN KEY (group_id) REFERENCES bean_group_dim(group_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_bean_group_group ON bean_group(group_id, bean_id);
+
+CREATE TEMP TABLE bean_group_split AS
+WITH RECURSIVE split(bean_id, pos, group_name, rest) AS (
+    SELECT id, 0, NULL, groupName || ',' FROM Beans WHERE COALESCE(groupName, '') <> ''
+    UNION ALL
+    SELECT bean_id, pos + 1, trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)
+    FROM split WHERE rest <> ''
+)
+SELECT bean_id, pos, group_name FROM split WHERE group_name <> '';
+
+INSERT OR IGNORE INTO bean_group_dim(group_name)
+SELECT group_name FROM bean_group_split GROUP BY group_name ORDER BY MIN(bean_id), MIN(pos);
+
+INSERT OR IGNORE INTO bean_group(bean_id, group_id)
+SELECT s.bean_id, d.group_id
+FROM bean_group_split s
+JOIN bean_group_dim d ON d.group_name = s.group_name;
+
+DROP TABLE bean_group_split;
+"""
+
+# sha256 of each entity's normalized payload, written by the loaders (see
+# pipeline/changes.py). NULL until the row is next written.
+CONTENT_HASHES = """
+ALTER TABLE pokemon ADD COLUMN content_hash TEXT;
+ALTER TABLE fruits ADD COLUMN content_hash TEXT;
+ALTER TABLE web_pokemon ADD COLUMN content_hash TEXT;
+ALTER TABLE spells ADD COLUMN content_hash TEXT;
+ALTER TABLE Beans ADD COLUMN content_hash TEXT;
+"""
+
+# PokeAPI pokemon_id -> pokemondb dex_num, written by
+# jason/scripts/reconcile_pokemon.py. dex_num is NULL when nothing matched.
+# Types are the slot-ordered names joined with "/". api_hash / web_hash are
+# the two rows' content_hash when the match was made, so an incremental run
+# only revisits pairs whose source rows changed since.
+POKEMON_XREF = """
+CREATE TABLE IF NOT EXISTS pokemon_xref (
+    pokemon_id INTEGER PRIMARY KEY,
+    dex_num INTEGER,
+    method TEXT NOT NULL,
+    api_types TEXT NOT NULL,
+    web_types TEXT,
+    types_agree INTEGER,
+    api_hash TEXT,
+    web_hash TEXT,
+    FOREIGN KEY (pokemon_id) REFERENCES pokemon(pokemon_id),
+    FOREIGN KEY (dex_num) REFERENCES web_pokemon(dex_num)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pokemon_xref_dex ON pokemon_xref(dex_num, pokemon_id);
+CREATE INDEX IF NOT EXISTS idx_pokemon_xref_disagree ON pokemon_xref(pokemon_id) WHERE types_agree = 0;
+"""
+
+# Per-table change counters for pipeline/query_cache.py. Every insert,
+# update or delete on a data table bumps its row here in the same
+# transaction, so a cached result is current exactly when the versions of the
+# tables it read are unchanged. data_generation tells apart two database files
+# that happen to have the same counters.
+VERSIONED_TABLES = (
+    "pokemon", "pokemon_type", "stat_dim", "pokemon_stat", "pokemon_total_stats", "type_stat_totals",
+    "pokemon_xref", "fruits", "fruityvice_nutrition", "fruit_family", "nutrient_dim", "fruit_nutrient_long",
+    "family_nutrient_totals", "scraped_fruit_rows", "wiki_fruit_info", "web_pokemon", "web_pokemon_type",
+    "web_type_dim", "spells", "schools", "levels", "Beans", "bean_group", "bean_group_dim",
+)
+
+TABLE_VERSIONS = """
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO meta(key, value) VALUES ('data_generation', lower(hex(randomblob(16))));
+""" + "".join(f"""
+INSERT OR IGNORE INTO table_versions(table_name) VALUES ('{t}');
+""" + "".join(f"""
+CREATE TRIGGER IF NOT EXISTS trg_{t}_version_{op[:3].lower()} AFTER {op} ON {t}
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE table_name = '{t}';
+END;
+""" for op in ("INSERT", "UPDATE", "DELETE")) for t in VERSIONED_TABLES)
+
+# One row per recorded script run (pipeline/metrics.py). metrics is JSON:
+# {"argv": [...], "spans": {name: {count, total_s, max_s}}, "counters": {name: n}}.
+RUN_METRICS = """
+CREATE TABLE IF NOT EXISTS run_metrics (
+    run_id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    wall_s REAL NOT NULL,
+    status TEXT NOT NULL,
+    metrics TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_run_metrics_command ON run_metrics(command, run_id);
+"""
+
+# FRUIT_TRIGGERS keep family_nutrient_totals.sum_value as a running float
+# sum, which drifts from AVG() in the last bits: float addition is not
+# associative, so the result depends on the order rows arrived and left in.
+# From migration 14 each group also keeps sum_exact, the sum as math.fsum's
+# partials (exact, see ExactSum), and sum_value is that rounded once. Adding or
+# backing out a value stays O(1), and the result no longer depends on the
+# history. The triggers call the fsum_* functions from register_functions();
+# connect() and migrate() register them, any other connection that writes
+# the fruit tables must too.
+def _add(value: str) -> str:
+    return (f"sum_exact = fsum_add(sum_exact, {value}), "
+            f"sum_value = fsum_value(fsum_add(sum_exact, {value}))")
+
+
+def _fruit_value(fruit: str) -> str:
+    return (f"(SELECT nutrient_value FROM fruit_nutrient_long l "
+            f"WHERE l.fruit_id = {fruit} AND l.nutrient_id = family_nutrient_totals.nutrient_id)")
+
+
+def _fruit_count(fruit: str, column: str) -> str:
+    return (f"(SELECT COUNT({column}) FROM fruit_nutrient_long l "
+            f"WHERE l.fruit_id = {fruit} AND l.nutrient_id = family_nutrient_totals.nutrient_id)")
+
+
+REBUILD_EXACT_FAMILY_TOTALS = """
+DELETE FROM family_nutrient_totals;
+INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows, sum_exact)
+SELECT fn.family_id, fnl.nutrient_id,
+       COALESCE(fsum(fnl.nutrient_value), 0), COUNT(fnl.nutrient_value), COUNT(*), fsum_state(fnl.nutrient_value)
+FROM fruit_nutrient_long fnl
+JOIN fruityvice_nutrition fn ON fn.fruit_id = fnl.fruit_id
+WHERE fn.family_id IS NOT NULL
+GROUP BY fn.family_id, fnl.nutrient_id;
+"""
+
+EXACT_FAMILY_TOTALS = "".join(f"DROP TRIGGER IF EXISTS {name};\n" for name in (
+    "trg_fruit_nutrient_ins", "trg_fruit_nutrient_del", "trg_fruit_nutrient_upd", "trg_fruit_family_replace",
+    "trg_fruit_family_ins", "trg_fruit_family_del", "trg_fruit_family_upd")) + f"""
+ALTER TABLE family_nutrient_totals ADD COLUMN sum_exact TEXT NOT NULL DEFAULT '';
+
+-- fruit_nutrient_long -> family_nutrient_totals via the fruit's family
+CREATE TRIGGER trg_fruit_nutrient_ins AFTER INSERT ON fruit_nutrient_long
+BEGIN
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows, sum_exact)
+    SELECT family_id, new.nutrient_id, COALESCE(new.nutrient_value, 0), new.nutrient_value IS NOT NULL, 1,
+           fsum_add('', new.nutrient_value)
+    FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id AND family_id IS NOT NULL
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        {_add("excluded.sum_value")},
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + 1;
+END;
+
+CREATE TRIGGER trg_fruit_nutrient_del AFTER DELETE ON fruit_nutrient_long
+BEGIN
+    UPDATE family_nutrient_totals
+    SET {_add("-old.nutrient_value")},
+        n_values = n_values - (old.nutrient_value IS NOT NULL),
+        n_rows = n_rows - 1
+    WHERE nutrient_id = old.nutrient_id
+      AND family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = old.fruit_id);
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER trg_fruit_nutrient_upd AFTER UPDATE ON fruit_nutrient_long
+BEGIN
+    UPDATE family_nutrient_totals
+    SET {_add("-old.nutrient_value")},
+        n_values = n_values - (old.nutrient_value IS NOT NULL),
+        n_rows = n_rows - 1
+    WHERE nutrient_id = old.nutrient_id
+      AND family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = old.fruit_id);
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows, sum_exact)
+    SELECT family_id, new.nutrient_id, COALESCE(new.nutrient_value, 0), new.nutrient_value IS NOT NULL, 1,
+           fsum_add('', new.nutrient_value)
+    FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id AND family_id IS NOT NULL
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        {_add("excluded.sum_value")},
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + 1;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+-- fruityvice_nutrition decides which family a fruit's nutrients count toward.
+-- INSERT OR REPLACE does not fire delete triggers, so the row being replaced
+-- is backed out in a BEFORE INSERT trigger instead.
+CREATE TRIGGER trg_fruit_family_replace BEFORE INSERT ON fruityvice_nutrition
+BEGIN
+    UPDATE family_nutrient_totals
+    SET {_add("-" + _fruit_value("new.fruit_id"))},
+        n_values = n_values - {_fruit_count("new.fruit_id", "nutrient_value")},
+        n_rows = n_rows - {_fruit_count("new.fruit_id", "*")}
+    WHERE family_id = (SELECT family_id FROM fruityvice_nutrition WHERE fruit_id = new.fruit_id);
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER trg_fruit_family_ins AFTER INSERT ON fruityvice_nutrition WHEN new.family_id IS NOT NULL
+BEGIN
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows, sum_exact)
+    SELECT new.family_id, nutrient_id, COALESCE(nutrient_value, 0), nutrient_value IS NOT NULL, 1,
+           fsum_add('', nutrient_value)
+    FROM fruit_nutrient_long WHERE fruit_id = new.fruit_id
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        {_add("excluded.sum_value")},
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + excluded.n_rows;
+END;
+
+CREATE TRIGGER trg_fruit_family_del AFTER DELETE ON fruityvice_nutrition WHEN old.family_id IS NOT NULL
+BEGIN
+    UPDATE family_nutrient_totals
+    SET {_add("-" + _fruit_value("old.fruit_id"))},
+        n_values = n_values - {_fruit_count("old.fruit_id", "nutrient_value")},
+        n_rows = n_rows - {_fruit_count("old.fruit_id", "*")}
+    WHERE family_id = old.family_id;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+
+CREATE TRIGGER trg_fruit_family_upd AFTER UPDATE OF fruit_id, family_id ON fruityvice_nutrition
+BEGIN
+    UPDATE family_nutrient_totals
+    SET {_add("-" + _fruit_value("old.fruit_id"))},
+        n_values = n_values - {_fruit_count("old.fruit_id", "nutrient_value")},
+        n_rows = n_rows - {_fruit_count("old.fruit_id", "*")}
+    WHERE family_id = old.family_id;
+    INSERT INTO family_nutrient_totals(family_id, nutrient_id, sum_value, n_values, n_rows, sum_exact)
+    SELECT new.family_id, nutrient_id, COALESCE(nutrient_value, 0), nutrient_value IS NOT NULL, 1,
+           fsum_add('', nutrient_value)
+    FROM fruit_nutrient_long WHERE new.family_id IS NOT NULL AND fruit_id = new.fruit_id
+    ON CONFLICT(family_id, nutrient_id) DO UPDATE SET
+        {_add("excluded.sum_value")},
+        n_values = n_values + excluded.n_values,
+        n_rows = n_rows + excluded.n_rows;
+    DELETE FROM family_nutrient_totals WHERE n_rows <= 0;
+END;
+""" + REBUILD_EXACT_FAMILY_TOTALS
+
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "base pokemon and fruit tables", BASE_TABLES),
+    (2, "scraped_fruit_rows", SCRAPED_FRUIT_ROWS),
+    (3, "long-format nutrients", NUTRIENT_TABLES),
+    (4, "pokemondb web tables", WEB_TABLES),
+    (5, "D&D spells", DND_TABLES),
+    (6, "Jelly Belly beans", BEANS_TABLE),
+    (7, "materialized report aggregates", AGGREGATE_TABLES + POKEMON_TRIGGERS + FRUIT_TRIGGERS + REBUILD_AGGREGATES),
+    (8, "report indexes", REPORT_INDEXES),
+    (9, "bean group bridge", BEAN_GROUPS),
+    (10, "entity content hashes", CONTENT_HASHES),
+    (11, "PokeAPI / pokemondb mapping", POKEMON_XREF),
+    (12, "table change counters", TABLE_VERSIONS),
+    (13, "run metrics", RUN_METRICS),
+    (14, "exact family nutrient sums", EXACT_FAMILY_TOTALS),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def _add_partial(partials: List[float], x: float) -> None:
+    # Shewchuk's exact summation step, as in math.fsum: afterwards the
+    # partials add up (exactly) to their old sum plus x
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+def _parse(state: str) -> List[float]:
+    return [float.fromhex(p) for p in state.split()]
+
+
+def _dump(partials: List[float]) -> str:
+    return " ".join(p.hex() for p in partials if p)
+
+
+class ExactSum:
+    """SQL aggregate fsum(x): SUM() rounded once, at the end (math.fsum).
+
+    The result does not depend on the order the rows are visited in. NULLs
+    are skipped and no values at all gives NULL, like SUM().
+    """
+
+    def __init__(self):
+        self.partials = []
+        self.seen = False
+
+    def step(self, value):
+        if value is not None:
+            _add_partial(self.partials, float(value))
+            self.seen = True
+
+    def finalize(self):
+        return math.fsum(self.partials) if self.seen else None
+
+
+class ExactSumState(ExactSum):
+    """SQL aggregate fsum_state(x): the partials fsum_add() continues from."""
+
+    def finalize(self):
+        return _dump(self.partials)
+
+
+def fsum_add(state: str, value) -> str:
+    """SQL fsum_add(state, x): `state` with x added (x NULL: unchanged). A
+    state holds its sum exactly, so adding -x backs x out again."""
+    if value is None:
+        return state
+    partials = _parse(state)
+    _add_partial(partials, float(value))
+    return _dump(partials)
+
+
+def fsum_value(state: str) -> float:
+    """SQL fsum_value(state): the state's sum, correctly rounded."""
+    return math.fsum(_parse(state))
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """Define the fsum functions the fruit triggers and report queries call."""
+    conn.create_aggregate("fsum", 1, ExactSum)
+    conn.create_aggregate("fsum_state", 1, ExactSumState)
+    conn.create_function("fsum_add", 2, fsum_add, deterministic=True)
+    conn.create_function("fsum_value", 1, fsum_value, deterministic=True)
+
+
+def statements(script: str):
+    """Split a SQL script into complete statements (trigger bodies included)."""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf.strip()
+            buf = ""
+    if buf.strip() and not buf.strip().startswith("--"):
+        yield buf.strip()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending(conn: sqlite3.Connection, target: Optional[int] = None) -> List[Tuple[int, str, str]]:
+    version = current_version(conn)
+    target = LATEST if target is None else target
+    return [m for m in MIGRATIONS if version < m[0] <= target]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest) in one transaction.
+
+    Returns the versions applied; an up-to-date database returns [] after a
+    single PRAGMA read.
+    """
+    todo = pending(conn, target)
+    if not todo:
+        return []
+
+    register_functions(conn)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # re-check under the write lock in case another process just migrated
+        todo = pending(conn, target)
+        for version, _, script in todo:
+            for stmt in statements(script):
+                conn.execute(stmt)
+        if todo:
+            conn.execute(f"PRAGMA user_version = {todo[-1][0]}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return [m[0] for m in todo]
+
+
+def rebuild_aggregates(conn: sqlite3.Connection) -> None:
+    """Recompute every summary table from the fact tables in one transaction."""
+    register_functions(conn)
+    script = REBUILD_AGGREGATES
+    if current_version(conn) >= 14:
+        script += REBUILD_EXACT_FAMILY_TOTALS
+    with conn:
+        for stmt in statements(script):
+            conn.execute(stmt)
@@ -0,0 +1,365 @@
+"""Run every pipeline stage in dependency order, in parallel where it can.
+
+    migrate ─┬─ load-pokeapi ───────────────┬─ reconcile
+             ├─ load-web ───────────────────┤
+             │                              └─ reports ── viz
+             ├─ load-fruit ── backfill-nutrients ─┘
+             ├─ load-spells ── spells-report
+             └─ beans
+
+Each Stage is a pipeline.cli command, run as its own `python -m pipeline`
+subprocess. A stage declares the stages it needs and what it reads and
+writes. Those are tables, versioned by table_versions (migration 12), or
+files relative to the repository root. A stage starts once everything it
+needs has finished, so the five source loaders run side by side after
+migrate. A failed stage blocks the stages downstream of it, and the others
+carry on.
+
+Loaders read an upstream API, so they always run. In the default
+incremental mode each loads its next batch. Every other stage is skipped
+when it is up to date. That means its fingerprint matches the one stored
+in meta after its last successful run, and its output files still exist.
+The fingerprint covers:
+
+  - the versions of its input tables
+  - the content of its input files (make_viz reads calc_outputs' JSON)
+  - its arguments
+
+When a derived stage does run, it works incrementally: backfill above its
+watermark, reconcile only the changed pairs.
+
+    python -m pipeline run                  # next batches, then whatever they changed
+    python -m pipeline run --full           # drain every source, full rescans downstream
+    python -m pipeline run --refresh        # re-read every source, write only what changed
+    python -m pipeline run --since reports  # reports and everything downstream of it
+    python -m pipeline run --dry-run        # which stages are up to date right now
+
+The closing table gives each stage's start offset and wall time, and the
+critical path. The run itself is recorded in run_metrics as `run`, with one
+span per stage. Each stage also records its own run.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.metrics import observe, recorded
+from pipeline.paths import DB_PATH, ROOT
+
+DEFAULT_WORKERS = 5  # the five sources load side by side
+OUTPUT_TAIL = 20     # lines of a failed stage's output to show
+META_PREFIX = "stage."
+
+REPORT_FILES = tuple(f"jason/outputs/{name}" for name in (
+    "pokemon_avg_total_stats_by_type.json", "pokemon_weight_vs_total_stats.json",
+    "fruit_avg_nutrients_by_family.json", "fruit_top10_sugar.json", "web_primary_type_counts.csv",
+))
+POKEMON_TABLES = ("pokemon", "pokemon_type", "stat_dim", "pokemon_stat", "pokemon_total_stats", "type_stat_totals")
+FRUIT_TABLES = ("fruits", "fruityvice_nutrition", "fruit_family", "nutrient_dim", "fruit_nutrient_long",
+                "family_nutrient_totals")
+WEB_TABLES = ("web_pokemon", "web_pokemon_type", "web_type_dim")
+SPELL_TABLES = ("spells", "schools", "levels")
+
+
+@dataclass
+class Stage:
+    name: str                          # the pipeline.cli command
+    needs: Tuple[str, ...] = ()
+    reads: Tuple[str, ...] = ()        # tables, or files (anything with a "/")
+    writes: Tuple[str, ...] = ()
+    source: bool = False               # reads an upstream API: never up to date
+    full: Tuple[str, ...] = ()         # extra arguments under --full
+    refresh: Tuple[str, ...] = ()      # ... under --refresh
+    force: Tuple[str, ...] = ()        # ... under --force
+
+    def args(self, mode: Optional[str], force: bool) -> List[str]:
+        return list({"full": self.full, "refresh": self.refresh}.get(mode, ())) + list(self.force if force else ())
+
+
+STAGES: List[Stage] = [
+    Stage("migrate"),
+    Stage("load-pokeapi", ("migrate",), writes=POKEMON_TABLES, source=True,
+          full=("--full",), refresh=("--refresh",)),
+    Stage("load-fruit", ("migrate",), writes=FRUIT_TABLES, source=True, full=("--full",), refresh=("--refresh",)),
+    Stage("load-web", ("migrate",), writes=WEB_TABLES, source=True, full=("--full",), refresh=("--refresh",)),
+    Stage("load-spells", ("migrate",), writes=SPELL_TABLES, source=True, full=("--full",), refresh=("--refresh",)),
+    Stage("beans", ("migrate",), writes=("Beans", "bean_group", "bean_group_dim"), source=True,
+          full=("--full",), refresh=("--refresh",)),
+    Stage("backfill-nutrients", ("load-fruit",),
+          reads=("fruityvice_nutrition", "nutrient_dim"),
+          writes=("nutrient_dim", "fruit_nutrient_long", "family_nutrient_totals"), full=("--full",)),
+    Stage("reconcile", ("load-pokeapi", "load-web"),
+          reads=("pokemon", "pokemon_type") + WEB_TABLES,
+          writes=("pokemon_xref", "jason/outputs/pokemon_xref_diff.csv"), full=("--full",)),
+    Stage("reports", ("load-pokeapi", "load-web", "backfill-nutrients"),
+          reads=POKEMON_TABLES + FRUIT_TABLES + WEB_TABLES, writes=REPORT_FILES),
+    Stage("viz", ("reports",),
+          reads=REPORT_FILES[:2] + ("web_pokemon_type", "web_type_dim"),
+          writes=tuple(f"jason/viz/{name}.png" for name in (
+              "pokemon_avg_stats_by_type", "pokemon_weight_vs_total_stats", "web_primary_type_counts")),
+          force=("--force",)),
+    Stage("spells-report", ("load-spells",), reads=SPELL_TABLES,
+          writes=("corey/output/spell_summary.txt", "corey/output/spells_by_school_pie.png",
+                  "corey/output/spells_level_buckets_by_school.png"),
+          force=("--force",)),
+]
+
+
+def is_file(name: str) -> bool:
+    return "/" in name
+
+
+def ancestors(stages: Dict[str, Stage], name: str) -> set:
+    out, todo = set(), list(stages[name].needs)
+    while todo:
+        need = todo.pop()
+        if need not in out:
+            out.add(need)
+            todo.extend(stages[need].needs)
+    return out
+
+
+def check_dag(stages: List[Stage]) -> Dict[str, Stage]:
+    """{name: stage}, after making sure every stage reads only what its ancestors (or itself) write.
+
+    That rule is what lets a stage's fingerprint stand for its inputs: nothing
+    else can change them while it runs.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [n for n in s.needs if n not in by_name]
+        if missing:
+            raise ValueError(f"{s.name} needs unknown stages {missing}")
+    order = topological(stages)
+    for s in order:
+        upstream = ancestors(by_name, s.name) | {s.name}
+        for item in s.reads:
+            writers = [w.name for w in stages if item in w.writes and w.name not in upstream]
+            if writers:
+                raise ValueError(f"{s.name} reads {item}, which {writers} write without being upstream of it")
+    return by_name
+
+
+def topological(stages: List[Stage]) -> List[Stage]:
+    done, order = set(), []
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if set(s.needs) <= done]
+        if not ready:
+            raise ValueError(f"dependency cycle among {[s.name for s in pending]}")
+        for s in ready:
+            order.append(s)
+            done.add(s.name)
+            pending.remove(s)
+    return order
+
+
+def downstream(by_name: Dict[str, Stage], roots: List[str]) -> set:
+    return {name for name in by_name if name in roots or ancestors(by_name, name) & set(roots)}
+
+
+def fingerprint(conn, stage: Stage, args: List[str]) -> str:
+    versions = dict(conn.execute("SELECT table_name, version FROM table_versions"))
+    generation = conn.execute("SELECT value FROM meta WHERE key = 'data_generation'").fetchone()
+    h = hashlib.sha256(json.dumps([generation[0] if generation else None, args,
+                                   {t: versions.get(t) for t in stage.reads if not is_file(t)}]).encode())
+    for name in stage.reads:
+        if is_file(name):
+            path = ROOT / name
+            h.update(name.encode())
+            h.update(hashlib.sha256(path.read_bytes()).digest() if path.exists() else b"missing")
+    return h.hexdigest()
+
+
+def stored(conn, stage: Stage) -> Optional[dict]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (META_PREFIX + stage.name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def up_to_date(conn, stage: Stage, args: List[str]) -> bool:
+    if stage.source:
+        return False
+    last = stored(conn, stage)
+    return (last is not None and last["fingerprint"] == fingerprint(conn, stage, args)
+            and all((ROOT / name).exists() for name in stage.writes if is_file(name)))
+
+
+class Runner:
+    def __init__(self, db: Path, mode: Optional[str], force: bool):
+        self.db = db
+        self.mode = mode
+        self.force = force
+
+    def connect(self):
+        from pipeline.db import connect
+        # loaders may be writing alongside; wait for them rather than fail
+        return connect(self.db, timeout=60)
+
+    def run(self, stage: Stage, started: float) -> dict:
+        """Run one stage, unless it is up to date; returns its result row."""
+        args = stage.args(self.mode, self.force)
+        start = time.perf_counter()
+        if stage.name != "migrate" and not stage.source and not self.force:
+            conn = self.connect()
+            try:
+                skip = up_to_date(conn, stage, args)
+            finally:
+                conn.close()
+            if skip:
+                return {"stage": stage.name, "status": "up to date", "start": start - started,
+                        "wall": time.perf_counter() - start, "end": time.perf_counter() - started, "summary": ""}
+
+        proc = subprocess.run([sys.executable, "-m", "pipeline", stage.name, *args], cwd=ROOT,
+                              capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        lines = proc.stdout.strip().splitlines()
+        result = {"stage": stage.name, "status": "ok" if proc.returncode == 0 else "failed",
+                  "start": start - started, "wall": wall, "end": time.perf_counter() - started,
+                  "summary": lines[-1] if lines else ""}
+        if proc.returncode != 0:
+            result["output"] = (proc.stdout + proc.stderr).strip().splitlines()[-OUTPUT_TAIL:]
+            return result
+
+        observe(f"stage.{stage.name}", wall)
+        if stage.name != "migrate":
+            conn = self.connect()
+            try:
+                # taken after the run: only this stage and its ancestors write
+                # its inputs, so this is what the next run will compare against
+                record = {"fingerprint": fingerprint(conn, stage, args), "wall_s": round(wall, 3),
+                          "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                                 (META_PREFIX + stage.name, json.dumps(record)))
+            finally:
+                conn.close()
+        return result
+
+
+def execute(by_name: Dict[str, Stage], selected: set, runner: Runner, workers: int) -> List[dict]:
+    """Run the selected stages as their needs finish; returns one result per stage, in finishing order."""
+    started = time.perf_counter()
+    results: Dict[str, dict] = {}
+    # stages outside the selection count as done
+    done = {name for name in by_name if name not in selected}
+    waiting = [by_name[name] for name in by_name if name in selected]
+    finished = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        running = {}
+        while waiting or running:
+            for stage in list(waiting):
+                failed = [n for n in stage.needs if results.get(n, {}).get("status") in ("failed", "blocked")]
+                if failed:
+                    waiting.remove(stage)
+                    results[stage.name] = {"stage": stage.name, "status": "blocked", "start": None, "wall": 0.0,
+                                           "end": None, "summary": f"needs {', '.join(failed)}"}
+                    finished.append(results[stage.name])
+                elif set(stage.needs) <= done:
+                    waiting.remove(stage)
+                    running[pool.submit(runner.run, stage, started)] = stage
+            if not running:
+                continue
+            complete, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in complete:
+                stage = running.pop(future)
+                result = future.result()
+                results[stage.name] = result
+                finished.append(result)
+                if result["status"] in ("ok", "up to date"):
+                    done.add(stage.name)
+                if result["status"] == "failed":
+                    print(f"[{stage.name}] failed:", file=sys.stderr)
+                    for line in result["output"]:
+                        print(f"  {line}", file=sys.stderr)
+    return finished
+
+
+def critical_path(by_name: Dict[str, Stage], results: List[dict]) -> List[str]:
+    """The chain of stages, each waiting on the last of its needs to finish, that ended the run."""
+    ends = {r["stage"]: r["end"] for r in results if r["end"] is not None}
+    if not ends:
+        return []
+    path = [max(ends, key=ends.get)]
+    while True:
+        needs = [n for n in by_name[path[-1]].needs if n in ends]
+        if not needs:
+            return path[::-1]
+        path.append(max(needs, key=ends.get))
+
+
+def report(by_name: Dict[str, Stage], results: List[dict], total: float) -> None:
+    width = max(map(len, by_name))
+    print(f"\n{'stage':<{width}}  {'status':<10} {'start':>8} {'wall':>8}")
+    for r in sorted(results, key=lambda r: (r["start"] is None, r["start"] or 0)):
+        start = "" if r["start"] is None else f"{r['start']:.2f}s"
+        print(f"{r['stage']:<{width}}  {r['status']:<10} {start:>8} {r['wall']:>7.2f}s  {r['summary'][:70]}")
+    busy = sum(r["wall"] for r in results)
+    path = critical_path(by_name, results)
+    print(f"\n{total:.2f}s wall; stages add up to {busy:.2f}s"
+          + (f" ({busy / total:.1f}x from running in parallel)" if busy > total > 0 else ""))
+    if path:
+        print(f"critical path: {' -> '.join(path)}")
+
+
+def dry_run(by_name: Dict[str, Stage], selected: set, runner: Runner) -> None:
+    from pipeline.db import connect_readonly
+    # read-only: a dry run neither migrates nor counts as a run in run_metrics
+    conn = connect_readonly(runner.db) if runner.db.exists() else None
+    try:
+        for stage in topological(list(by_name.values())):
+            if stage.name not in selected:
+                continue
+            args = stage.args(runner.mode, runner.force)
+            if stage.source:
+                state = "runs (upstream source)"
+            elif stage.name == "migrate" or conn is None or runner.force:
+                state = "runs"
+            else:
+                try:
+                    current = up_to_date(conn, stage, args)
+                except sqlite3.OperationalError:  # not migrated yet
+                    current = False
+                state = "up to date, unless upstream changes it" if current else "runs"
+            needs = f"after {', '.join(stage.needs)}" if stage.needs else ""
+            print(f"{stage.name:<20} {state:<40} {needs}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@recorded("run")
+def main(argv=None):
+    by_name = check_dag(STAGES)
+    parser = argparse.ArgumentParser(description="Run the pipeline stages in dependency order.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--full", action="store_true", help="drain every source; derived stages rescan everything")
+    mode.add_argument("--refresh", action="store_true", help="re-read every source, rewriting only what changed")
+    parser.add_argument("--since", nargs="+", choices=list(by_name), metavar="STAGE",
+                        help="run only these stages and the ones downstream of them")
+    parser.add_argument("--force", action="store_true", help="run stages even if they are up to date")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="stages run at once")
+    parser.add_argument("--dry-run", action="store_true", help="show what would run and exit")
+    args = parser.parse_args(argv)
+
+    runner = Runner(DB_PATH, "full" if args.full else "refresh" if args.refresh else None, args.force)
+    selected = downstream(by_name, args.since) if args.since else set(by_name)
+    if args.dry_run:
+        return dry_run(by_name, selected, runner)
+
+    start = time.perf_counter()
+    results = execute(by_name, selected, runner, args.workers)
+    report(by_name, results, time.perf_counter() - start)
+    if any(r["status"] in ("failed", "blocked") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / "GamerSoups_final_project.sqlite"
+JASON_SCRIPTS = ROOT / "jason" / "scripts"
+COREY_CODE = ROOT / "corey" / "code"
+BEANS_DIR = ROOT / "LooLu Wiltse SI 201 Final Project Submission"
+
+
+def add_script_paths() -> None:
+    """Make the per-person script folders importable (they import siblings by bare name)."""
+    for d in (JASON_SCRIPTS, COREY_CODE, BEANS_DIR):
+        if str(d) not in sys.path:
+            sys.path.insert(0, str(d))
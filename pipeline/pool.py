@@ -0,0 +1,144 @@
+"""Thread-safe connections to the project database: one writer, N readers.
+
+SQLite allows one writer at a time. In WAL mode any number of readers can
+run alongside it, each seeing the last committed snapshot. ConnectionPool
+maps that onto connections:
+
+  writer()  the single read-write connection (pipeline.db.connect, so it
+            migrates and applies PRAGMAS), held under a lock. Threads queue
+            on the lock instead of on SQLite's busy handler, so they never
+            see "database is locked". The block commits when it exits
+            cleanly and rolls back when it raises.
+  reader()  lends a `mode=ro` connection (pipeline.db.connect_readonly).
+            Up to `readers` are opened lazily and reused. Once all are lent
+            out, the next caller waits for one to come back.
+
+    pool = ConnectionPool(DB_PATH, readers=4)
+    with pool.writer() as conn:
+        conn.execute("INSERT ...")
+    with pool.reader() as conn:
+        rows = conn.execute("SELECT ...").fetchall()
+
+shared_pool() keeps one pool per database per process, so code that only
+needs "the database" reuses connections instead of opening its own.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from pipeline.db import STATEMENT_CACHE, connect, connect_readonly
+from pipeline.migrations import LATEST
+from pipeline.paths import DB_PATH
+
+DEFAULT_READERS = min(8, os.cpu_count() or 1)
+
+
+class PoolClosed(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, path: Path = DB_PATH, readers: int = DEFAULT_READERS,
+                 migrate_to: Optional[int] = LATEST, cached_statements: int = STATEMENT_CACHE,
+                 timeout: float = 30.0):
+        if readers < 1:
+            raise ValueError("a pool needs at least one reader")
+        self.path = Path(path)
+        self.size = readers
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        # the writer is opened first: it creates the file, migrates it and
+        # switches it to WAL, which the read-only connections rely on
+        self._writer = connect(self.path, migrate_to, check_same_thread=False,
+                               cached_statements=cached_statements, timeout=timeout)
+        self._write_lock = threading.Lock()
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.reader_waits = 0
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """The write connection, held exclusively; commits on exit, rolls back on error.
+
+        Not re-entrant: a thread already inside writer() must keep using the
+        connection it has.
+        """
+        with self._write_lock:
+            if self._closed:
+                raise PoolClosed(self.path)
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.rollback()
+                raise
+            self._writer.commit()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """A read-only connection for the length of the block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolClosed(self.path)
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = connect_readonly(self.path, check_same_thread=False,
+                                        cached_statements=self.cached_statements, timeout=self.timeout)
+                self._all.append(conn)
+                return conn
+            self.reader_waits += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no reader free after {self.timeout}s ({self.size} in use)") from None
+
+    def close(self) -> None:
+        """Close every connection. Readers still lent out are closed too."""
+        with self._write_lock, self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._writer.close()
+            for conn in self._all:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_shared: Dict[Tuple[int, Path], ConnectionPool] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pool(path: Path = DB_PATH, readers: int = DEFAULT_READERS) -> ConnectionPool:
+    """This process's pool for `path`, opened on first use.
+
+    Keyed by pid as well, so a forked worker opens its own connections
+    rather than using its parent's.
+    """
+    key = (os.getpid(), Path(path).resolve())
+    with _shared_lock:
+        pool = _shared.get(key)
+        if pool is None or pool._closed:
+            pool = _shared[key] = ConnectionPool(path, readers)
+        return pool
@@ -0,0 +1,55 @@
+"""Progress lines for long loader runs (the --full modes).
+
+    progress = Progress("pokeapi", total=len(ids))
+    for ... :
+        progress.update()
+    progress.finish()
+
+prints at most one line every `every` seconds to stderr:
+
+    pokeapi: 1,200/1,302 (92%) 48.3/s ETA 0:00:02
+
+The rate is over the whole run so far. The ETA is only shown when the total
+is known.
+"""
+import sys
+import time
+from datetime import timedelta
+from typing import Optional, TextIO
+
+
+class Progress:
+    def __init__(self, label: str, total: Optional[int] = None, every: float = 2.0,
+                 stream: Optional[TextIO] = None):
+        self.label = label
+        self.total = total
+        self.every = every
+        self.stream = stream if stream is not None else sys.stderr
+        self.count = 0
+        self.started = time.perf_counter()
+        self._last = self.started
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def line(self) -> str:
+        rate = self.rate
+        if self.total is None:
+            return f"{self.label}: {self.count:,} {rate:.1f}/s"
+        pct = self.count / self.total * 100 if self.total else 100.0
+        left = max(self.total - self.count, 0)
+        eta = str(timedelta(seconds=round(left / rate))) if rate > 0 else "?" if left else "0:00:00"
+        return f"{self.label}: {self.count:,}/{self.total:,} ({pct:.0f}%) {rate:.1f}/s ETA {eta}"
+
+    def update(self, n: int = 1) -> None:
+        self.count += n
+        now = time.perf_counter()
+        if now - self._last >= self.every:
+            self._last = now
+            print(self.line(), file=self.stream, flush=True)
+
+    def finish(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        print(f"{self.line()} in {timedelta(seconds=round(elapsed))}", file=self.stream, flush=True)
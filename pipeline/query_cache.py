@@ -0,0 +1,278 @@
+"""Persisted results for the report and chart queries, reused while their tables are unchanged.
+
+Migration 12 gives every data table a change counter in table_versions. The
+counter is bumped by triggers in the same transaction as the write, so a
+loader's commit is also its invalidation. rows(conn, sql, params) works like
+this:
+
+  - read the counters (one small table)
+  - look the query up by sha256 of the database file, the query text and
+    its parameters
+  - return the stored rows if every table the query read still has the
+    version it had when the rows were computed, and the database is the
+    same generation (meta.data_generation)
+  - otherwise run the query and store the result with the versions of the
+    tables it read, taken from its EXPLAIN (views and subqueries included)
+
+The counters are read before the query runs. A commit that lands in
+between therefore makes the stored entry look older than it is, never
+newer. Results live in their own SQLite file, like the HTTP cache, so
+read-only connections can use it and every process shares it. The
+database's resolved path is part of the key because a copied file keeps
+its data_generation: once two copies diverge their counters can meet
+again with different rows behind them. Queries against in-memory or
+unmigrated databases (no table_versions), or that read a table without a
+counter, just run.
+
+iter_rows() is the streaming form the report writers use: a result of more
+than MAX_ROWS rows is not stored, and past that point it is read from the
+cursor in batches, so a large report never sits in memory whole.
+
+    python -m pipeline.query_cache            # entries, hit rate per query
+    python -m pipeline.query_cache --clear
+    python -m pipeline.query_cache --invalidate spells schools
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pipeline.metrics import count, span
+from pipeline.paths import ROOT
+
+CACHE_PATH = Path(os.environ.get("QUERY_CACHE_PATH", ROOT / ".query_cache.sqlite"))
+ENABLED = os.environ.get("QUERY_CACHE", "1") not in ("0", "off")
+MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 1000))
+MAX_ROWS = int(os.environ.get("QUERY_CACHE_MAX_ROWS", 10000))  # larger results are streamed, not stored
+STREAM_BATCH = 1000
+
+OPEN_OPS = ("OpenRead", "ReopenIdx")
+
+
+def table_versions(conn: sqlite3.Connection) -> Optional[Tuple[str, Dict[str, int]]]:
+    """(data_generation, {table: version}), or None if the database has no counters."""
+    try:
+        versions = dict(conn.execute("SELECT table_name, version FROM table_versions"))
+        generation = conn.execute("SELECT value FROM meta WHERE key = 'data_generation'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return (generation[0] if generation else ""), versions
+
+
+def database_file(conn: sqlite3.Connection) -> str:
+    """Resolved path of the connection's main database ('' when in memory)."""
+    for _, name, file in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return str(Path(file).resolve()) if file else ""
+    return ""
+
+
+def stream(cursor: sqlite3.Cursor, size: int = STREAM_BATCH) -> Iterator[tuple]:
+    while True:
+        with span("db.query"):
+            batch = cursor.fetchmany(size)
+        if not batch:
+            return
+        yield from batch
+
+
+def tables_read(conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> set:
+    """Every main-database table `sql` opens for reading, found through its indexes too."""
+    roots = dict(conn.execute("SELECT rootpage, tbl_name FROM sqlite_master WHERE rootpage > 0"))
+    return {roots[p2] for _, op, _, p2, p3, *_ in conn.execute("EXPLAIN " + sql, params)
+            if op in OPEN_OPS and p3 == 0 and p2 in roots}
+
+
+class QueryCache:
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = MAX_ENTRIES, enabled: bool = ENABLED,
+                 max_rows: int = MAX_ROWS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        # opened on first use (under self._lock), so a disabled cache never creates its file
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.execute("PRAGMA synchronous=NORMAL;")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    generation TEXT NOT NULL,
+                    versions TEXT NOT NULL,
+                    rows TEXT NOT NULL,
+                    n_rows INTEGER NOT NULL,
+                    compute_s REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    last_used REAL NOT NULL
+                );
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used);")
+            self._conn.commit()
+        return self._conn
+
+    def rows(self, conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> List[tuple]:
+        """conn.execute(sql, params).fetchall(), from the cache when still valid."""
+        return list(self.iter_rows(conn, sql, params))
+
+    def iter_rows(self, conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> Iterator[tuple]:
+        """The rows of rows(), streamed from the cursor once they exceed max_rows."""
+        state = table_versions(conn) if self.enabled else None
+        database = database_file(conn) if state is not None else ""
+        if not database:
+            self.bypassed += 1
+            yield from stream(conn.execute(sql, params))
+            return
+        generation, current = state
+        params = list(params)
+        key = hashlib.sha256(json.dumps([database, sql, params]).encode("utf-8")).hexdigest()
+
+        with self._lock:
+            row = self._db().execute("SELECT generation, versions, rows FROM results WHERE key = ?",
+                                     (key,)).fetchone()
+        if row is not None and row[0] == generation and all(
+                current.get(t) == v for t, v in json.loads(row[1]).items()):
+            self.hits += 1
+            count("query_cache.hits")
+            with self._lock:
+                self._db().execute("UPDATE results SET hits = hits + 1, last_used = ? WHERE key = ?",
+                                   (time.time(), key))
+                self._db().commit()
+            yield from (tuple(r) for r in json.loads(row[2]))
+            return
+
+        self.misses += 1
+        count("query_cache.misses")
+        start = time.perf_counter()
+        with span("db.query"):
+            cursor = conn.execute(sql, params)
+            result = cursor.fetchmany(self.max_rows + 1)
+        if len(result) > self.max_rows:
+            count("query_cache.too_large")
+            yield from result
+            yield from stream(cursor)
+            return
+        elapsed = time.perf_counter() - start
+        read = tables_read(conn, sql, params)
+        if read <= current.keys():  # else it reads something without a counter: cannot tell when it goes stale
+            try:
+                payload = json.dumps(result)
+            except TypeError:
+                payload = None  # BLOBs and the like are not worth caching
+            if payload is not None:
+                self._store(key, sql, params, generation, {t: current[t] for t in sorted(read)}, payload,
+                            len(result), elapsed)
+        yield from result
+
+    def _store(self, key, sql, params, generation, versions, payload, n_rows, elapsed) -> None:
+        with self._lock:
+            self._db().execute("""
+                INSERT INTO results(key, sql, params, generation, versions, rows, n_rows, compute_s,
+                                    misses, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    generation = excluded.generation, versions = excluded.versions, rows = excluded.rows,
+                    n_rows = excluded.n_rows, compute_s = excluded.compute_s,
+                    misses = misses + 1, last_used = excluded.last_used
+            """, (key, sql, json.dumps(params), generation, json.dumps(versions), payload, n_rows, elapsed,
+                  time.time()))
+            self._db().execute("""
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._db().commit()
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None) -> int:
+        """Drop the entries that read any of `tables` (every entry when None); returns how many."""
+        with self._lock:
+            if tables is None:
+                n = self._db().execute("DELETE FROM results").rowcount
+            else:
+                n = self._db().execute("""
+                    DELETE FROM results WHERE EXISTS (
+                        SELECT 1 FROM json_each(results.versions) j
+                        WHERE j.key IN (SELECT value FROM json_each(?))
+                    )
+                """, (json.dumps(list(tables)),)).rowcount
+            self._db().commit()
+        return n
+
+    def stats(self) -> dict:
+        """This process's counters plus, per stored query, its lifetime hits and misses."""
+        with self._lock:
+            entries = self._db().execute("""
+                SELECT sql, params, n_rows, compute_s, hits, misses, length(rows)
+                FROM results ORDER BY hits + misses DESC
+            """).fetchall()
+        return {
+            "hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+            "entries": [{"sql": " ".join(sql.split()), "params": json.loads(params), "rows": n, "compute_s": s,
+                         "hits": h, "misses": m, "bytes": size} for sql, params, n, s, h, m, size in entries],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_shared: Optional[QueryCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_query_cache() -> QueryCache:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = QueryCache()
+        return _shared
+
+
+def cached_rows(conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> List[tuple]:
+    return shared_query_cache().rows(conn, sql, params)
+
+
+def cached_iter(conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> Iterator[tuple]:
+    return shared_query_cache().iter_rows(conn, sql, params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or clear the report query cache.")
+    parser.add_argument("--clear", action="store_true", help="drop every entry")
+    parser.add_argument("--invalidate", nargs="+", metavar="TABLE", help="drop the entries that read these tables")
+    args = parser.parse_args(argv)
+
+    cache = shared_query_cache()
+    if args.clear or args.invalidate:
+        n = cache.invalidate(None if args.clear else args.invalidate)
+        print(f"Dropped {n} cached results.")
+        return
+    entries = cache.stats()["entries"]
+    hits, misses = sum(e["hits"] for e in entries), sum(e["misses"] for e in entries)
+    for e in entries:
+        rate = e["hits"] / ((e["hits"] + e["misses"]) or 1)
+        print(f"{e['hits']:>6} hits {e['misses']:>4} misses {rate:>5.0%}  {e['rows']:>6} rows "
+              f"{e['compute_s'] * 1000:>8.1f}ms  {e['sql'][:70]}")
+    print(f"{len(entries)} entries, {hits} hits / {misses} misses "
+          f"({hits / ((hits + misses) or 1):.0%} hit rate)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Headless chart rendering shared by make_viz.py, analyze_and_visualize_dnd.py
+and the beans script.
+
+Each chart is a Chart: an output path, a module-level draw(fig, data)
+function, and the plain data it plots (queried up front by the caller).
+render_all() draws every chart on its own matplotlib Figure (Agg canvas, no
+pyplot state) across a process pool. It skips charts whose data, draw code
+and options hash to the same value as the last render, provided the PNG
+still exists. A chart's `theme` (e.g. a seaborn style) is hashed by name and
+arguments and only called inside render(), so a run where every chart is
+unchanged never imports the plotting libraries.
+
+    python -m pipeline.render [--workers N] [--force]
+"""
+import argparse
+import hashlib
+import json
+import marshal
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pipeline.metrics import count, observe, recorded
+from pipeline.paths import ROOT, add_script_paths
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST = Path(os.environ.get("RENDER_MANIFEST", ROOT / ".render_cache.json"))
+
+
+@dataclass
+class Chart:
+    out_path: Path
+    draw: Callable[[Any, Any], None]
+    data: Any
+    figsize: Tuple[float, float] = (6.4, 4.8)
+    dpi: int = 200
+    rc: Dict[str, Any] = field(default_factory=dict)
+    theme: Optional[Callable[..., Dict[str, Any]]] = None  # theme(*theme_args) -> rc defaults
+    theme_args: Tuple = ()
+
+    def key(self) -> str:
+        try:
+            return str(Path(self.out_path).resolve().relative_to(ROOT))
+        except ValueError:
+            return str(Path(self.out_path).resolve())
+
+    def digest(self) -> str:
+        h = hashlib.sha256()
+        h.update(f"{self.draw.__module__}.{self.draw.__qualname__}".encode())
+        h.update(marshal.dumps(self.draw.__code__))
+        if self.theme is not None:
+            h.update(f"{self.theme.__module__}.{self.theme.__qualname__}".encode())
+            h.update(marshal.dumps(self.theme.__code__))
+        h.update(json.dumps([self.data, list(self.figsize), self.dpi, self.rc, list(self.theme_args)],
+                            sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+
+def render(chart: Chart) -> Tuple[str, float]:
+    """Draw one chart on a fresh Figure and save it; returns (key, seconds)."""
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    start = time.perf_counter()
+    rc = {**chart.theme(*chart.theme_args), **chart.rc} if chart.theme is not None else chart.rc
+    with matplotlib.rc_context(rc):
+        fig = Figure(figsize=chart.figsize)
+        chart.draw(fig, chart.data)
+        Path(chart.out_path).parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(chart.out_path, dpi=chart.dpi)
+    return chart.key(), time.perf_counter() - start
+
+
+def load_manifest(path: Path = MANIFEST) -> Dict[str, str]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def _locked(path: Path):
+    """Hold an exclusive lock on `path`.lock; other runs saving wait for it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def save_manifest(new: Dict[str, str], path: Path = MANIFEST) -> None:
+    """Merge `new` into the manifest on disk.
+
+    make_viz.py and the other scripts share one manifest and may render at the
+    same time, so the file is re-read under a lock just before writing, and
+    written to a temp file that replaces it whole.
+    """
+    with _locked(path):
+        hashes = load_manifest(path)
+        hashes.update(new)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(hashes, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def render_all(charts: List[Chart], workers: Optional[int] = None, force: bool = False,
+               manifest: Path = MANIFEST) -> dict:
+    """Render every stale chart, in parallel when more than one is stale.
+
+    Returns {"rendered": {key: seconds}, "skipped": [keys], "seconds": wall}.
+    """
+    start = time.perf_counter()
+    hashes = load_manifest(manifest)
+    todo, skipped = [], []
+    for chart in charts:
+        digest = chart.digest()
+        if not force and hashes.get(chart.key()) == digest and Path(chart.out_path).exists():
+            skipped.append(chart.key())
+        else:
+            todo.append((chart, digest))
+
+    rendered = {}
+    workers = min(len(todo), workers or os.cpu_count() or 1)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=add_script_paths) as pool:
+            for key, seconds in pool.map(render, [c for c, _ in todo]):
+                rendered[key] = seconds
+    else:
+        for chart, _ in todo:
+            key, seconds = render(chart)
+            rendered[key] = seconds
+
+    # charts may have been drawn in worker processes, so their times are
+    # recorded here rather than with a span inside render()
+    for seconds in rendered.values():
+        observe("render", seconds)
+    count("render.skipped", len(skipped))
+
+    if todo:
+        save_manifest({chart.key(): digest for chart, digest in todo}, manifest)
+
+    return {"rendered": rendered, "skipped": skipped, "seconds": time.perf_counter() - start}
+
+
+def report(result: dict) -> None:
+    for key, seconds in result["rendered"].items():
+        print(f"Saved {key} ({seconds:.2f}s)")
+    for key in result["skipped"]:
+        print(f"Unchanged {key}")
+    print(f"{len(result['rendered'])} rendered, {len(result['skipped'])} unchanged "
+          f"in {result['seconds']:.2f}s wall")
+
+
+def all_charts() -> List[Chart]:
+    add_script_paths()
+    import SI201FinalProjectAttempt as beans
+    import analyze_and_visualize_dnd as dnd
+    import make_viz
+    from pipeline.pool import shared_pool
+
+    with shared_pool().reader() as conn:
+        return make_viz.charts(conn) + dnd.charts(conn) + beans.charts(conn)
+
+
+@recorded("render")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every project chart.")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render even if the data is unchanged")
+    args = parser.parse_args(argv)
+    report(render_all(all_charts(), args.workers, args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Streaming writers for report rows.
+
+Each writer takes an iterable of row dicts (typically a generator over a
+cursor) and writes it out one row at a time, so memory stays flat however
+large the table is. write_json_array produces byte-for-byte what
+json.dumps(list(rows), indent=2) would.
+
+Parquet and Arrow IPC need pyarrow, which is optional. It is imported only
+when one of those formats is asked for.
+"""
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+# (field name, "str" | "int" | "float"); the type is only used for the binary formats
+Fields = Sequence[Tuple[str, str]]
+
+FORMATS = ("json", "ndjson", "csv", "parquet", "arrow")
+SUFFIX = {"json": ".json", "ndjson": ".ndjson", "csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+ARROW_BATCH = 10_000
+
+
+_dumps = json.JSONEncoder().encode
+
+
+def _array_item(row: dict) -> str:
+    """row as json.dumps(indent=2) lays it out one level inside an array."""
+    if not row or any(not isinstance(k, str) or isinstance(v, (dict, list, tuple)) for k, v in row.items()):
+        return json.dumps(row, indent=2).replace("\n", "\n  ")
+    # flat rows (all of ours) go through the C encoder; indent= forces the pure-Python one
+    return "{\n" + ",\n".join(f"    {_dumps(k)}: {_dumps(v)}" for k, v in row.items()) + "\n  }"
+
+
+def write_json_array(path: Path, rows: Iterable[dict]) -> int:
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write("[\n  " if n == 0 else ",\n  ")
+            f.write(_array_item(row))
+            n += 1
+        f.write("\n]" if n else "[]")
+    return n
+
+
+def write_ndjson(path: Path, rows: Iterable[dict]) -> int:
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row))
+            f.write("\n")
+            n += 1
+    return n
+
+
+def write_csv(path: Path, rows: Iterable[dict], fields: Fields) -> int:
+    names = [name for name, _ in fields]
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(names)
+        for row in rows:
+            w.writerow([row[name] for name in names])
+            n += 1
+    return n
+
+
+def _arrow_schema(fields: Fields):
+    import pyarrow as pa
+
+    types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64()}
+    return pa.schema([(name, types[kind]) for name, kind in fields])
+
+
+def _batches(rows: Iterable[dict], schema) -> Iterable:
+    import pyarrow as pa
+
+    rows = iter(rows)
+    while True:
+        chunk: List[dict] = list(islice(rows, ARROW_BATCH))
+        if not chunk:
+            return
+        yield pa.RecordBatch.from_pylist(chunk, schema=schema)
+
+
+def write_parquet(path: Path, rows: Iterable[dict], fields: Fields) -> int:
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(fields)
+    n = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _batches(rows, schema):
+            writer.write_batch(batch)
+            n += batch.num_rows
+    return n
+
+
+def write_arrow(path: Path, rows: Iterable[dict], fields: Fields) -> int:
+    import pyarrow as pa
+
+    schema = _arrow_schema(fields)
+    n = 0
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in _batches(rows, schema):
+            writer.write_batch(batch)
+            n += batch.num_rows
+    return n
+
+
+def check_format(fmt: str) -> None:
+    """Fail early, before any query runs, if fmt needs pyarrow and it is missing."""
+    if fmt in ("parquet", "arrow"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit(f"--format {fmt} needs pyarrow (pip install pyarrow)")
+
+
+def write(path: Path, rows: Iterable[dict], fields: Fields, fmt: str = "json") -> Tuple[Path, int]:
+    """Write rows to path with fmt's suffix; returns (path written, row count)."""
+    path = Path(path).with_suffix(SUFFIX[fmt])
+    if fmt == "json":
+        return path, write_json_array(path, rows)
+    if fmt == "ndjson":
+        return path, write_ndjson(path, rows)
+    if fmt == "csv":
+        return path, write_csv(path, rows, fields)
+    if fmt == "parquet":
+        return path, write_parquet(path, rows, fields)
+    if fmt == "arrow":
+        return path, write_arrow(path, rows, fields)
+    raise ValueError(f"unknown format {fmt!r}")